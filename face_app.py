@@ -1,6 +1,5 @@
 from flask import Flask, Response, jsonify, render_template_string, request, redirect, url_for
 from werkzeug.utils import secure_filename
-from ultralytics import YOLO
 import cv2
 import pyttsx3
 import threading
@@ -13,11 +12,18 @@ import base64
 import queue
 import time
 from face_detection import FacePartDetector
+from medical_models import models
+from medical_tracing import tracer
+from medical_speech import PersistentEngine, SpeechQueue
+from medical_admin import register as register_admin
+from medical_startup import LazyResources, guard, serve
 
 # Inicializa o Flask
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# /admin/trace/* (os spans da voz e das requisições) e /metrics; sem loop de frames para perfilar
+register_admin(app, profile=False)
 
 # Cria pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -39,9 +45,14 @@ def cleanup():
 atexit.register(cleanup)
 
 # Carrega o modelo YOLOv8 (apenas objetos básicos)
-print("📊 Carregando modelo YOLOv8...")
-model = YOLO('yolov8n.pt')
-print("✅ Modelo carregado com sucesso!")
+YOLO_WEIGHTS = 'yolov8n.pt'
+
+def carregar_modelo():
+    """Carrega o YOLOv8 (instância única do processo, compartilhada pelas requisições)"""
+    print("📊 Carregando modelo YOLOv8...")
+    # Cascades vão para o pool: a thread de /video usa estas instâncias
+    models.preload(cascades=('frontalface', 'eye', 'smile'), yolo=(YOLO_WEIGHTS,))
+    print("✅ Modelo carregado com sucesso!")
 
 # Dicionário de tradução para português (básico)
 traducao_objetos = {
@@ -59,6 +70,10 @@ def traduzir_objeto(nome_ingles):
     """Traduz o nome do objeto para português"""
     return traducao_objetos.get(nome_ingles.lower(), nome_ingles)
 
+# Webcam (aberta por init_webcam na inicialização dos recursos)
+cap = None
+webcam_available = False
+
 # Função para inicializar webcam
 def init_webcam():
     global cap, webcam_available
@@ -101,115 +116,123 @@ def init_webcam():
     
     return webcam_available
 
-# Inicializa a webcam
-init_webcam()
-
 # Inicializa o detector de partes do rosto
 face_detector = FacePartDetector()
 print("👁️ Detector de partes do rosto inicializado!")
 
 # Configura o motor de fala (text-to-speech)
-engine = None
-fala_queue = queue.Queue()
+tts = None
+fala_queue = SpeechQueue()
 fala_thread = None
 fala_ativa = False
 
-def inicializar_tts():
-    global engine
-    try:
-        engine = pyttsx3.init()
-        voices = engine.getProperty('voices')
-        
-        # Procura por voz em português
-        voz_portugues = None
+def criar_engine_tts():
+    """Cria e configura um engine pyttsx3 (chamado na thread de voz)"""
+    engine = pyttsx3.init()
+    voices = engine.getProperty('voices')
+    
+    # Procura por voz em português
+    voz_portugues = None
+    if voices:
+        for voice in voices:
+            voice_name = voice.name.lower()
+            voice_id = voice.id.lower()
+            # Procura por indicadores de português brasileiro
+            if any(indicator in voice_name for indicator in ['portuguese', 'brazil', 'brasil', 'pt-br', 'pt_br']):
+                voz_portugues = voice.id
+                print(f"🇧🇷 Voz em português encontrada: {voice.name}")
+                break
+            elif any(indicator in voice_id for indicator in ['portuguese', 'brazil', 'brasil', 'pt-br', 'pt_br']):
+                voz_portugues = voice.id
+                print(f"🇧🇷 Voz em português encontrada: {voice.name}")
+                break
+    
+    # Se encontrou voz em português, usa ela
+    if voz_portugues:
+        engine.setProperty('voice', voz_portugues)
+    else:
+        print("⚠️ Voz em português não encontrada, usando voz padrão")
+        # Usa a primeira voz disponível
         if voices:
-            for voice in voices:
-                voice_name = voice.name.lower()
-                voice_id = voice.id.lower()
-                # Procura por indicadores de português brasileiro
-                if any(indicator in voice_name for indicator in ['portuguese', 'brazil', 'brasil', 'pt-br', 'pt_br']):
-                    voz_portugues = voice.id
-                    print(f"🇧🇷 Voz em português encontrada: {voice.name}")
-                    break
-                elif any(indicator in voice_id for indicator in ['portuguese', 'brazil', 'brasil', 'pt-br', 'pt_br']):
-                    voz_portugues = voice.id
-                    print(f"🇧🇷 Voz em português encontrada: {voice.name}")
-                    break
-        
-        # Se encontrou voz em português, usa ela
-        if voz_portugues:
-            engine.setProperty('voice', voz_portugues)
-        else:
-            print("⚠️ Voz em português não encontrada, usando voz padrão")
-            # Usa a primeira voz disponível
-            if voices:
-                engine.setProperty('voice', voices[0].id)
-        
-        # Configurações adicionais para melhor performance
-        engine.setProperty('rate', 170)  # Velocidade da fala um pouco mais rápida
-        engine.setProperty('volume', 1.0)  # Volume máximo
-        print("🔊 TTS inicializado com sucesso")
-        
-        return True
-        
-    except Exception as e:
-        print(f"⚠️ Erro ao inicializar TTS: {e}")
-        print("O sistema funcionará sem áudio")
-        engine = None
-        return False
+            engine.setProperty('voice', voices[0].id)
+    
+    # Configurações adicionais para melhor performance
+    engine.setProperty('rate', 170)  # Velocidade da fala um pouco mais rápida
+    engine.setProperty('volume', 1.0)  # Volume máximo
+    return engine
+
+def inicializar_tts():
+    """Prepara o engine persistente (criado na própria thread de voz)"""
+    global tts
+    tts = PersistentEngine(criar_engine_tts)
+    return True
+
+def preparar_texto_fala(texto):
+    """Se o texto já está em português (como descrições), não traduz"""
+    if any(palavra in texto.lower() for palavra in ['há', 'não', 'objetos', 'imagem', 'rosto', 'olho', 'nariz']):
+        return texto
+    return traduzir_objeto(texto)
 
 def worker_fala():
     """Thread worker para processar fila de fala"""
     global fala_ativa
+    
+    # O engine é criado aqui, na thread que vai usá-lo
+    if tts.ensure():
+        print("🔊 TTS inicializado com sucesso")
+    else:
+        print("O sistema funcionará sem áudio")
+    
     while True:
         try:
-            texto = fala_queue.get(timeout=1)
-            if texto is None:  # Sinal para parar
+            mensagem = fala_queue.get_message(timeout=1)
+            if mensagem is None:  # Sinal para parar
                 break
-                
-            if engine:
+            texto, enfileirado_em = mensagem.payload, mensagem.enqueued_at
+            texto_fala = preparar_texto_fala(texto)
+            
+            if tts.check_health():
                 fala_ativa = True
-                
-                # Se o texto já está em português (como descrições), não traduz
-                if any(palavra in texto.lower() for palavra in ['há', 'não', 'objetos', 'imagem', 'rosto', 'olho', 'nariz']):
-                    texto_fala = texto
-                else:
-                    texto_fala = traduzir_objeto(texto)
-                
                 print(f"🔊 Falando: {texto_fala}")
-                
-                try:
-                    # Cria um novo engine para cada fala para evitar conflitos
-                    temp_engine = pyttsx3.init()
-                    temp_engine.setProperty('rate', 170)
-                    temp_engine.setProperty('volume', 1.0)
-                    temp_engine.say(texto_fala)
-                    temp_engine.runAndWait()
-                    temp_engine.stop()
-                    del temp_engine
-                    print("✅ Fala concluída")
-                except Exception as e:
-                    print(f"⚠️ Erro ao falar '{texto}': {e}")
-                
+                with tracer.span('tts.runAndWait', cat='tts', texto=texto_fala):
+                    falou = tts.say(texto_fala, enqueued_at=enfileirado_em)
+                if falou:
+                    print(f"✅ Fala concluída (latência: {tts.latency['last_ms']} ms)")
                 fala_ativa = False
             else:
-                if any(palavra in texto.lower() for palavra in ['há', 'não', 'objetos', 'imagem', 'rosto', 'olho', 'nariz']):
-                    texto_fala = texto
-                else:
-                    texto_fala = traduzir_objeto(texto)
                 print(f"🔊 {texto_fala} (áudio não disponível)")
                 
             fala_queue.task_done()
         except queue.Empty:
+            # Verificação periódica do engine enquanto ocioso
+            tts.check_health()
             continue
         except Exception as e:
             print(f"❌ Erro no worker de fala: {e}")
             fala_ativa = False
 
-# Inicializa TTS e worker
-if inicializar_tts():
-    fala_thread = threading.Thread(target=worker_fala, daemon=True)
-    fala_thread.start()
+def iniciar_fala():
+    """Inicializa TTS e worker"""
+    global fala_thread
+    if inicializar_tts():
+        fala_thread = threading.Thread(target=worker_fala, daemon=True)
+        fala_thread.start()
+
+def init_resources():
+    """Modelo, webcam e voz: carregados uma vez, no primeiro uso ou no aquecimento"""
+    iniciar_fala()
+    carregar_modelo()
+    init_webcam()
+
+# Importar o módulo não carrega o YOLO nem testa câmeras; rotas que usam os recursos esperam por eles
+resources = LazyResources('face_app', init_resources)
+guard(app, resources)
+
+def create_app(warm_up=True):
+    """Fábrica do app: com warm_up, inicializa os recursos em segundo plano"""
+    if warm_up:
+        resources.warm_up()
+    return app
 
 # Variáveis globais
 ultimo_objeto = None
@@ -219,23 +242,17 @@ partes_rosto_detectadas = []
 
 # Função para falar o nome do objeto/parte do rosto
 def falar_nome(nome):
-    """Adiciona texto à fila de fala"""
-    if not fala_queue.full():
-        try:
-            # Limpa a fila se tiver muitos itens
-            if fala_queue.qsize() > 2:
-                while not fala_queue.empty():
-                    try:
-                        fala_queue.get_nowait()
-                    except queue.Empty:
-                        break
-            
-            fala_queue.put(nome)
+    """
+    Adiciona texto à fila de fala
+    
+    Pedidos novos substituem os pendentes (grupo 'fala') e frases antigas
+    vencem sozinhas, em vez de esvaziar a fila manualmente.
+    """
+    try:
+        if fala_queue.put(nome, group='fala'):
             print(f"📝 Adicionado à fila de fala: {nome}")
-        except Exception as e:
-            print(f"❌ Erro ao adicionar à fila: {e}")
-    else:
-        print("⚠️ Fila de fala cheia, ignorando pedido")
+    except Exception as e:
+        print(f"❌ Erro ao adicionar à fila: {e}")
 
 # Função para descrever o rosto
 def descrever_rosto(partes, expressoes=None):
@@ -267,7 +284,8 @@ def process_image(frame):
     global ultimo_objeto, objetos_detectados, partes_rosto_detectadas, face_detector
     
     try:
-        # Detecção de objetos (bem simplificada)
+        # Detecção de objetos (bem simplificada); webcam e upload compartilham o modelo
+        model = models.yolo(YOLO_WEIGHTS)
         results = model(frame, conf=0.5)
         
         h, w = frame.shape[:2]
@@ -353,7 +371,6 @@ def gen_frames():
             while True:
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                import time
                 time.sleep(1)
         return
     
@@ -398,7 +415,6 @@ def gen_frames():
                 continue
         
         # Pequena pausa para não sobrecarregar
-        import time
         time.sleep(0.03)  # ~30 FPS
 
 # Rota principal com interface HTML
@@ -774,6 +790,14 @@ def toggle_mode():
     current_image = None
     return '', 204
 
+# Rota com a saúde do engine de voz e a latência fila -> áudio
+@app.route('/tts_status')
+def tts_status():
+    status = tts.status() if tts else {'engine_ready': False}
+    status['queue_size'] = fala_queue.qsize()
+    status['falando'] = fala_ativa
+    return jsonify(status)
+
 # Rota para verificar status da webcam
 @app.route('/webcam_status')
 def webcam_status():
@@ -790,4 +814,4 @@ def reconnect_webcam():
 
 if __name__ == '__main__':
     print("🚀 Iniciando servidor Flask...")
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    serve(app, resources, host='0.0.0.0', port=5000)
@@ -2,14 +2,10 @@ import cv2
 import numpy as np
 from collections import deque
 import os
+from medical_models import models
 
 class FacePartDetector:
     def __init__(self):
-        # Carrega os classificadores Haar Cascade
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
-        self.smile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_smile.xml')
-        
         # Histórico para análise
         self.detection_history = deque(maxlen=10)
         self.frame_count = 0
@@ -27,6 +23,19 @@ class FacePartDetector:
         # Expressões detectadas
         self.current_expressions = []
         
+    # Classificadores Haar Cascade da thread atual (carregados uma vez pelo registro)
+    @property
+    def face_cascade(self):
+        return models.cascade('frontalface')
+    
+    @property
+    def eye_cascade(self):
+        return models.cascade('eye')
+    
+    @property
+    def smile_cascade(self):
+        return models.cascade('smile')
+        
     def detect_face_parts(self, frame):
         """Detecta partes do rosto"""
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
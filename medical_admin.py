@@ -0,0 +1,109 @@
+# Rotas Administrativas e Rastreamento de Requisições
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Compartilhado pelos apps Flask: register(app) adiciona os ganchos que
+# transformam requisições em spans do trace, /metrics (Prometheus) e as
+# rotas /admin/* (profiling do loop de frames e rastreamento do pipeline).
+# As rotas /admin/* exigem admin_permitido().
+
+import os
+import time
+
+from flask import Flask, Response, g, jsonify, request
+
+from medical_metrics import metrics, PROMETHEUS_CONTENT_TYPE
+from medical_profiler import profiler
+from medical_tracing import tracer
+
+
+def admin_permitido() -> bool:
+    """Rotas administrativas: apenas localhost ou token em ESTABILIDADE_ADMIN_TOKEN"""
+    token = os.environ.get('ESTABILIDADE_ADMIN_TOKEN')
+    if token:
+        return request.headers.get('X-Admin-Token') == token
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+def acesso_negado():
+    return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+
+
+def trace_request_start():
+    """Marca o início da requisição quando o rastreamento está ativo"""
+    if tracer.enabled:
+        g.trace_start = time.perf_counter()
+
+
+def trace_request_end(exc):
+    """Registra a requisição como span da thread do Flask"""
+    inicio = g.pop('trace_start', None)
+    if inicio is not None:
+        tracer.complete(request.path, inicio, time.perf_counter() - inicio, cat='http',
+                        args={'method': request.method})
+
+
+def metrics_endpoint():
+    """Métricas de latência do pipeline no formato Prometheus"""
+    return Response(metrics.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+
+def admin_profile():
+    """Perfila o loop de frames em execução por N segundos"""
+    if not admin_permitido():
+        return acesso_negado()
+
+    seconds = request.args.get('seconds', 10, type=float)
+    mode = request.args.get('format', 'pstats')
+    sort = request.args.get('sort', 'cumulative')
+    try:
+        resultado = profiler.profile(seconds=seconds, mode=mode, sort=sort)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except (RuntimeError, TimeoutError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    return Response(resultado, mimetype='text/plain; charset=utf-8')
+
+
+def admin_trace_start():
+    """Inicia o rastreamento do pipeline em buffer circular"""
+    if not admin_permitido():
+        return acesso_negado()
+    tracer.start(max_events=request.args.get('max_events', type=int))
+    return jsonify({'success': True, **tracer.status()})
+
+
+def admin_trace_stop():
+    """Interrompe o rastreamento (o buffer continua disponível)"""
+    if not admin_permitido():
+        return acesso_negado()
+    tracer.stop()
+    return jsonify({'success': True, **tracer.status()})
+
+
+def admin_trace_download():
+    """Download do rastreamento no formato Chrome trace-event (Perfetto)"""
+    if not admin_permitido():
+        return acesso_negado()
+    return Response(tracer.export_json(), mimetype='application/json',
+                    headers={'Content-Disposition': 'attachment; filename=frame_pipeline_trace.json'})
+
+
+def register(app: Flask, profile: bool = True):
+    """
+    Registra os ganchos de rastreamento, /metrics e as rotas /admin/*
+
+    Chamar logo após criar o app, antes de guard(): o span da requisição
+    inclui a espera pelos recursos. Os endpoints mantêm os nomes das funções
+    (ex.: 'metrics_endpoint', isento em medical_startup.DEFAULT_EXEMPT).
+
+    Args:
+        profile: Registra /admin/profile (requer um loop que chame profiler.tick())
+    """
+    app.before_request(trace_request_start)
+    app.teardown_request(trace_request_end)
+    app.add_url_rule('/metrics', view_func=metrics_endpoint, methods=['GET'])
+    if profile:
+        app.add_url_rule('/admin/profile', view_func=admin_profile, methods=['POST'])
+    app.add_url_rule('/admin/trace/start', view_func=admin_trace_start, methods=['POST'])
+    app.add_url_rule('/admin/trace/stop', view_func=admin_trace_stop, methods=['POST'])
+    app.add_url_rule('/admin/trace.json', view_func=admin_trace_download)
@@ -0,0 +1,173 @@
+# Canal de Alarme de Movimento
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Falar "Movimento detectado" leva ~1,5 s entre síntese e reprodução; na
+# ressonância o paciente precisa ouvir um sinal em ~100 ms. Este canal toca
+# um bipe curto, gerado uma única vez em memória, numa thread dedicada que
+# só espera o disparo. Não passa pela fila de voz nem pelo servidor de TTS:
+# a orientação falada vem depois, pelo caminho normal.
+
+import io
+import sys
+import threading
+import time
+import wave
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from medical_metrics import metrics
+from medical_speech import PRIORITY_ALERT, _play_wav_bytes, audio_player_available
+
+metrics.describe('alarm_latency_seconds', 'Tempo entre o disparo do alarme e o inicio da reproducao')
+metrics.describe('alarm_triggered_total', 'Alarmes de movimento tocados')
+metrics.describe('alarm_suppressed_total', 'Disparos de alarme ignorados por motivo')
+
+
+def generate_tone(frequency: float = 1000.0, duration: float = 0.15, volume: float = 0.6,
+                  sample_rate: int = 22050, beeps: int = 2, gap: float = 0.05) -> bytes:
+    """
+    Gera um WAV (16 bits, mono) com bipes senoidais
+
+    Rampas de 5 ms no início e no fim de cada bipe evitam estalos.
+    """
+    amostras = int(sample_rate * duration)
+    t = np.arange(amostras) / sample_rate
+    bipe = np.sin(2 * np.pi * frequency * t) * volume
+
+    rampa = min(int(sample_rate * 0.005), amostras // 2)
+    if rampa > 0:
+        envelope = np.linspace(0.0, 1.0, rampa)
+        bipe[:rampa] *= envelope
+        bipe[-rampa:] *= envelope[::-1]
+
+    silencio = np.zeros(int(sample_rate * gap))
+    partes = []
+    for i in range(beeps):
+        if i:
+            partes.append(silencio)
+        partes.append(bipe)
+    sinal = np.concatenate(partes)
+    pcm = (np.clip(sinal, -1.0, 1.0) * 32767).astype('<i2')
+
+    saida = io.BytesIO()
+    with wave.open(saida, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return saida.getvalue()
+
+
+MOVEMENT_ALERT = "Movimento detectado. Mantenha a cabeça imóvel."
+
+
+def movement_feedback(alarm: Optional['MovementAlarm'], falar, is_stable: bool, reason: str):
+    """
+    Resposta a uma mudança de estado do analisador durante o procedimento
+
+    Bipe imediato quando o paciente se move (ou começa a se mover); a voz vem
+    depois, apenas para movimento confirmado. Mudança de threshold pelo
+    operador ('reconfigured') não é movimento do paciente.
+    """
+    if reason == 'reconfigured':
+        return
+    if alarm is not None and (reason == 'pre_alert' or not is_stable):
+        alarm.trigger()
+    if not is_stable:
+        falar(MOVEMENT_ALERT, priority=PRIORITY_ALERT, group='alerta')
+
+
+class MovementAlarm:
+    """
+    Alarme sonoro de baixa latência
+
+    trigger() apenas marca o horário e acorda a thread do alarme (seguro para
+    chamar de dentro do loop de frames). Disparos dentro do intervalo de
+    debounce são ignorados, para que uma sequência de frames instáveis gere
+    um único bipe.
+    """
+
+    def __init__(self, tone: Optional[bytes] = None, debounce: float = 2.0, enabled: bool = True):
+        self.tone = tone if tone is not None else generate_tone()
+        self.debounce = debounce
+        self.enabled = enabled
+        self.player_available = audio_player_available()
+
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._pending_since = None
+        self._last_trigger = None
+        self._stopping = False
+        self._thread = None
+        self.triggered = 0
+        self.suppressed = 0
+
+    def start(self):
+        """Inicia a thread do alarme"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self.player_available:
+            print("⚠️ Sem reprodutor de áudio em memória - alarme usará o sinal do terminal")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='movement-alarm', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """Encerra a thread do alarme"""
+        self._stopping = True
+        self._event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self) -> bool:
+        """Dispara o alarme (não bloqueia). Retorna False se suprimido."""
+        if not self.enabled:
+            return False
+        agora = time.perf_counter()
+        with self._lock:
+            if self._last_trigger is not None and agora - self._last_trigger < self.debounce:
+                self.suppressed += 1
+                metrics.inc('alarm_suppressed_total', reason='debounce')
+                return False
+            if self._pending_since is not None:
+                self.suppressed += 1
+                metrics.inc('alarm_suppressed_total', reason='playing')
+                return False
+            self._last_trigger = agora
+            self._pending_since = agora
+        self._event.set()
+        return True
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            if self._stopping:
+                break
+            with self._lock:
+                disparo = self._pending_since
+            if disparo is None:
+                continue
+            metrics.observe('alarm_latency_seconds', time.perf_counter() - disparo)
+            try:
+                if not (self.player_available and _play_wav_bytes(self.tone)):
+                    sys.stderr.write('\a')
+                    sys.stderr.flush()
+                self.triggered += 1
+                metrics.inc('alarm_triggered_total')
+            except Exception as e:
+                print(f"❌ Erro no alarme sonoro: {e}")
+            finally:
+                with self._lock:
+                    self._pending_since = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'player_available': self.player_available,
+            'debounce_s': self.debounce,
+            'triggered': self.triggered,
+            'suppressed': self.suppressed
+        }
@@ -0,0 +1,256 @@
+# Agendador de Anúncios de Voz
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Os anúncios periódicos ("Paciente em posição...", "Sistema pronto...")
+# seguem o feedback_frequency da população do paciente (medical_configs).
+# O loop de frames só informa mudanças de estado de cada sala; os anúncios
+# repetidos são disparados por uma roda de temporizadores (timer wheel) numa
+# thread própria, sem consultar o relógio a cada frame. Um balde de fichas
+# global limita a taxa de fala de todas as salas juntas, para que várias
+# salas não inundem o dispositivo de áudio. Alertas de movimento e mensagens
+# de controle não passam por aqui.
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from medical_configs import get_procedure_config
+from medical_metrics import metrics
+
+metrics.describe('announcements_total', 'Anuncios periodicos enviados para a fila de voz')
+metrics.describe('announcements_deferred_total', 'Anuncios adiados pelo limite global de taxa de fala')
+
+# Estados que geram anúncios periódicos (sem procedimento em andamento)
+ANNOUNCEMENTS = {
+    'ready': "Paciente estável. Sistema pronto para iniciar procedimento médico.",
+    'positioning': "Paciente em posição. Mantendo estabilidade.",
+}
+
+DEFAULT_PROCEDURE = 'ressonancia_magnetica'
+DEFAULT_POPULATION = 'padrao'
+
+
+class TimerWheel:
+    """
+    Roda de temporizadores (hashed timing wheel)
+
+    Cada slot guarda os temporizadores que vencem naquela posição da roda;
+    temporizadores mais longos que uma volta guardam o número de voltas
+    restantes. Agendar e cancelar são O(1); a thread avança um slot por tick.
+    Os callbacks rodam na thread da roda e devem ser rápidos.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel: List[Dict[int, list]] = [{} for _ in range(slots)]
+        self._where: Dict[int, int] = {}  # id -> slot
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._next_id = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='announcement-wheel', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> int:
+        """Agenda callback(*args) para daqui a `delay` segundos; retorna o id"""
+        ticks = max(1, int(round(delay / self.tick)))
+        with self._lock:
+            self._next_id += 1
+            timer_id = self._next_id
+            slot = (self._cursor + ticks) % self.slots
+            voltas = (ticks - 1) // self.slots
+            self._wheel[slot][timer_id] = [voltas, callback, args]
+            self._where[timer_id] = slot
+        return timer_id
+
+    def cancel(self, timer_id: Optional[int]) -> bool:
+        if timer_id is None:
+            return False
+        with self._lock:
+            slot = self._where.pop(timer_id, None)
+            if slot is None:
+                return False
+            del self._wheel[slot][timer_id]
+            return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._where)
+
+    def _advance(self) -> list:
+        """Avança um slot e retorna os temporizadores vencidos"""
+        vencidos = []
+        with self._lock:
+            self._cursor = (self._cursor + 1) % self.slots
+            bucket = self._wheel[self._cursor]
+            for timer_id in list(bucket):
+                entrada = bucket[timer_id]
+                if entrada[0] > 0:
+                    entrada[0] -= 1
+                    continue
+                del bucket[timer_id]
+                del self._where[timer_id]
+                vencidos.append((entrada[1], entrada[2]))
+        return vencidos
+
+    def _run(self):
+        proximo = time.monotonic() + self.tick
+        while not self._stopping.wait(max(0.0, proximo - time.monotonic())):
+            proximo += self.tick
+            # Se a thread atrasou (ex.: máquina suspensa), não tenta recuperar ticks perdidos
+            if time.monotonic() - proximo > self.tick * self.slots:
+                proximo = time.monotonic() + self.tick
+            for callback, args in self._advance():
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"⚠️ Erro em temporizador de anúncio: {e}")
+
+
+class SpeechRateLimiter:
+    """Balde de fichas: no máximo `per_minute` anúncios por minuto, com rajada `burst`"""
+
+    def __init__(self, per_minute: float = 12.0, burst: int = 3):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, agora: float):
+        self._tokens = min(self.burst, self._tokens + (agora - self._updated) * self.rate)
+        self._updated = agora
+
+    def try_acquire(self) -> float:
+        """Consome uma ficha; retorna 0 se conseguiu ou a espera (s) até a próxima"""
+        with self._lock:
+            agora = time.monotonic()
+            self._refill(agora)
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+
+class AnnouncementScheduler:
+    """
+    Anúncios periódicos por sala
+
+    update_state() é chamado pelo loop de frames a cada frame, mas só faz
+    trabalho quando o estado da sala muda. O primeiro anúncio de um estado
+    sai assim que o intervalo desde o último anúncio da sala tiver passado;
+    os seguintes, a cada feedback_frequency segundos. Perder a estabilidade
+    zera o intervalo, como antes.
+    """
+
+    def __init__(self, speak: Callable[[str, str], Any], per_minute: float = 12.0,
+                 burst: int = 3, wheel: TimerWheel = None):
+        """
+        Args:
+            speak: Função speak(room, texto) que enfileira o anúncio
+            per_minute: Limite global de anúncios por minuto (todas as salas)
+            burst: Anúncios permitidos em sequência antes do limite atuar
+            wheel: Roda de temporizadores (criada se não informada)
+        """
+        self.speak = speak
+        self.limiter = SpeechRateLimiter(per_minute, burst)
+        self.wheel = wheel or TimerWheel()
+        self._rooms: Dict[str, Dict[str, Any]] = {}
+        self._waiting = deque()  # Salas adiadas pelo limite, atendidas em ordem
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.wheel.start()
+
+    def stop(self):
+        self.wheel.stop()
+
+    def configure_room(self, room: str, procedure_type: str = DEFAULT_PROCEDURE,
+                       population: str = DEFAULT_POPULATION) -> float:
+        """Define procedimento e população da sala; retorna o intervalo (s)"""
+        try:
+            config = get_procedure_config(procedure_type, population)
+            intervalo = float(config['feedback_frequency'])
+        except ValueError:
+            config = get_procedure_config(DEFAULT_PROCEDURE, population)
+            intervalo = float(config['feedback_frequency'])
+        with self._lock:
+            sala = self._rooms.setdefault(room, {'state': None, 'timer': None, 'last': None})
+            sala.update({'procedure': procedure_type, 'population': population, 'interval': intervalo})
+            estado = sala['state']
+            sala['state'] = None
+        # Reaplica o estado atual para reagendar com o novo intervalo
+        if estado is not None:
+            self.update_state(room, estado)
+        return intervalo
+
+    def update_state(self, room: str, state: str):
+        """Informa o estado da sala ('ready', 'positioning', 'unstable', 'procedure', ...)"""
+        sala = self._rooms.get(room)
+        if sala is None:
+            self.configure_room(room)
+            sala = self._rooms[room]
+        if sala['state'] == state:
+            return
+
+        with self._lock:
+            if sala['state'] == state:
+                return
+            sala['state'] = state
+            self.wheel.cancel(sala['timer'])
+            sala['timer'] = None
+            if room in self._waiting:
+                self._waiting.remove(room)
+            if state not in ANNOUNCEMENTS:
+                if state == 'unstable':
+                    sala['last'] = None  # Perdeu estabilidade: próximo anúncio sai logo
+                return
+            atraso = 0.0
+            if sala['last'] is not None:
+                atraso = max(0.0, sala['interval'] - (time.monotonic() - sala['last']))
+            sala['timer'] = self.wheel.schedule(atraso, self._fire, room, state)
+
+    def _fire(self, room: str, state: str):
+        """Executado na thread da roda quando vence o anúncio da sala"""
+        with self._lock:
+            sala = self._rooms.get(room)
+            if sala is None or sala['state'] != state:
+                return
+            # Quem foi adiado antes tem a vez: evita que uma sala com intervalo
+            # curto monopolize o limite global
+            if self._waiting and self._waiting[0] != room:
+                espera = self.wheel.tick
+            else:
+                espera = self.limiter.try_acquire()
+            if espera > 0:
+                if room not in self._waiting:
+                    self._waiting.append(room)
+                    metrics.inc('announcements_deferred_total')
+                sala['timer'] = self.wheel.schedule(espera, self._fire, room, state)
+                return
+            if self._waiting and self._waiting[0] == room:
+                self._waiting.popleft()
+            sala['last'] = time.monotonic()
+            sala['timer'] = self.wheel.schedule(sala['interval'], self._fire, room, state)
+        metrics.inc('announcements_total', room=room)
+        self.speak(room, ANNOUNCEMENTS[state])
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                room: {k: sala.get(k) for k in ('procedure', 'population', 'interval', 'state')}
+                for room, sala in self._rooms.items()
+            }
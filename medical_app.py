@@ -1,163 +1,248 @@
 from flask import Flask, Response, jsonify, render_template_string, request
 import cv2
-import pyttsx3
-import threading
+import os
 import atexit
 import numpy as np
-import queue
 import time
 from medical_head_stability import MedicalHeadStabilityAnalyzer
+from medical_metrics import metrics
+from medical_models import models
+from medical_profiler import profiler
+from medical_budget import FrameBudgetScheduler
+from medical_calibration import calibrate, pipeline_settings
+from medical_speech import SpeechQueue, PRIORITY_CONTROL
+from medical_speech_server import SpeechServer
+from medical_alarm import MovementAlarm, movement_feedback
+from medical_recorder import SessionRecording
+from medical_capture import CameraSource, source_from_env
+from medical_announcements import AnnouncementScheduler, DEFAULT_PROCEDURE, DEFAULT_POPULATION
+from medical_admin import register as register_admin
+from medical_startup import LazyResources, guard, serve
 
 # Inicializa o Flask
 app = Flask(__name__)
 
+# /metrics, /admin/* e spans das requisições (antes de guard: o span inclui a espera)
+register_admin(app)
+
 # Função para limpar recursos
 def cleanup():
-    global cap, fala_queue, analyzer
+    global cap, fala_queue, analyzer, speech_server, movement_alarm, announcements
     if cap and cap.isOpened():
         cap.release()
     cv2.destroyAllWindows()
     
-    # Para o worker de fala
+    # Fecha a gravação da trajetória em andamento
+    gravacao.stop(analyzer)
+    
+    # Para o worker de fala e encerra o subprocesso de voz
     if fala_queue:
         fala_queue.put(None)
+    if speech_server:
+        speech_server.stop()
+    if movement_alarm:
+        movement_alarm.stop()
+    if announcements:
+        announcements.stop()
     
     print("🧹 Recursos liberados")
 
 # Registra função de limpeza
 atexit.register(cleanup)
 
-# Configuração do TTS
-print("🔊 Configurando sistema de voz...")
-fala_queue = queue.Queue()
+# Recursos pesados (câmera, voz, alarme, analisador): criados em init_resources()
+cap = None
+analyzer = None
+speech_server = None
+fala_thread = None
+movement_alarm = None
+
+fala_queue = SpeechQueue()
+
+# Frases fixas pré-sintetizadas pelo servidor de voz
+FRASES_CONHECIDAS = [
+    "Paciente estável. Sistema pronto para iniciar procedimento médico.",
+    "Paciente em posição. Mantendo estabilidade.",
+    "Procedimento médico iniciado. Paciente em posição ideal.",
+    "Procedimento iniciado com paciente estável. Monitorando movimento.",
+    "Atenção: Procedimento iniciado com paciente instável. Risco aumentado.",
+    "Procedimento médico interrompido.",
+    "Sistema reiniciado.",
+    "Movimento detectado. Mantenha a cabeça imóvel.",
+]
 
-def configurar_tts():
-    """Configura o sistema text-to-speech"""
-    engine = pyttsx3.init()
+falar = fala_queue.say  # Instrumentado (tts_enqueue); prioridade e grupo como em put()
+
+metrics.gauge_callback('tts_queue_depth', fala_queue.qsize)
+
+def init_voice():
+    """Servidor de voz (subprocesso), thread que o alimenta e alarme de movimento"""
+    global speech_server, fala_thread, movement_alarm
+    print("🔊 Configurando sistema de voz...")
+    speech_server = SpeechServer(rate=150, volume=0.8, phrases=FRASES_CONHECIDAS)
+    fala_thread = speech_server.start_worker(fala_queue)
+    print("🔊 TTS inicializado com sucesso")
     
-    # Configurações de voz em português
-    voices = engine.getProperty('voices')
-    for voice in voices:
-        if 'brazil' in voice.name.lower() or 'portuguese' in voice.name.lower():
-            engine.setProperty('voice', voice.id)
-            print(f"🇧🇷 Voz em português encontrada: {voice.name}")
-            break
+    # Alarme sonoro de movimento (bipe em memória, independente da fila de voz)
+    movement_alarm = MovementAlarm(debounce=2.0)
+    movement_alarm.start()
+
+def init_camera():
+    """Webcam (ou gravação, se ESTABILIDADE_SOURCE estiver definida)"""
+    global cap
+    print("📹 Inicializando sistema de câmera...")
+    try:
+        cap = source_from_env()
+    except (ValueError, OSError) as e:
+        print(f"⚠️ ESTABILIDADE_SOURCE inválida ({e}) - usando a webcam")
+        cap = None
+    if cap is not None and not cap.isOpened():
+        print("⚠️ Fonte de captura não pôde ser aberta - usando a webcam")
+        cap = None
+    
+    # Tenta diferentes índices de câmera
+    for i in range(3 if cap is None else 0):
+        test_cap = cv2.VideoCapture(i, cv2.CAP_DSHOW)
+        if test_cap.isOpened():
+            ret, frame = test_cap.read()
+            if ret and frame is not None:
+                cap = CameraSource(test_cap)
+                print(f"✅ Webcam encontrada no índice {i}")
+                break
+            test_cap.release()
     
-    # Configurações
-    engine.setProperty('rate', 150)  # Velocidade
-    engine.setProperty('volume', 0.8)  # Volume
+    if cap is None:
+        print("❌ Nenhuma webcam encontrada")
+        cap = CameraSource(0)
     
-    return engine
+    # Configurações da câmera
+    if cap.live and cap.isOpened():
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        cap.set(cv2.CAP_PROP_FPS, 30)
+        print("📹 Câmera configurada: 1280x720 @ 30fps")
+
+def on_analyzer_state(is_stable, reason):
+    """Bipe e alerta de voz para movimento do paciente durante o procedimento"""
+    if procedure_started:
+        movement_feedback(movement_alarm, falar, is_stable, reason)
+
+# Orçamento de tempo por frame (degradação gradual sob carga)
+frame_budget = FrameBudgetScheduler(budget_ms=33, base_settings={'jpeg_quality': 85})
 
-def worker_fala():
-    """Worker thread para processamento de fala"""
-    engine = configurar_tts()
+def init_analyzer():
+    """Analisador médico e calibração de desempenho (requer a câmera)"""
+    global analyzer
+    print("🏥 Inicializando Sistema Médico de Estabilidade...")
+    # Cascade no pool do registro: a thread de /video_feed o recebe pronto
+    models.preload(cascades=('frontalface',))
+    analyzer = MedicalHeadStabilityAnalyzer(
+        stability_threshold=8,      # Movimento máximo permitido (pixels)
+        time_threshold=3.0,         # Tempo necessário de estabilidade (segundos)
+        sensitivity='medium'        # Sensibilidade: 
+    )
+    analyzer.add_state_listener(on_analyzer_state)
+    print("✅ Sistema Médico inicializado!")
     
-    while True:
+    # Calibração de desempenho (salva por máquina; ESTABILIDADE_RECALIBRATE=1 força nova medição)
+    if cap.isOpened():
         try:
-            texto = fala_queue.get(timeout=1)
-            if texto is None:  # Sinal para parar
-                break
-            engine.say(texto)
-            engine.runAndWait()
-        except queue.Empty:
-            continue
+            ret, calibration_frame = cap.read()
+            if ret and calibration_frame is not None:
+                # Só salva medições feitas na câmera (não em gravações)
+                settings = calibrate(analyzer, calibration_frame, target_fps=30,
+                                     force=os.environ.get('ESTABILIDADE_RECALIBRATE') == '1',
+                                     save=cap.live)
+                frame_budget.set_base_settings(pipeline_settings(settings))
+                analyzer.reset_analysis()
         except Exception as e:
-            print(f"❌ Erro no TTS: {e}")
+            print(f"⚠️ Calibração indisponível: {e}")
 
-# Inicia worker de fala
-fala_thread = threading.Thread(target=worker_fala, daemon=True)
-fala_thread.start()
-print("🔊 TTS inicializado com sucesso")
+# Variáveis de controle
+procedure_started = False
+gravacao = SessionRecording(app='medical_app')  # Trajetória do procedimento em andamento (sem imagens)
 
-# Inicializa webcam
-print("📹 Inicializando sistema de câmera...")
-cap = None
+# Anúncios periódicos no intervalo da população (feedback_frequency)
+ROOM_ID = os.environ.get('ESTABILIDADE_SALA', 'sala-1')
+announcements = AnnouncementScheduler(lambda room, texto: falar(texto, group='status'))
+announcements.configure_room(ROOM_ID, DEFAULT_PROCEDURE, DEFAULT_POPULATION)
 
-# Tenta diferentes índices de câmera
-for i in range(3):
-    test_cap = cv2.VideoCapture(i, cv2.CAP_DSHOW)
-    if test_cap.isOpened():
-        ret, frame = test_cap.read()
-        if ret and frame is not None:
-            cap = test_cap
-            print(f"✅ Webcam encontrada no índice {i}")
-            break
-        test_cap.release()
-
-if cap is None:
-    print("❌ Nenhuma webcam encontrada")
-    cap = cv2.VideoCapture(0)
-
-# Configurações da câmera
-if cap.isOpened():
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    cap.set(cv2.CAP_PROP_FPS, 30)
-    print("📹 Câmera configurada: 1280x720 @ 30fps")
-
-# Inicializa o analisador médico
-print("🏥 Inicializando Sistema Médico de Estabilidade...")
-analyzer = MedicalHeadStabilityAnalyzer(
-    stability_threshold=8,      # Movimento máximo permitido (pixels)
-    time_threshold=3.0,         # Tempo necessário de estabilidade (segundos)
-    sensitivity='medium'        # Sensibilidade: 
-)
-print("✅ Sistema Médico inicializado!")
+def init_resources():
+    """Inicializa câmera, voz, alarme e analisador (uma vez, no primeiro uso)"""
+    init_voice()
+    init_camera()
+    init_analyzer()
+    announcements.start()
 
-# Variáveis de controle
-procedure_started = False
-last_announcement = 0
-announcement_interval = 10  # Anunciar a cada 10 segundos quando pronto
+# Importar o módulo não abre câmera nem áudio; rotas que usam os recursos esperam por eles
+resources = LazyResources('medical_app', init_resources)
+guard(app, resources)
+
+def create_app(warm_up=True):
+    """Fábrica do app: com warm_up, inicializa os recursos em segundo plano"""
+    if warm_up:
+        resources.warm_up()
+    return app
 
 def process_frame(frame):
     """Processa o frame para análise médica"""
-    global procedure_started, last_announcement
+    global procedure_started
     
     # Analisa estabilidade
-    is_ready = analyzer.analyze_stability(frame)
-    
-    # Desenha informações de estabilidade
-    frame_with_info = analyzer.draw_stability_info(frame)
-    
-    # Controle de anúncios de voz
-    current_time = time.time()
+    frame_budget.apply_to(analyzer)
+    # Timestamp da fonte: em gravações, as durações seguem o tempo do vídeo
+    is_ready = analyzer.analyze_stability(frame, timestamp=cap.timestamp)  # Alarme via on_analyzer_state
     
-    if is_ready and not procedure_started:
-        if current_time - last_announcement > announcement_interval:
-            fala_queue.put("Paciente estável. Sistema pronto para iniciar procedimento médico.")
-            last_announcement = current_time
+    recorder = gravacao.recorder
+    if recorder is not None:
+        recorder.record(analyzer, cap.timestamp)
     
-    elif analyzer.is_stable and not is_ready:
-        if current_time - last_announcement > announcement_interval:
-            fala_queue.put("Paciente em posição. Mantendo estabilidade.")
-            last_announcement = current_time
+    # Desenha informações de estabilidade
+    with metrics.stage('overlay'):
+        frame_with_info = analyzer.draw_stability_info(
+            frame, detail=frame_budget.settings['overlay_detail'])
     
-    elif not analyzer.is_stable:
-        # Reset do timer se perdeu estabilidade
-        last_announcement = 0
+    # Anúncios de voz: só informa o estado; o agendador cuida dos intervalos
+    if procedure_started:
+        announcements.update_state(ROOM_ID, 'procedure')
+    elif is_ready:
+        announcements.update_state(ROOM_ID, 'ready')
+    elif analyzer.is_stable:
+        announcements.update_state(ROOM_ID, 'positioning')
+    else:
+        announcements.update_state(ROOM_ID, 'unstable')
     
     return frame_with_info
 
 def gen_frames():
     """Gera frames para streaming"""
     while True:
-        success, frame = cap.read()
+        profiler.tick()
+        frame_start = time.perf_counter()
+        with metrics.stage('capture'):
+            success, frame = cap.read()
         if not success:
+            metrics.inc('frames_dropped_total', reason='capture')
             print("❌ Falha ao capturar frame")
             break
         
-        # Processa o frame
+        # Processa o frame (custo medido sem a espera da câmera)
+        process_start = time.perf_counter()
         processed_frame = process_frame(frame)
         
         # Converte para JPEG
-        ret, buffer = cv2.imencode('.jpg', processed_frame, 
-                                  [cv2.IMWRITE_JPEG_QUALITY, 85])
+        with metrics.stage('jpeg_encode'):
+            ret, buffer = cv2.imencode('.jpg', processed_frame, 
+                                      [cv2.IMWRITE_JPEG_QUALITY, frame_budget.settings['jpeg_quality']])
+        frame_budget.record_frame(time.perf_counter() - process_start)
         
         if not ret:
+            metrics.inc('frames_dropped_total', reason='encode')
             continue
             
         frame_bytes = buffer.tobytes()
+        metrics.inc('frames_total')
+        metrics.observe_stage('frame', time.perf_counter() - frame_start, start=frame_start)
         
         yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -752,7 +837,11 @@ HTML_TEMPLATE = '''
                     }
                     
                     document.getElementById('statusDisplay').className = statusClass;
-                    updateStatus(data.message + ` (Estabilidade: ${data.stability_score.toFixed(1)}%)`);
+                    let statusText = data.message + ` (Estabilidade: ${data.stability_score.toFixed(1)}%)`;
+                    if (data.degradation && data.degradation.degraded) {
+                        statusText += ` ⚙️ Modo reduzido: ${data.degradation.label}`;
+                    }
+                    updateStatus(statusText);
                 });
         }
 
@@ -834,7 +923,8 @@ def start_procedure():
     if analyzer.is_ready_for_procedure:
         # Verde - Pronto para procedimento
         procedure_started = True
-        fala_queue.put("Procedimento médico iniciado. Paciente em posição ideal.")
+        gravacao.start(analyzer, room=ROOM_ID)
+        falar("Procedimento médico iniciado. Paciente em posição ideal.", priority=PRIORITY_CONTROL)
         print("🟢 DEBUG: Procedimento iniciado - Verde")
         return jsonify({
             'success': True, 
@@ -846,7 +936,8 @@ def start_procedure():
         # Amarelo - Estável mas ainda não pelo tempo completo
         if force_start:
             procedure_started = True
-            fala_queue.put("Procedimento iniciado com paciente estável. Monitorando movimento.")
+            gravacao.start(analyzer, room=ROOM_ID)
+            falar("Procedimento iniciado com paciente estável. Monitorando movimento.", priority=PRIORITY_CONTROL)
             print("🟡 DEBUG: Procedimento iniciado - Amarelo (forçado)")
             return jsonify({
                 'success': True, 
@@ -866,7 +957,8 @@ def start_procedure():
         # Vermelho - Instável
         if force_start:
             procedure_started = True
-            fala_queue.put("Atenção: Procedimento iniciado com paciente instável. Risco aumentado.")
+            gravacao.start(analyzer, room=ROOM_ID)
+            falar("Atenção: Procedimento iniciado com paciente instável. Risco aumentado.", priority=PRIORITY_CONTROL)
             print("🔴 DEBUG: Procedimento iniciado - Vermelho (forçado)")
             return jsonify({
                 'success': True, 
@@ -890,7 +982,8 @@ def stop_procedure():
     global procedure_started
     print("🛑 DEBUG: Botão 'Parar Procedimento' clicado!")
     procedure_started = False
-    fala_queue.put("Procedimento médico interrompido.")
+    gravacao.stop(analyzer)
+    falar("Procedimento médico interrompido.", priority=PRIORITY_CONTROL)
     return jsonify({'success': True, 'message': 'Procedimento interrompido'})
 
 @app.route('/get_status')
@@ -899,6 +992,10 @@ def get_status():
     print("📊 DEBUG: Botão 'Status Atual' clicado!")
     report = analyzer.get_stability_report()
     report['procedure_active'] = procedure_started
+    report['degradation'] = frame_budget.status()
+    report['tts'] = speech_server.status() if speech_server else None
+    report['alarm'] = movement_alarm.status() if movement_alarm else None
+    report['announcements'] = announcements.status().get(ROOM_ID)
     return jsonify(report)
 
 @app.route('/reset_analysis', methods=['POST'])
@@ -907,8 +1004,9 @@ def reset_analysis():
     global procedure_started
     print("🔄 DEBUG: Botão 'Reiniciar Análise' clicado!")
     procedure_started = False
+    gravacao.stop(analyzer)
     analyzer.reset_analysis()
-    fala_queue.put("Sistema reiniciado.")
+    falar("Sistema reiniciado.", priority=PRIORITY_CONTROL)
     return jsonify({'success': True, 'message': 'Análise reiniciada'})
 
 @app.route('/update_sensitivity', methods=['POST'])
@@ -917,15 +1015,10 @@ def update_sensitivity():
     data = request.json
     sensitivity = data.get('sensitivity', 'medium')
     
-    # Recria analyzer com nova sensibilidade
-    global analyzer
-    analyzer = MedicalHeadStabilityAnalyzer(
-        stability_threshold=analyzer.stability_threshold,
-        time_threshold=analyzer.time_threshold,
-        sensitivity=sensitivity
-    )
+    # Troca os thresholds no analisador em uso (mantém o histórico e o trecho estável)
+    analyzer.update_thresholds(sensitivity=sensitivity)
     
-    fala_queue.put(f"Sensibilidade alterada para {sensitivity}")
+    falar(f"Sensibilidade alterada para {sensitivity}", group='config')
     return jsonify({'success': True, 'sensitivity': sensitivity})
 
 @app.route('/update_time_threshold', methods=['POST'])
@@ -934,10 +1027,20 @@ def update_time_threshold():
     data = request.json
     time_threshold = data.get('time_threshold', 3.0)
     
-    analyzer.time_threshold = time_threshold
-    fala_queue.put(f"Tempo de estabilidade alterado para {time_threshold} segundos")
+    analyzer.update_thresholds(time_threshold=float(time_threshold))
+    falar(f"Tempo de estabilidade alterado para {time_threshold} segundos", group='config')
     return jsonify({'success': True, 'time_threshold': time_threshold})
 
+@app.route('/update_population', methods=['POST'])
+def update_population():
+    """Define procedimento e população do paciente (intervalo dos anúncios)"""
+    data = request.get_json() or {}
+    procedure_type = data.get('procedure_type', DEFAULT_PROCEDURE)
+    population = data.get('population', DEFAULT_POPULATION)
+    interval = announcements.configure_room(ROOM_ID, procedure_type, population)
+    return jsonify({'success': True, 'procedure_type': procedure_type,
+                    'population': population, 'feedback_interval': interval})
+
 if __name__ == '__main__':
     print("🏥 Sistema Médico de Estabilidade da Cabeça")
     print("🌐 Acesse: http://127.0.0.1:5000")
@@ -947,4 +1050,5 @@ if __name__ == '__main__':
     print("   • Radiografia da Cabeça (Raio-X)")
     print("=" * 50)
     
-    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
+    # O socket abre antes do aquecimento: a página inicial responde de imediato
+    serve(app, resources, host='0.0.0.0', port=5000)
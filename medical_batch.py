@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Processamento em Lote de Gravações de Exames
+Sistema Médico de Estabilidade da Cabeça
+
+Roda o MedicalHeadStabilityAnalyzer sobre todos os vídeos de um diretório,
+um processo por núcleo, e grava:
+  - summary.json / summary.csv: relatório de estabilidade de cada vídeo
+  - series/<caminho do vídeo>.csv: série temporal de movimento (uma linha por frame
+    analisado); o nome vem do caminho relativo ao diretório, com extensão
+    (sub__a.mp4.csv), para vídeos homônimos não se sobrescreverem
+
+Com --analysis-fps menor que o FPS do vídeo, os frames intermediários são
+apenas avançados com grab() (sem decodificar a imagem), o que reduz o custo
+de decodificação proporcionalmente.
+
+Uso:
+    python medical_batch.py gravacoes/ --output resultados/ --analysis-fps 10
+"""
+
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+import cv2
+
+from medical_head_stability import MedicalHeadStabilityAnalyzer
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv', '.mpg', '.mpeg')
+
+SERIES_FIELDS = ['frame', 'timestamp', 'detected', 'movement', 'is_stable', 'is_ready', 'pre_alert', 'score']
+SUMMARY_FIELDS = ['video', 'status', 'duration_s', 'source_fps', 'frames_analyzed', 'frame_step',
+                  'stability_percentage', 'stability_score', 'max_movement', 'unstable_events',
+                  'pre_alerts', 'processing_s', 'error']
+
+
+def find_videos(directory: str, recursive: bool = False) -> List[str]:
+    """Lista os vídeos do diretório (ordem alfabética)"""
+    padrao = os.path.join(directory, '**', '*') if recursive else os.path.join(directory, '*')
+    return sorted(
+        caminho for caminho in glob.glob(padrao, recursive=recursive)
+        if os.path.isfile(caminho) and caminho.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+
+def series_names(videos: List[str], directory: str) -> List[str]:
+    """Nome único do CSV da série de cada vídeo (caminho relativo, com extensão)"""
+    nomes, usados = [], set()
+    for video in videos:
+        relativo = os.path.relpath(video, directory)
+        nome = relativo.replace(os.sep, '__').replace('/', '__')
+        base, n = nome, 1
+        while nome.lower() in usados:  # Ex.: 'a__b.mp4' e 'a/b.mp4'
+            n += 1
+            nome = f'{base}~{n}'
+        usados.add(nome.lower())
+        nomes.append(f'{nome}.csv')
+    return nomes
+
+
+def _init_worker():
+    # Um processo por núcleo: evita que cada um abra também um pool de threads do OpenCV
+    cv2.setNumThreads(1)
+
+
+def process_video(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Analisa um vídeo e grava sua série temporal
+
+    Roda no processo de trabalho; recebe e retorna apenas tipos simples.
+    """
+    caminho = job['video']
+    inicio = time.perf_counter()
+    resultado = {'video': caminho, 'status': 'ok', 'error': None}
+
+    cap = cv2.VideoCapture(caminho)
+    if not cap.isOpened():
+        resultado.update(status='error', error='não foi possível abrir o vídeo')
+        return resultado
+
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        analysis_fps = job.get('analysis_fps')
+        step = max(1, int(round(fps / analysis_fps))) if analysis_fps else 1
+
+        analyzer = MedicalHeadStabilityAnalyzer(
+            time_threshold=job['time_threshold'],
+            sensitivity=job['sensitivity'],
+            smoothing=job.get('smoothing', False)
+        )
+        # O construtor usa o threshold da sensibilidade; --threshold o substitui
+        if job.get('stability_threshold') is not None:
+            analyzer.stability_threshold = job['stability_threshold']
+        analyzer.frames_per_call = step  # Movimento continua medido por frame do vídeo
+
+        eventos = {'unstable': 0, 'pre_alert': 0}
+
+        def contar_evento(is_stable, reason):
+            if reason == 'pre_alert':
+                eventos['pre_alert'] += 1
+            elif not is_stable:
+                eventos['unstable'] += 1
+
+        analyzer.add_state_listener(contar_evento)
+
+        series_path = os.path.join(job['series_dir'], job['series_name'])
+        analisados = 0
+        indice = -1
+        timestamp = 0.0
+        with open(series_path, 'w', newline='', encoding='utf-8') as f:
+            escritor = csv.writer(f)
+            escritor.writerow(SERIES_FIELDS)
+            while True:
+                if not cap.grab():
+                    break
+                indice += 1
+                if indice % step:
+                    continue  # Frame pulado: não decodifica
+                ok, frame = cap.retrieve()
+                if not ok:
+                    continue
+                posicao = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                timestamp = posicao if posicao > 0 or indice == 0 else indice / fps
+
+                analyzer.analyze_stability(frame, timestamp=timestamp)
+                analisados += 1
+                detectado = analyzer.last_head_pos is not None
+                movimento = analyzer.last_movement if detectado else None
+                escritor.writerow([
+                    indice, f'{timestamp:.3f}', int(detectado),
+                    '' if movimento is None else f'{movimento:.2f}',
+                    int(analyzer.is_stable), int(analyzer.is_ready_for_procedure),
+                    int(analyzer.pre_alert), f'{analyzer.stability_score:.1f}'
+                ])
+
+        relatorio = analyzer.get_stability_report()
+        resultado.update({
+            'duration_s': round(timestamp, 2),
+            'source_fps': round(fps, 2),
+            'frames_analyzed': analisados,
+            'frame_step': step,
+            'stability_percentage': round(relatorio['stability_percentage'], 2),
+            'stability_score': round(relatorio['stability_score'], 2),
+            'max_movement': round(relatorio['max_movement'], 2),
+            'unstable_events': eventos['unstable'],
+            'pre_alerts': eventos['pre_alert'],
+            'series': series_path,
+            'report': {k: v for k, v in relatorio.items() if k not in ('motion', 'tracking')}
+        })
+        if analisados == 0:
+            resultado.update(status='error', error='nenhum frame decodificado')
+    except Exception as e:
+        resultado.update(status='error', error=str(e))
+    finally:
+        cap.release()
+
+    resultado['processing_s'] = round(time.perf_counter() - inicio, 2)
+    return resultado
+
+
+def write_summary(output_dir: str, resultados: List[Dict[str, Any]], parametros: Dict[str, Any]):
+    """Grava summary.json (completo) e summary.csv (uma linha por vídeo)"""
+    resumo = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'parameters': parametros,
+        'videos': resultados
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(resumo, f, indent=2, ensure_ascii=False)
+
+    with open(os.path.join(output_dir, 'summary.csv'), 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        escritor.writeheader()
+        for resultado in resultados:
+            escritor.writerow(resultado)
+
+
+def run_batch(directory: str, output_dir: str, workers: int = None, analysis_fps: float = None,
+              sensitivity: str = 'medium', stability_threshold: int = None, time_threshold: float = 3.0,
+              smoothing: bool = False, recursive: bool = False) -> List[Dict[str, Any]]:
+    """Processa todos os vídeos do diretório em paralelo"""
+    videos = find_videos(directory, recursive)
+    if not videos:
+        print(f"⚠️ Nenhum vídeo encontrado em {directory}")
+        return []
+
+    series_dir = os.path.join(output_dir, 'series')
+    os.makedirs(series_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(videos))
+
+    parametros = {
+        'directory': os.path.abspath(directory),
+        'analysis_fps': analysis_fps,
+        'sensitivity': sensitivity,
+        'stability_threshold': stability_threshold,
+        'time_threshold': time_threshold,
+        'smoothing': smoothing,
+        'workers': workers
+    }
+    jobs = [{
+        'video': video,
+        'series_dir': series_dir,
+        'series_name': nome,
+        'analysis_fps': analysis_fps,
+        'sensitivity': sensitivity,
+        'stability_threshold': stability_threshold,
+        'time_threshold': time_threshold,
+        'smoothing': smoothing
+    } for video, nome in zip(videos, series_names(videos, directory))]
+
+    print(f"🎞️ {len(videos)} vídeo(s), {workers} processo(s)")
+    inicio = time.perf_counter()
+    resultados = []
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for i, resultado in enumerate(pool.imap_unordered(process_video, jobs), 1):
+            resultados.append(resultado)
+            if resultado['status'] == 'ok':
+                print(f"✅ [{i}/{len(videos)}] {os.path.basename(resultado['video'])}: "
+                      f"{resultado['stability_percentage']:.1f}% estável, "
+                      f"{resultado['unstable_events']} movimento(s) ({resultado['processing_s']:.1f}s)")
+            else:
+                print(f"❌ [{i}/{len(videos)}] {os.path.basename(resultado['video'])}: {resultado['error']}")
+
+    resultados.sort(key=lambda r: r['video'])
+    write_summary(output_dir, resultados, parametros)
+    print(f"📊 Resumo gravado em {output_dir} ({time.perf_counter() - inicio:.1f}s)")
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Relatórios de estabilidade para um diretório de gravações')
+    parser.add_argument('directory', help='Diretório com os vídeos')
+    parser.add_argument('--output', '-o', default='resultados_lote', help='Diretório de saída')
+    parser.add_argument('--workers', '-j', type=int, default=None, help='Processos (padrão: núcleos)')
+    parser.add_argument('--analysis-fps', type=float, default=None,
+                        help='Taxa de análise; frames intermediários são pulados com grab()')
+    parser.add_argument('--sensitivity', choices=['high', 'medium', 'low'], default='medium')
+    parser.add_argument('--threshold', type=int, default=None, help='Movimento máximo (px/frame)')
+    parser.add_argument('--time-threshold', type=float, default=3.0, help='Tempo de estabilidade (s)')
+    parser.add_argument('--smoothing', action='store_true', help='Suaviza a trajetória (Kalman)')
+    parser.add_argument('--recursive', '-r', action='store_true', help='Inclui subdiretórios')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Diretório não encontrado: {args.directory}")
+        return 1
+
+    resultados = run_batch(args.directory, args.output, args.workers, args.analysis_fps,
+                           args.sensitivity, args.threshold, args.time_threshold,
+                           args.smoothing, args.recursive)
+    return 0 if resultados and all(r['status'] == 'ok' for r in resultados) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# Orçamento de Tempo por Frame com Degradação Gradual
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Quando a CPU satura, o loop de frames fica mais lento e a latência cresce.
+# O escalonador mede o custo de processamento de cada frame e, se o
+# orçamento (ex.: 33 ms) for estourado de forma sustentada, desliga
+# trabalho opcional numa ordem definida; quando volta a haver folga,
+# restaura os níveis um a um.
+
+from typing import Any, Dict
+
+# Níveis de degradação (cumulativos, na ordem em que são aplicados)
+DEGRADATION_LEVELS = [
+    {'name': 'completo', 'label': 'Qualidade completa', 'changes': {}},
+    {'name': 'overlay_simplificado', 'label': 'Overlay simplificado',
+     'changes': {'overlay_detail': False}},
+    {'name': 'deteccao_reduzida', 'label': 'Detecção em resolução reduzida',
+     'changes': {'detection_scale': 0.5}},
+    {'name': 'deteccao_intercalada', 'label': 'Detecção a cada 3 frames',
+     'changes': {'detection_interval': 3}},
+    {'name': 'jpeg_reduzido', 'label': 'Qualidade de vídeo reduzida',
+     'changes': {'jpeg_quality': 60}},
+]
+
+DEFAULT_SETTINGS = {
+    'overlay_detail': True,
+    'detection_scale': 1.0,
+    'detection_interval': 1,
+    'jpeg_quality': 85
+}
+
+
+class FrameBudgetScheduler:
+    """
+    Escalonador de orçamento de frame
+
+    O custo medido deve excluir a espera da câmera (cap.read bloqueia até o
+    próximo frame), senão uma câmera a 30 fps pareceria sempre no limite.
+    """
+
+    def __init__(self, budget_ms: float = 33.0, base_settings: Dict[str, Any] = None,
+                 degrade_after: int = 15, restore_after: int = 90,
+                 headroom: float = 0.7, smoothing: float = 0.2):
+        """
+        Args:
+            budget_ms: Orçamento de processamento por frame (milissegundos)
+            base_settings: Configuração do nível 0 (ex.: vinda da calibração)
+            degrade_after: Frames consecutivos acima do orçamento para degradar
+            restore_after: Frames consecutivos com folga para restaurar um nível
+            headroom: Fração do orçamento considerada folga para restauração
+            smoothing: Peso da média móvel exponencial do custo por frame
+        """
+        self.budget = budget_ms / 1000.0
+        self.base_settings = dict(DEFAULT_SETTINGS)
+        if base_settings:
+            self.base_settings.update(base_settings)
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+        self.headroom = headroom
+        self.smoothing = smoothing
+
+        self.level = 0
+        self.frame_cost = None  # Média móvel (segundos)
+        self._over_count = 0
+        self._under_count = 0
+        self.settings = self._compute_settings()
+
+    def _compute_settings(self) -> Dict[str, Any]:
+        """Aplica as mudanças cumulativas dos níveis sobre a configuração base"""
+        settings = dict(self.base_settings)
+        for nivel in DEGRADATION_LEVELS[1:self.level + 1]:
+            for chave, valor in nivel['changes'].items():
+                if chave == 'overlay_detail':
+                    settings[chave] = settings[chave] and valor
+                elif chave == 'detection_interval':
+                    settings[chave] = max(settings[chave], valor)
+                else:
+                    settings[chave] = min(settings[chave], valor)
+        return settings
+
+    def set_base_settings(self, base_settings: Dict[str, Any]):
+        """Troca a configuração do nível 0 (ex.: após calibração)"""
+        self.base_settings.update(base_settings)
+        self.settings = self._compute_settings()
+
+    def record_frame(self, seconds: float):
+        """Registra o custo de processamento de um frame e ajusta o nível"""
+        if self.frame_cost is None:
+            self.frame_cost = seconds
+        else:
+            self.frame_cost += self.smoothing * (seconds - self.frame_cost)
+
+        if self.frame_cost > self.budget:
+            self._over_count += 1
+            self._under_count = 0
+            if self._over_count >= self.degrade_after and self.level < len(DEGRADATION_LEVELS) - 1:
+                self._set_level(self.level + 1)
+        elif self.frame_cost < self.budget * self.headroom:
+            self._under_count += 1
+            self._over_count = 0
+            if self._under_count >= self.restore_after and self.level > 0:
+                self._set_level(self.level - 1)
+        else:
+            self._over_count = 0
+            self._under_count = 0
+
+    def _set_level(self, level: int):
+        anterior = self.level
+        self.level = level
+        self._over_count = 0
+        self._under_count = 0
+        self.settings = self._compute_settings()
+        print(f"⚙️ Orçamento de frame: nível {anterior} → {level} ({DEGRADATION_LEVELS[level]['label']})")
+
+    def apply_to(self, analyzer):
+        """Propaga resolução e cadência de detecção para o analisador"""
+        analyzer.detection_scale = self.settings['detection_scale']
+        analyzer.detection_interval = self.settings['detection_interval']
+
+    def status(self) -> Dict[str, Any]:
+        """Status para /get_status"""
+        nivel = DEGRADATION_LEVELS[self.level]
+        return {
+            'level': self.level,
+            'max_level': len(DEGRADATION_LEVELS) - 1,
+            'name': nivel['name'],
+            'label': nivel['label'],
+            'degraded': self.level > 0,
+            'budget_ms': round(self.budget * 1000, 1),
+            'frame_ms': round(self.frame_cost * 1000, 1) if self.frame_cost is not None else None,
+            'settings': dict(self.settings)
+        }
@@ -0,0 +1,198 @@
+# Calibração de Desempenho na Inicialização
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Mede, na própria máquina e na resolução real da câmera, o custo da
+# detecção em cada resolução/cadência e da codificação JPEG em cada
+# qualidade, e escolhe a configuração mais completa que cabe no FPS alvo.
+# O resultado é salvo por máquina, para que carrinhos mais lentos passem a
+# usar automaticamente uma configuração mais barata.
+
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import cv2
+
+from medical_metrics import metrics
+
+DETECTION_SCALES = (1.0, 0.75, 0.5, 0.35)
+DETECTION_INTERVALS = (1, 2, 3)
+JPEG_QUALITIES = (95, 85, 75, 60)
+
+DEFAULT_CALIBRATION_FILE = os.path.join(os.path.expanduser('~'), '.estabilidade_cranio', 'calibration.json')
+BUDGET_FRACTION = 0.8  # Reserva 20% do tempo de frame para captura e servidor
+
+
+def calibration_file() -> str:
+    return os.environ.get('ESTABILIDADE_CALIBRATION_FILE', DEFAULT_CALIBRATION_FILE)
+
+
+def machine_key(frame) -> str:
+    """Chave da calibração: máquina + resolução da câmera"""
+    height, width = frame.shape[:2]
+    return f"{platform.node() or 'local'}:{width}x{height}"
+
+
+def _time_call(func, repeats: int) -> float:
+    """Tempo médio de uma chamada (segundos), descartando o aquecimento"""
+    func()
+    inicio = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - inicio) / repeats
+
+
+def benchmark(analyzer, frame, repeats: int = 10) -> Dict[str, Any]:
+    """
+    Mede custos de cada opção do pipeline no frame informado
+
+    Returns:
+        Dicionário com custos (ms) de detecção por escala, overlay e JPEG por qualidade
+    """
+    # As medições não entram nos histogramas de produção (/metrics)
+    with metrics.suppressed():
+        return _benchmark(analyzer, frame, repeats)
+
+
+def _benchmark(analyzer, frame, repeats: int) -> Dict[str, Any]:
+    escala_original = analyzer.detection_scale
+    deteccao = {}
+    try:
+        for scale in DETECTION_SCALES:
+            analyzer.detection_scale = scale
+            deteccao[scale] = _time_call(lambda: analyzer.detect_head_position(frame), repeats) * 1000
+    finally:
+        analyzer.detection_scale = escala_original
+
+    jpeg = {}
+    for quality in JPEG_QUALITIES:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        jpeg[quality] = _time_call(lambda: cv2.imencode('.jpg', frame, params), repeats) * 1000
+
+    # Só o desenho: com total_frames > 0 o overlay usa last_head_pos em vez
+    # de detectar de novo (num analisador recém-criado detectaria a cada chamada)
+    head_pos, _ = analyzer.detect_head_position(frame)
+    if head_pos is None:
+        altura, largura = frame.shape[:2]
+        head_pos = (largura // 3, altura // 4, largura // 3, altura // 2)  # Caixa típica, centralizada
+    estado_original = (analyzer.last_head_pos, analyzer.total_frames)
+    analyzer.last_head_pos, analyzer.total_frames = head_pos, max(1, analyzer.total_frames)
+    try:
+        overlay = _time_call(lambda: analyzer.draw_stability_info(frame.copy()), repeats) * 1000
+    finally:
+        analyzer.last_head_pos, analyzer.total_frames = estado_original
+
+    return {'detection_ms': deteccao, 'jpeg_ms': jpeg, 'overlay_ms': overlay}
+
+
+def choose_settings(medicoes: Dict[str, Any], target_fps: float = 30.0) -> Dict[str, Any]:
+    """
+    Escolhe a configuração mais completa que cabe no orçamento
+
+    Preferência: menor intervalo entre detecções, depois maior resolução de
+    detecção, depois maior qualidade JPEG (a mesma ordem de DEGRADATION_LEVELS:
+    reduzir a resolução antes de pular frames, que atrasa o alarme). Se nada
+    couber, usa a mais barata.
+    """
+    orcamento_ms = 1000.0 / target_fps * BUDGET_FRACTION
+    candidatos = []
+    for scale in DETECTION_SCALES:
+        for interval in DETECTION_INTERVALS:
+            for quality in JPEG_QUALITIES:
+                custo = (medicoes['detection_ms'][scale] / interval
+                         + medicoes['overlay_ms'] + medicoes['jpeg_ms'][quality])
+                candidatos.append((custo, scale, interval, quality))
+
+    def preferencia(candidato):
+        _, scale, interval, quality = candidato
+        return (interval, -scale, -quality)
+
+    for custo, scale, interval, quality in sorted(candidatos, key=preferencia):
+        if custo <= orcamento_ms:
+            break
+    else:
+        custo, scale, interval, quality = min(candidatos)
+
+    return {
+        'detection_scale': scale,
+        'detection_interval': interval,
+        'jpeg_quality': quality,
+        'estimated_frame_ms': round(custo, 2),
+        'budget_ms': round(orcamento_ms, 2),
+        'target_fps': target_fps
+    }
+
+
+def load_calibration(frame) -> Optional[Dict[str, Any]]:
+    """Carrega a calibração salva para esta máquina e resolução"""
+    caminho = calibration_file()
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+    except (OSError, ValueError):
+        return None
+    registro = dados.get(machine_key(frame))
+    if not registro or registro.get('opencv') != cv2.__version__:
+        return None
+    return registro
+
+
+def save_calibration(frame, registro: Dict[str, Any]):
+    """Salva a calibração desta máquina (escrita atômica)"""
+    caminho = calibration_file()
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+    except (OSError, ValueError):
+        dados = {}
+    dados[machine_key(frame)] = registro
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def calibrate(analyzer, frame, target_fps: float = 30.0, force: bool = False, save: bool = True) -> Dict[str, Any]:
+    """
+    Retorna as configurações do pipeline para esta máquina
+
+    Usa a calibração salva, se existir; caso contrário (ou com force=True)
+    executa o benchmark e salva o resultado.
+    """
+    if not force:
+        registro = load_calibration(frame)
+        if registro and registro['settings'].get('target_fps') == target_fps:
+            print(f"⚙️ Calibração carregada ({machine_key(frame)})")
+            return registro['settings']
+
+    print("⚙️ Calibrando desempenho do pipeline...")
+    medicoes = benchmark(analyzer, frame)
+    settings = choose_settings(medicoes, target_fps)
+    registro = {
+        'settings': settings,
+        'measurements': {
+            'detection_ms': {str(k): round(v, 3) for k, v in medicoes['detection_ms'].items()},
+            'jpeg_ms': {str(k): round(v, 3) for k, v in medicoes['jpeg_ms'].items()},
+            'overlay_ms': round(medicoes['overlay_ms'], 3)
+        },
+        'opencv': cv2.__version__,
+        'calibrated_at': datetime.now().isoformat(timespec='seconds')
+    }
+    if save:
+        try:
+            save_calibration(frame, registro)
+        except OSError as e:
+            print(f"⚠️ Não foi possível salvar a calibração: {e}")
+    print(f"⚙️ Calibração: detecção {settings['detection_scale']:.2f}x a cada "
+          f"{settings['detection_interval']} frame(s), JPEG {settings['jpeg_quality']} "
+          f"(~{settings['estimated_frame_ms']:.1f} ms/frame)")
+    return settings
+
+
+def pipeline_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Extrai apenas as chaves usadas pelo FrameBudgetScheduler"""
+    return {k: settings[k] for k in ('detection_scale', 'detection_interval', 'jpeg_quality') if k in settings}
@@ -0,0 +1,276 @@
+# Fontes de Captura
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Abstração sobre a origem dos frames: câmera ao vivo, arquivo de vídeo ou
+# diretório com sequência de imagens. Todas expõem a interface do
+# cv2.VideoCapture usada pelos apps (read, isOpened, release, set, get) e o
+# instante de cada frame em `timestamp`, para ser passado a
+# analyze_stability. Gravações podem ser reproduzidas no ritmo real
+# (pace='realtime') ou o mais rápido possível (pace='fast'), permitindo
+# reproduzir problemas de campo e medir desempenho sem câmera.
+#
+# Nos apps, a fonte é escolhida pela variável ESTABILIDADE_SOURCE (índice da
+# câmera, caminho de vídeo ou diretório de imagens) e o ritmo por
+# ESTABILIDADE_PACE; ESTABILIDADE_LOOP=1 repete a gravação indefinidamente.
+
+import glob
+import os
+import time
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+PACES = ('realtime', 'fast')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+
+class CaptureSource:
+    """Interface comum: read() -> (ok, frame) e timestamp do último frame"""
+
+    live = False
+
+    def __init__(self):
+        self.timestamp = None  # Instante do último frame (segundos)
+        self.frame_index = -1
+        self.finished = False
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def read_timestamped(self) -> Tuple[bool, Optional[np.ndarray], Optional[float]]:
+        ok, frame = self.read()
+        return ok, frame, self.timestamp
+
+    def isOpened(self) -> bool:
+        return False
+
+    def release(self):
+        pass
+
+    def set(self, prop, value) -> bool:
+        return False
+
+    def get(self, prop) -> float:
+        return 0.0
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+
+class CameraSource(CaptureSource):
+    """Câmera ao vivo; o timestamp é o relógio do sistema no momento da leitura"""
+
+    live = True
+
+    def __init__(self, capture: Union[int, cv2.VideoCapture] = 0, backend: int = None, clock=time.time):
+        super().__init__()
+        if isinstance(capture, cv2.VideoCapture):
+            self.capture = capture
+            self.index = None
+        else:
+            self.index = capture
+            self.capture = (cv2.VideoCapture(capture, backend) if backend is not None
+                            else cv2.VideoCapture(capture))
+        self.clock = clock
+
+    def read(self):
+        ok, frame = self.capture.read()
+        if ok:
+            self.timestamp = self.clock()
+            self.frame_index += 1
+        return ok, frame
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def describe(self):
+        return f"câmera {self.index}" if self.index is not None else "câmera"
+
+
+class _ReplaySource(CaptureSource):
+    """
+    Base das fontes gravadas: timestamps vêm da gravação (não do relógio)
+
+    Em pace='realtime' a leitura espera até o instante do frame; em 'fast'
+    retorna imediatamente. Com loop=True, a gravação recomeça ao terminar e
+    os timestamps continuam crescendo.
+    """
+
+    def __init__(self, pace: str = 'realtime', loop: bool = False):
+        super().__init__()
+        if pace not in PACES:
+            raise ValueError(f"pace deve ser um de {PACES}, recebido '{pace}'")
+        self.pace = pace
+        self.loop = loop
+        self._offset = 0.0  # Duração acumulada das voltas anteriores
+        self._started_at = None  # Relógio no primeiro frame (pace realtime)
+
+    def _next_frame(self) -> Tuple[bool, Optional[np.ndarray], float]:
+        """Próximo frame e seu instante relativo ao início da gravação"""
+        raise NotImplementedError
+
+    def _rewind(self) -> float:
+        """Volta ao início; retorna a duração da volta concluída"""
+        raise NotImplementedError
+
+    def read(self):
+        if self.finished:
+            return False, None
+        ok, frame, instante = self._next_frame()
+        if not ok and self.loop and self.frame_index >= 0:
+            self._offset += self._rewind()
+            ok, frame, instante = self._next_frame()
+        if not ok:
+            self.finished = True
+            return False, None
+
+        self.frame_index += 1
+        self.timestamp = self._offset + instante
+        if self.pace == 'realtime':
+            agora = time.monotonic()
+            if self._started_at is None:
+                self._started_at = agora - self.timestamp
+            espera = self._started_at + self.timestamp - agora
+            if espera > 0:
+                time.sleep(espera)
+            elif espera < -1.0:
+                # Consumidor pausou (ex.: calibração): retoma o ritmo a partir daqui
+                self._started_at = agora - self.timestamp
+        return True, frame
+
+
+class VideoFileSource(_ReplaySource):
+    """Arquivo de vídeo; timestamps pela posição no vídeo (ou índice / fps)"""
+
+    def __init__(self, path: str, pace: str = 'realtime', loop: bool = False, fps: float = None):
+        super().__init__(pace, loop)
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self._local_index = -1
+        self._last_instant = 0.0
+
+    def _next_frame(self):
+        ok, frame = self.capture.read()
+        if not ok:
+            return False, None, 0.0
+        self._local_index += 1
+        posicao = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        # Alguns backends retornam 0 ou valores não monotônicos: usa índice / fps
+        if posicao <= 0 and self._local_index > 0 or posicao < self._last_instant:
+            posicao = self._local_index / self.fps
+        self._last_instant = posicao
+        return True, frame, posicao
+
+    def _rewind(self):
+        duracao = self._last_instant + 1.0 / self.fps
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._local_index = -1
+        self._last_instant = 0.0
+        return duracao
+
+    def grab(self) -> bool:
+        """Avança um frame sem decodificar (para pular frames rapidamente)"""
+        ok = self.capture.grab()
+        if ok:
+            self._local_index += 1
+            self.frame_index += 1
+        return ok
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def describe(self):
+        return f"vídeo {os.path.basename(self.path)} ({self.pace})"
+
+
+class ImageSequenceSource(_ReplaySource):
+    """Diretório de imagens (ordem alfabética), tocado a `fps` quadros por segundo"""
+
+    def __init__(self, directory: str, fps: float = 30.0, pace: str = 'realtime', loop: bool = False):
+        super().__init__(pace, loop)
+        self.directory = directory
+        self.fps = fps
+        self.files = sorted(
+            caminho for caminho in glob.glob(os.path.join(directory, '*'))
+            if caminho.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self._position = 0
+
+    def _next_frame(self):
+        while self._position < len(self.files):
+            caminho = self.files[self._position]
+            instante = self._position / self.fps
+            self._position += 1
+            frame = cv2.imread(caminho)
+            if frame is not None:
+                return True, frame, instante
+            print(f"⚠️ Imagem ilegível ignorada: {caminho}")
+        return False, None, 0.0
+
+    def _rewind(self):
+        self._position = 0
+        return len(self.files) / self.fps
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.files)
+        return 0.0
+
+    def describe(self):
+        return f"sequência {self.directory} ({len(self.files)} imagens, {self.pace})"
+
+
+def open_source(spec: Union[int, str], pace: str = 'realtime', loop: bool = False,
+                backend: int = None) -> CaptureSource:
+    """
+    Abre uma fonte a partir de um índice de câmera, arquivo de vídeo ou diretório
+
+    Raises:
+        ValueError: Se o caminho não existir ou o ritmo for inválido
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec), backend)
+    if os.path.isdir(spec):
+        return ImageSequenceSource(spec, pace=pace, loop=loop)
+    if os.path.isfile(spec):
+        return VideoFileSource(spec, pace=pace, loop=loop)
+    raise ValueError(f"Fonte de captura não encontrada: {spec}")
+
+
+def source_from_env(pace: str = None, loop: bool = None) -> Optional[CaptureSource]:
+    """Fonte definida em ESTABILIDADE_SOURCE (None se não configurada)"""
+    spec = os.environ.get('ESTABILIDADE_SOURCE')
+    if not spec:
+        return None
+    if pace is None:
+        pace = os.environ.get('ESTABILIDADE_PACE', 'realtime')
+    if loop is None:
+        loop = os.environ.get('ESTABILIDADE_LOOP') == '1'
+    source = open_source(spec, pace=pace, loop=loop)
+    print(f"🎞️ Fonte de captura: {source.describe()}")
+    return source
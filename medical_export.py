@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Exportação de Trajetórias e Sessões (CSV / Parquet)
+Sistema Médico de Estabilidade da Cabeça
+
+Gera a exportação em blocos, direto dos arquivos de trajetória (um bloco
+.npy por vez, mapeado em memória) e do banco de sessões (cursor com
+fetchmany): a memória usada não depende do tamanho da exportação e o
+primeiro bloco fica pronto imediatamente, o que permite servir exportações
+de vários GB como download em streaming (rota /api/export/<tipo>).
+
+Parquet é opcional e requer pyarrow; cada bloco vira um row group.
+
+Uso:
+    python medical_export.py traces --since 2025-01-01 --format parquet -o trajetorias.parquet
+    python medical_export.py sessions --room sala-1 -o sessoes.csv
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from medical_recorder import FLAG_PRE_ALERT, load_chunks, sessions_dir
+from medical_store import SessionStore
+
+FORMATS = ('csv', 'parquet')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'parquet': 'application/vnd.apache.parquet'}
+
+TRACE_FIELDS = ['session_id', 't', 'cx', 'cy', 'w', 'h', 'movement', 'state', 'pre_alert']
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ===== FONTES =====
+
+def trace_path(session: Dict[str, Any]) -> str:
+    """Diretório da trajetória de uma sessão do banco"""
+    return session.get('trace_path') or os.path.join(sessions_dir(), session['id'])
+
+
+def iter_trace_blocks(sessions: Iterable[Dict[str, Any]]) -> Iterator[tuple]:
+    """(session_id, bloco numpy) para cada bloco gravado das sessões, em ordem"""
+    for sessao in sessions:
+        caminho = trace_path(sessao)
+        if not os.path.isdir(caminho):
+            continue
+        for bloco in load_chunks(caminho, mmap=True):
+            if len(bloco):
+                yield sessao['id'], bloco
+
+
+def sessions_from_store(store: SessionStore, ids: List[str] = None, **filtros) -> Iterator[Dict[str, Any]]:
+    """Sessões selecionadas por id ou pelos filtros de iter_sessions"""
+    if ids:
+        for session_id in ids:
+            sessao = store.get_session(session_id)
+            yield sessao if sessao is not None else {'id': session_id}
+        return
+    for linhas in store.iter_sessions(**filtros):
+        for linha in linhas:
+            yield {'id': linha['id'], 'trace_path': linha['trace_path']}
+
+
+# ===== CSV =====
+
+def _csv_chunk(linhas: Iterable[Iterable[Any]], header: List[str] = None) -> bytes:
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    if header:
+        escritor.writerow(header)
+    escritor.writerows(linhas)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _trace_rows(session_id: str, bloco: np.ndarray) -> Iterator[tuple]:
+    estado = bloco['state']
+    colunas = [np.round(bloco['t'], 4).tolist()] + [
+        np.round(bloco[campo].astype(float), 2).tolist() for campo in ('cx', 'cy', 'w', 'h', 'movement')
+    ] + [(estado & 0x0F).tolist(), ((estado & FLAG_PRE_ALERT) > 0).astype(int).tolist()]
+    for linha in zip(*colunas):
+        # NaN (sem detecção) vira campo vazio
+        yield (session_id,) + tuple('' if isinstance(v, float) and v != v else v for v in linha)
+
+
+def traces_csv(blocks: Iterable[tuple]) -> Iterator[bytes]:
+    yield _csv_chunk([], TRACE_FIELDS)
+    for session_id, bloco in blocks:
+        yield _csv_chunk(_trace_rows(session_id, bloco))
+
+
+def sessions_csv(store: SessionStore, **filtros) -> Iterator[bytes]:
+    colunas = [nome for nome, _ in store.session_columns()]
+    yield _csv_chunk([], colunas)
+    for linhas in store.iter_sessions(**filtros):
+        yield _csv_chunk(['' if linha[c] is None else linha[c] for c in colunas] for linha in linhas)
+
+
+# ===== PARQUET =====
+
+class _StreamSink(io.RawIOBase):
+    """Destino do ParquetWriter que acumula bytes até serem retirados com drain()"""
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def drain(self) -> bytes:
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _parquet_stream(schema, tables: Iterable[Any]) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for tabela in tables:
+            writer.write_table(tabela)
+            dados = sink.drain()
+            if dados:
+                yield dados
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def traces_parquet(blocks: Iterable[tuple]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema([
+        ('session_id', pa.string()), ('t', pa.float64()),
+        ('cx', pa.float32()), ('cy', pa.float32()), ('w', pa.float32()), ('h', pa.float32()),
+        ('movement', pa.float32()), ('state', pa.uint8()), ('pre_alert', pa.bool_())
+    ])
+
+    def tabelas():
+        for session_id, bloco in blocks:
+            estado = np.asarray(bloco['state'])
+            colunas = [pa.array([session_id] * len(bloco), pa.string())]
+            colunas += [pa.array(np.asarray(bloco[c]), from_pandas=True)
+                        for c in ('t', 'cx', 'cy', 'w', 'h', 'movement')]
+            colunas += [pa.array(estado & 0x0F), pa.array((estado & FLAG_PRE_ALERT) > 0)]
+            yield pa.Table.from_arrays(colunas, schema=schema)
+
+    return _parquet_stream(schema, tabelas())
+
+
+def sessions_parquet(store: SessionStore, **filtros) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    tipos = {'TEXT': pa.string(), 'REAL': pa.float64(), 'INTEGER': pa.int64()}
+    colunas = store.session_columns()
+    schema = pa.schema([(nome, tipos.get(tipo.upper(), pa.string())) for nome, tipo in colunas])
+
+    def tabelas():
+        for linhas in store.iter_sessions(**filtros):
+            yield pa.Table.from_pylist([dict(linha) for linha in linhas], schema=schema)
+
+    return _parquet_stream(schema, tabelas())
+
+
+# ===== ENTRADA ÚNICA =====
+
+def export(kind: str, fmt: str, store: SessionStore, ids: List[str] = None, **filtros) -> Iterator[bytes]:
+    """
+    Exportação em blocos de bytes
+
+    Args:
+        kind: 'traces' (trajetórias por frame) ou 'sessions' (resumos)
+        fmt: 'csv' ou 'parquet'
+        ids: Sessões específicas (apenas traces); senão usa os filtros
+            room, procedure_type, since, until
+
+    Raises:
+        ValueError: Tipo ou formato inválido
+        RuntimeError: Parquet sem pyarrow instalado
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"formato deve ser um de {FORMATS}, recebido '{fmt}'")
+    if fmt == 'parquet' and not parquet_available():
+        raise RuntimeError("Exportação Parquet requer pyarrow (pip install pyarrow)")
+    if kind == 'traces':
+        blocos = iter_trace_blocks(sessions_from_store(store, ids, **filtros))
+        return traces_csv(blocos) if fmt == 'csv' else traces_parquet(blocos)
+    if kind == 'sessions':
+        return sessions_csv(store, **filtros) if fmt == 'csv' else sessions_parquet(store, **filtros)
+    raise ValueError(f"tipo de exportação deve ser 'traces' ou 'sessions', recebido '{kind}'")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exporta trajetórias ou sessões em CSV/Parquet')
+    parser.add_argument('kind', choices=['traces', 'sessions'])
+    parser.add_argument('--format', '-f', choices=FORMATS, default=None,
+                        help='Padrão: pela extensão da saída, ou csv')
+    parser.add_argument('--output', '-o', default='-', help="Arquivo de saída ('-' = stdout)")
+    parser.add_argument('--db', default=None, help='Banco de sessões (padrão: ESTABILIDADE_DB)')
+    parser.add_argument('--session', action='append', dest='ids', help='Sessão específica (repetível)')
+    parser.add_argument('--room', default=None)
+    parser.add_argument('--procedure', default=None)
+    parser.add_argument('--since', default=None, help='Data inicial AAAA-MM-DD')
+    parser.add_argument('--until', default=None, help='Data final AAAA-MM-DD')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    store = SessionStore(args.db)
+    if not os.path.exists(store.path):
+        print(f"❌ Banco de sessões não encontrado: {store.path}", file=sys.stderr)
+        return 1
+
+    try:
+        blocos = export(args.kind, fmt, store, ids=args.ids, room=args.room, procedure_type=args.procedure,
+                        since=args.since, until=args.until)
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    saida = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    total = 0
+    try:
+        for dados in blocos:
+            saida.write(dados)
+            total += len(dados)
+    finally:
+        if saida is not sys.stdout.buffer:
+            saida.close()
+    if args.output != '-':
+        print(f"💾 {total / 1e6:.1f} MB exportados para {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,23 @@
 import cv2
 import numpy as np
 from collections import deque
+import threading
 import time
 import math
+from medical_metrics import metrics
+from medical_models import models
+from medical_motion import HeadTrackFilter, MovementOnsetDetector
+from medical_stats import SessionStats
+
+# Threshold (px/frame) e janela do score (detecções) por sensibilidade
+SENSITIVITY_CONFIG = {
+    'high': {'threshold': 5, 'min_detections': 20},
+    'medium': {'threshold': 10, 'min_detections': 15}, 
+    'low': {'threshold': 20, 'min_detections': 10}
+}
+
+# Movimentos retidos para reavaliar o estado quando os thresholds mudam (~1 min a 30 fps)
+MOTION_HISTORY_FRAMES = 1800
 
 class MedicalHeadStabilityAnalyzer:
     """
@@ -14,32 +29,30 @@ class MedicalHeadStabilityAnalyzer:
     - Radiografia da Cabeça (Raio-X)
     """
     
-    def __init__(self, stability_threshold=10, time_threshold=3.0, sensitivity='medium'):
+    def __init__(self, stability_threshold=10, time_threshold=3.0, sensitivity='medium', prediction=True,
+                 smoothing=False, skip_uncertainty=2.5, max_skipped_detections=2, clock=None):
         # Configurações de estabilidade
         self.stability_threshold = stability_threshold  # Pixels de movimento máximo
         self.time_threshold = time_threshold  # Tempo necessário de estabilidade (segundos)
         
         # Configurações de sensibilidade
-        sensitivity_config = {
-            'high': {'threshold': 5, 'min_detections': 20},
-            'medium': {'threshold': 10, 'min_detections': 15}, 
-            'low': {'threshold': 20, 'min_detections': 10}
-        }
-        
-        config = sensitivity_config.get(sensitivity, sensitivity_config['medium'])
+        config = SENSITIVITY_CONFIG.get(sensitivity, SENSITIVITY_CONFIG['medium'])
         self.stability_threshold = config['threshold']
         self.min_detections = config['min_detections']
         
-        # Detectores
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
         # Histórico de posições
         self.position_history = deque(maxlen=30)  # 30 frames de histórico
         self.stability_history = deque(maxlen=100)  # Histórico de estabilidade
+        # Movimentos medidos (instante, px/frame); None marca perda da cabeça
+        self.motion_history = deque(maxlen=MOTION_HISTORY_FRAMES)
+        self._evicted_max = 0.0  # Maior movimento já descartado do trecho atual
+        self._evicted_start = None  # Início do trecho atual, se já descartado
         
-        # Controle temporal
+        # Controle temporal (clock injetável; analyze_stability também aceita o timestamp do frame)
+        self.clock = clock or time.time
         self.stable_start_time = None
-        self.last_detection_time = time.time()
+        self.last_detection_time = self.clock()
+        self.last_frame_time = None
         
         # Status do sistema
         self.is_stable = False
@@ -51,16 +64,87 @@ class MedicalHeadStabilityAnalyzer:
         self.total_frames = 0
         self.stable_frames = 0
         self.max_movement = 0
+        self.last_movement = None  # Movimento por frame da última detecção (px)
+        self.stats = SessionStats()  # Quantis, histograma e tempo em cada estado (memória constante)
+        
+        # Custo da detecção (ajustado pelo escalonador de orçamento de frame)
+        self.detection_scale = 1.0  # Fator de redução da imagem antes da detecção
+        self.detection_interval = 1  # Detecta a cada N frames
+        self.frames_since_detection = 0
+        self.frames_per_call = 1  # Frames da fonte por chamada (análise subamostrada de vídeo)
+        self.last_head_pos = None
+        self.last_faces = ()
+        
+        # Predição de movimento (pré-alerta antes de ultrapassar o threshold)
+        self.motion = MovementOnsetDetector() if prediction else None
+        self.pre_alert = False
+        self.pre_alert_since = None
+        
+        # Suavização da trajetória (Kalman sobre centro e tamanho da caixa)
+        self.tracker = HeadTrackFilter() if smoothing else None
+        self.skip_uncertainty = skip_uncertainty  # Incerteza (px) abaixo da qual pode pular detecções
+        self.max_skipped_detections = max_skipped_detections
+        
+        # Ouvintes de mudança de estado (ex.: alarme de movimento)
+        self._state_listeners = []
+        
+        # Rotas (update_thresholds, reset_analysis) rodam em outras threads que
+        # não a do loop de frames; o estado só é alterado com este lock
+        self._lock = threading.RLock()
         
+    def add_state_listener(self, callback):
+        """
+        Registra callback(is_stable, reason) chamado na transição de estado
+        
+        É chamado de dentro de analyze_stability, no mesmo frame em que a
+        transição é detectada; deve retornar rápido (apenas sinalizar outra
+        thread). reason: 'stable', 'movement', 'head_lost', 'pre_alert'
+        (movimento em formação, ainda estável) ou 'reconfigured' (mudança
+        causada por update_thresholds, não pelo paciente).
+        """
+        if callback not in self._state_listeners:
+            self._state_listeners.append(callback)
+    
+    def remove_state_listener(self, callback):
+        """Remove um ouvinte registrado com add_state_listener"""
+        if callback in self._state_listeners:
+            self._state_listeners.remove(callback)
+    
+    def _notify_state(self, is_stable, reason):
+        for callback in list(self._state_listeners):
+            try:
+                callback(is_stable, reason)
+            except Exception as e:
+                print(f"⚠️ Erro em ouvinte de estado: {e}")
+        
+    @property
+    def face_cascade(self):
+        """Classificador Haar da thread atual (compartilhado pelo registro de modelos)"""
+        return models.cascade('frontalface')
+    
     def detect_head_position(self, frame):
         """Detecta a posição da cabeça no frame"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1, 
-            minNeighbors=5, 
-            minSize=(50, 50)
-        )
+        with metrics.stage('color_conversion'):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        scale = self.detection_scale
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            min_size = max(20, int(50 * scale))
+        else:
+            min_size = 50
+        
+        with metrics.stage('detection'):
+            faces = self.face_cascade.detectMultiScale(
+                gray, 
+                scaleFactor=1.1, 
+                minNeighbors=5, 
+                minSize=(min_size, min_size)
+            )
+        
+        # Volta as caixas para a resolução original
+        if scale < 1.0 and len(faces) > 0:
+            faces = [tuple(int(round(v / scale)) for v in face) for face in faces]
         
         if len(faces) > 0:
             # Pega o maior rosto detectado
@@ -84,20 +168,61 @@ class MedicalHeadStabilityAnalyzer:
         dy = current_pos[1] - previous_pos[1]
         return math.sqrt(dx*dx + dy*dy)
     
-    def analyze_stability(self, frame):
-        """Analisa a estabilidade da cabeça"""
+    def analyze_stability(self, frame, timestamp=None):
+        """
+        Analisa a estabilidade da cabeça
+        
+        Args:
+            frame: Frame BGR
+            timestamp: Instante do frame em segundos (ex.: posição no vídeo
+                gravado). Se omitido, usa o clock do analisador. Com
+                timestamps, vídeos podem ser processados mais rápido que o
+                tempo real sem alterar as durações de estabilidade.
+        """
+        with self._lock:
+            return self._analyze_stability(frame, timestamp)
+    
+    def _analyze_stability(self, frame, timestamp):
         self.total_frames += 1
-        current_time = time.time()
+        current_time = timestamp if timestamp is not None else self.clock()
+        self.frames_since_detection += 1
+        self.stats.advance(current_time, self.state_name)
+        self.last_frame_time = current_time
+        
+        # Detecção intercalada: nos frames pulados mantém o estado e só atualiza o tempo
+        if self.last_head_pos is not None and (
+                self.frames_since_detection < self.detection_interval or self._tracker_confident()):
+            return self._refresh_stable_time(current_time)
         
         # Detecta posição da cabeça
         head_pos, all_faces = self.detect_head_position(frame)
+        frames_elapsed = self.frames_since_detection * self.frames_per_call
+        self.frames_since_detection = 0
+        self.last_faces = all_faces
+        
+        # Com suavização, todo o cálculo de movimento usa a posição filtrada
+        if head_pos is not None and self.tracker is not None:
+            head_pos = self.tracker.update(head_pos, frames_elapsed)
+            self.last_head_pos = tuple(int(round(v)) for v in head_pos)
+        else:
+            self.last_head_pos = head_pos
         
         if head_pos is None:
             self.message = "❌ Cabeça não detectada - Posicione-se na frente da câmera"
+            was_stable = self.is_stable
             self.is_stable = False
             self.is_ready_for_procedure = False
             self.stability_score = 0.0
             self.stable_start_time = None
+            if self.motion:
+                self.motion.reset()
+            if self.tracker:
+                self.tracker.reset()
+            self._end_pre_alert(current_time, confirmed=was_stable)
+            if self.motion_history and self.motion_history[-1][1] is not None:
+                self._remember_motion(current_time, None)
+            if was_stable:
+                self._notify_state(False, 'head_lost')
             return False
         
         # Adiciona posição atual ao histórico
@@ -110,7 +235,20 @@ class MedicalHeadStabilityAnalyzer:
             return False
         
         # Calcula movimento
-        movement = self.calculate_movement(head_pos, self.position_history[-2])
+        with metrics.stage('movement'):
+            movement = self.calculate_movement(head_pos, self.position_history[-2])
+            # Com detecção intercalada, normaliza para movimento por frame
+            if frames_elapsed > 1:
+                movement /= frames_elapsed
+            self.last_movement = movement
+            self.stats.observe_movement(movement)
+            self._remember_motion(current_time, movement)
+            if self.motion is None:
+                onset = False
+            elif self.tracker is not None:
+                onset = self.motion.evaluate(self.tracker.velocity[:2], self.stability_threshold, frames_elapsed)
+            else:
+                onset = self.motion.update(head_pos[:2], self.stability_threshold, frames_elapsed)
         self.max_movement = max(self.max_movement, movement)
         
         # Verifica estabilidade
@@ -141,30 +279,195 @@ class MedicalHeadStabilityAnalyzer:
                 remaining_time = max(0, self.time_threshold - stable_duration)
                 self.message = f"⏳ Mantendo posição... {remaining_time:.1f}s restantes"
             
-            self.is_stable = True
+            if not self.is_stable:
+                self.is_stable = True
+                self._notify_state(True, 'stable')
+            
+            # Pré-alerta: ainda dentro do threshold, mas o movimento está se formando
+            if onset:
+                self.message = (f"🟠 Movimento iniciando ({self.motion.speed:.1f}px/frame) "
+                                f"- Mantenha a cabeça imóvel")
+                if not self.pre_alert:
+                    self.pre_alert = True
+                    self.pre_alert_since = current_time
+                    self._notify_state(True, 'pre_alert')
+            else:
+                self._end_pre_alert(current_time, confirmed=False)
             
         else:
             # Não está estável
             self.stable_start_time = None
+            was_stable = self.is_stable
             self.is_stable = False
             self.is_ready_for_procedure = False
             self.stability_score = max(0, self.stability_score - 10)  # Decrementa score
             self.message = f"⚠️ Movimento detectado ({movement:.1f}px) - Mantenha a cabeça imóvel"
+            self._end_pre_alert(current_time, confirmed=was_stable)
+            if was_stable:
+                self._notify_state(False, 'movement')
+        
+        return self.is_ready_for_procedure
+    
+    def _remember_motion(self, instante, movimento):
+        """Guarda o movimento; ao descartar o mais antigo, resume-o em contadores"""
+        if len(self.motion_history) == self.motion_history.maxlen:
+            antigo_t, antigo_m = self.motion_history[0]
+            if antigo_m is None:
+                self._evicted_max = 0.0
+                self._evicted_start = None
+            else:
+                self._evicted_max = max(self._evicted_max, antigo_m)
+                if self._evicted_start is None:
+                    self._evicted_start = antigo_t
+        self.motion_history.append((instante, movimento))
+    
+    def update_thresholds(self, stability_threshold=None, time_threshold=None, sensitivity=None):
+        """
+        Troca os thresholds sem reiniciar a análise
+        
+        O histórico de movimentos retido é reavaliado com os novos valores:
+        um paciente parado há 20 s continua estável (e pronto) se também o
+        estiver pelo novo critério. sensitivity define threshold e janela do
+        score; um stability_threshold explícito prevalece sobre o da
+        sensibilidade.
+        
+        Returns:
+            True se, pelos novos critérios, está pronto para o procedimento
+        """
+        with self._lock:
+            return self._update_thresholds(stability_threshold, time_threshold, sensitivity)
+    
+    def _update_thresholds(self, stability_threshold, time_threshold, sensitivity):
+        if sensitivity is not None:
+            config = SENSITIVITY_CONFIG.get(sensitivity, SENSITIVITY_CONFIG['medium'])
+            self.min_detections = config['min_detections']
+            if stability_threshold is None:
+                stability_threshold = config['threshold']
+        if stability_threshold is not None:
+            self.stability_threshold = stability_threshold
+        if time_threshold is not None:
+            self.time_threshold = time_threshold
+        
+        if self.last_head_pos is None or not self.motion_history or self.last_frame_time is None:
+            return self.is_ready_for_procedure
+        threshold = self.stability_threshold
+        
+        # Janela do score: últimos movimentos medidos (mesmo através de perdas da cabeça)
+        medidos = [m for _, m in self.motion_history if m is not None]
+        self.stability_history.clear()
+        self.stability_history.extend(m <= threshold for m in medidos[-self.stability_history.maxlen:])
+        
+        # Início do trecho estável: volta a partir do último movimento até um instável ou perda
+        inicio = None
+        alcancou_limite = True
+        for instante, movimento in reversed(self.motion_history):
+            if movimento is None or movimento > threshold:
+                alcancou_limite = False
+                break
+            inicio = instante
+        if inicio is not None and alcancou_limite and self._evicted_start is not None:
+            # Trecho mais longo que o histórico: os contadores dizem se continua estável antes dele
+            if self._evicted_max <= threshold:
+                inicio = self._evicted_start
         
+        was_stable = self.is_stable
+        agora = self.last_frame_time
+        if inicio is None:
+            self.stable_start_time = None
+            self.is_stable = False
+            self.is_ready_for_procedure = False
+            self.message = f"⚠️ Movimento acima do novo limite ({threshold}px) - Mantenha a cabeça imóvel"
+            self._end_pre_alert(agora, confirmed=False)
+        else:
+            self.stable_start_time = inicio
+            self.is_stable = True
+            stable_duration = agora - inicio
+            recent_stability = list(self.stability_history)[-self.min_detections:]
+            if len(recent_stability) >= self.min_detections:
+                self.stability_score = sum(recent_stability) / len(recent_stability) * 100
+            else:
+                self.stability_score = 0
+            if stable_duration >= self.time_threshold and self.stability_score >= 80:
+                self.is_ready_for_procedure = True
+                self.message = f"✅ PRONTO PARA PROCEDIMENTO ({stable_duration:.1f}s estável)"
+            else:
+                self.is_ready_for_procedure = False
+                remaining_time = max(0, self.time_threshold - stable_duration)
+                self.message = f"⏳ Mantendo posição... {remaining_time:.1f}s restantes"
+        if self.is_stable != was_stable:
+            self._notify_state(self.is_stable, 'reconfigured')
+        return self.is_ready_for_procedure
+    
+    @property
+    def state_name(self):
+        """Estado atual: 'no_head', 'unstable', 'stable' ou 'ready'"""
+        if self.last_head_pos is None:
+            return 'no_head'
+        if self.is_ready_for_procedure:
+            return 'ready'
+        return 'stable' if self.is_stable else 'unstable'
+    
+    def _tracker_confident(self):
+        """
+        Com suavização ativa, pula até max_skipped_detections detecções seguidas
+        enquanto a cabeça está estável, parada e com incerteza baixa
+        """
+        tracker = self.tracker
+        if tracker is None or not tracker.initialized or not self.is_stable or self.pre_alert:
+            return False
+        if self.frames_since_detection > self.max_skipped_detections:
+            return False
+        vx, vy = tracker.velocity[:2]
+        parado = math.hypot(vx, vy) < self.stability_threshold * 0.1
+        return parado and tracker.uncertainty <= self.skip_uncertainty
+    
+    def _end_pre_alert(self, current_time, confirmed):
+        """Encerra o pré-alerta, registrando se foi confirmado por instabilidade"""
+        if not self.pre_alert:
+            return
+        if confirmed:
+            # Antecedência do pré-alerta em relação ao alerta real
+            metrics.observe('movement_prealert_lead_seconds', current_time - self.pre_alert_since)
+        metrics.inc('movement_prealert_total', outcome='confirmed' if confirmed else 'cleared')
+        self.pre_alert = False
+        self.pre_alert_since = None
+    
+    def _refresh_stable_time(self, current_time):
+        """Atualiza prontidão pelo tempo decorrido, sem nova detecção"""
+        if self.is_stable and self.stable_start_time is not None:
+            self.stable_frames += 1
+            stable_duration = current_time - self.stable_start_time
+            if stable_duration >= self.time_threshold and self.stability_score >= 80:
+                self.is_ready_for_procedure = True
+                self.message = f"✅ PRONTO PARA PROCEDIMENTO ({stable_duration:.1f}s estável)"
+            else:
+                remaining_time = max(0, self.time_threshold - stable_duration)
+                self.message = f"⏳ Mantendo posição... {remaining_time:.1f}s restantes"
         return self.is_ready_for_procedure
     
-    def draw_stability_info(self, frame):
-        """Desenha informações de estabilidade no frame"""
+    def draw_stability_info(self, frame, detail=True):
+        """
+        Desenha informações de estabilidade no frame
+        
+        Reaproveita a detecção feita em analyze_stability; com detail=False
+        omite o painel semitransparente (a parte mais cara do overlay).
+        """
         height, width = frame.shape[:2]
         
-        # Detecta posição atual
-        head_pos, all_faces = self.detect_head_position(frame)
+        # Posição da última análise (detecta apenas se ainda não houve análise)
+        if self.total_frames > 0:
+            head_pos = self.last_head_pos
+        else:
+            head_pos, all_faces = self.detect_head_position(frame)
         
         if head_pos:
             x, y, w, h = head_pos
             
             # Cor baseada na estabilidade
-            if self.is_ready_for_procedure:
+            if self.is_stable and self.pre_alert:
+                color = (0, 165, 255)  # Laranja - Movimento iniciando
+                thickness = 3
+            elif self.is_ready_for_procedure:
                 color = (0, 255, 0)  # Verde - Pronto
                 thickness = 4
             elif self.is_stable:
@@ -186,11 +489,15 @@ class MedicalHeadStabilityAnalyzer:
             cv2.line(frame, (center_x, center_y-10), (center_x, center_y+10), color, 2)
             
             # Status sobre a cabeça
-            status_text = "PRONTO" if self.is_ready_for_procedure else "ESTÁVEL" if self.is_stable else "INSTÁVEL"
+            if self.is_stable and self.pre_alert:
+                status_text = "ATENÇÃO"
+            else:
+                status_text = "PRONTO" if self.is_ready_for_procedure else "ESTÁVEL" if self.is_stable else "INSTÁVEL"
             cv2.putText(frame, status_text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
         
         # Painel de informações
-        self._draw_info_panel(frame)
+        if detail:
+            self._draw_info_panel(frame)
         
         # Indicador visual de status
         self._draw_status_indicator(frame)
@@ -226,6 +533,8 @@ class MedicalHeadStabilityAnalyzer:
             if "Status:" in line:
                 if "PRONTO" in line:
                     color = (0, 255, 0)
+                elif "iniciando" in line:
+                    color = (0, 165, 255)
                 elif "Movimento" in line:
                     color = (0, 0, 255)
                 elif "Mantendo" in line:
@@ -243,7 +552,13 @@ class MedicalHeadStabilityAnalyzer:
         indicator_y = 50
         indicator_size = 40
         
-        if self.is_ready_for_procedure:
+        if self.is_stable and self.pre_alert:
+            # Laranja - Estável, mas com movimento em formação
+            cv2.circle(frame, (indicator_x, indicator_y), indicator_size, (0, 165, 255), -1)
+            cv2.putText(frame, "!", (indicator_x-5, indicator_y+8), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+            
+        elif self.is_ready_for_procedure:
             # Verde - Pronto para procedimento
             cv2.circle(frame, (indicator_x, indicator_y), indicator_size, (0, 255, 0), -1)
             cv2.putText(frame, "GO", (indicator_x-15, indicator_y+5), 
@@ -277,14 +592,26 @@ class MedicalHeadStabilityAnalyzer:
             'stable_frames': self.stable_frames,
             'max_movement': self.max_movement,
             'message': self.message,
+            'pre_alert': self.pre_alert,
+            'motion': self.motion.status() if self.motion else None,
+            'tracking': self.tracker.status() if self.tracker else None,
+            'session_stats': self.stats.summary(),
             'threshold': self.stability_threshold,
             'time_threshold': self.time_threshold
         }
     
     def reset_analysis(self):
         """Reinicia a análise"""
+        with self._lock:
+            self._reset_analysis()
+    
+    def _reset_analysis(self):
         self.position_history.clear()
         self.stability_history.clear()
+        self.motion_history.clear()
+        self._evicted_max = 0.0
+        self._evicted_start = None
+        self.last_frame_time = None
         self.stable_start_time = None
         self.is_stable = False
         self.is_ready_for_procedure = False
@@ -292,4 +619,15 @@ class MedicalHeadStabilityAnalyzer:
         self.total_frames = 0
         self.stable_frames = 0
         self.max_movement = 0
+        self.last_movement = None
+        self.stats.reset()
+        self.frames_since_detection = 0
+        self.last_head_pos = None
+        self.last_faces = ()
+        if self.motion:
+            self.motion.reset()
+        if self.tracker:
+            self.tracker.reset()
+        self.pre_alert = False
+        self.pre_alert_since = None
         self.message = "Sistema reiniciado - Aguardando detecção..."
@@ -0,0 +1,226 @@
+# Instrumentação de Latência do Pipeline de Frames
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Histogramas de latência por etapa (captura, conversão de cor, detecção,
+# cálculo de movimento, overlay, codificação JPEG, fila de voz), contadores
+# de frames descartados e medidores de profundidade de fila, exportados no
+# formato texto do Prometheus pela rota /metrics.
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+from medical_tracing import tracer
+
+# Limites dos buckets em segundos (0.5 ms a 1 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+METRIC_PREFIX = 'estabilidade'
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Formata labels no padrão Prometheus: {chave="valor",...}"""
+    if not labels:
+        return ''
+    partes = []
+    for chave, valor in labels:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{chave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def _format_value(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Histogram:
+    """Histograma de buckets fixos (acumulado só na exportação)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, valor: float):
+        indice = len(self.buckets)
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                indice = i
+                break
+        self.counts[indice] += 1
+        self.sum += valor
+        self.count += 1
+
+    def cumulative(self):
+        """Retorna pares (limite, contagem acumulada) incluindo +Inf"""
+        acumulado = 0
+        resultado = []
+        for limite, contagem in zip(self.buckets + (float('inf'),), self.counts):
+            acumulado += contagem
+            resultado.append((limite, acumulado))
+        return resultado
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas do processo
+
+    Todas as operações são protegidas por um único lock: o custo por etapa
+    é de duas leituras de relógio e um incremento, desprezível frente aos
+    milissegundos de cada frame.
+    """
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._gauges: Dict[Tuple[str, tuple], float] = {}
+        self._gauge_callbacks: Dict[Tuple[str, tuple], Callable[[], float]] = {}
+        self._help: Dict[str, str] = {}
+        self._local = threading.local()  # Supressão por thread (suppressed())
+
+    # ----- Registro de valores -----
+
+    def observe(self, name: str, valor: float, **labels):
+        chave = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histograma = self._histograms.get(chave)
+            if histograma is None:
+                histograma = self._histograms[chave] = Histogram()
+            histograma.observe(valor)
+
+    def inc(self, name: str, valor: float = 1, **labels):
+        chave = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[chave] = self._counters.get(chave, 0) + valor
+
+    def set_gauge(self, name: str, valor: float, **labels):
+        chave = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[chave] = valor
+
+    def gauge_callback(self, name: str, callback: Callable[[], float], **labels):
+        """Registra medidor avaliado apenas na exportação (ex.: fila.qsize)"""
+        chave = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauge_callbacks[chave] = callback
+
+    def describe(self, name: str, texto: str):
+        """Define o texto HELP de uma métrica"""
+        self._help[name] = texto
+
+    def observe_stage(self, stage: str, segundos: float, start: float = None):
+        """
+        Registra a latência de uma etapa do pipeline
+
+        Se `start` (time.perf_counter) for informado e o rastreamento estiver
+        ativo, a etapa também vira um span no trace.
+        """
+        if getattr(self._local, 'suppressed', False):
+            return
+        self.observe('stage_latency_seconds', segundos, stage=stage)
+        if start is not None and tracer.enabled:
+            tracer.complete(stage, start, segundos)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Context manager que mede a duração de uma etapa do pipeline"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - inicio, start=inicio)
+
+    @contextmanager
+    def suppressed(self):
+        """Não registra etapas da thread atual (ex.: medições da calibração)"""
+        anterior = getattr(self._local, 'suppressed', False)
+        self._local.suppressed = True
+        try:
+            yield
+        finally:
+            self._local.suppressed = anterior
+
+    # ----- Consulta -----
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Resumo por etapa: contagem e latência média em milissegundos"""
+        resumo = {}
+        with self._lock:
+            for (name, labels), histograma in self._histograms.items():
+                if name != 'stage_latency_seconds' or histograma.count == 0:
+                    continue
+                stage = dict(labels).get('stage', '')
+                resumo[stage] = {
+                    'count': histograma.count,
+                    'mean_ms': histograma.sum / histograma.count * 1000
+                }
+        return resumo
+
+    def reset(self):
+        """Zera histogramas, contadores e medidores (mantém callbacks)"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self) -> str:
+        """Exporta todas as métricas no formato texto do Prometheus"""
+        with self._lock:
+            histogramas = {k: (h.cumulative(), h.sum, h.count) for k, h in self._histograms.items()}
+            contadores = dict(self._counters)
+            medidores = dict(self._gauges)
+            callbacks = dict(self._gauge_callbacks)
+
+        for chave, callback in callbacks.items():
+            try:
+                medidores[chave] = float(callback())
+            except Exception:
+                continue
+
+        linhas = []
+        self._render_family(linhas, 'histogram', histogramas, self._render_histogram)
+        self._render_family(linhas, 'counter', contadores, self._render_sample)
+        self._render_family(linhas, 'gauge', medidores, self._render_sample)
+        return '\n'.join(linhas) + '\n'
+
+    def _render_family(self, linhas, tipo, valores, render):
+        nomes = sorted({name for name, _ in valores})
+        for name in nomes:
+            nome_completo = f'{self.prefix}_{name}'
+            if name in self._help:
+                linhas.append(f'# HELP {nome_completo} {self._help[name]}')
+            linhas.append(f'# TYPE {nome_completo} {tipo}')
+            for (n, labels), valor in sorted(valores.items()):
+                if n == name:
+                    render(linhas, nome_completo, labels, valor)
+
+    @staticmethod
+    def _render_sample(linhas, nome, labels, valor):
+        linhas.append(f'{nome}{_format_labels(labels)} {_format_value(valor)}')
+
+    @staticmethod
+    def _render_histogram(linhas, nome, labels, dados):
+        acumulado, soma, contagem = dados
+        for limite, total in acumulado:
+            bucket_labels = labels + (('le', _format_value(limite)),)
+            linhas.append(f'{nome}_bucket{_format_labels(bucket_labels)} {total}')
+        linhas.append(f'{nome}_sum{_format_labels(labels)} {repr(float(soma))}')
+        linhas.append(f'{nome}_count{_format_labels(labels)} {contagem}')
+
+
+# Registro global do processo
+metrics = MetricsRegistry()
+metrics.describe('stage_latency_seconds', 'Latencia por etapa do pipeline de frames')
+metrics.describe('frames_total', 'Frames processados')
+metrics.describe('frames_dropped_total', 'Frames descartados por motivo')
+metrics.describe('tts_queue_depth', 'Mensagens aguardando na fila de voz')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
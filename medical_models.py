@@ -0,0 +1,190 @@
+# Registro de Modelos do Processo
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Carrega cada classificador Haar e cada modelo YOLO uma única vez por
+# processo. Assim criar um analisador não lê nenhum arquivo e a memória não
+# cresce com o número de salas (analisadores) nem de conexões.
+#
+# - YOLO: uma única instância por pesos, compartilhada por todas as threads;
+#   a inferência não é segura para uso simultâneo, então as chamadas são
+#   serializadas por um lock do próprio modelo.
+# - Haar: detectMultiScale também não é seguro para uso simultâneo, então
+#   cada thread usa uma instância própria, emprestada de um pool. Quando a
+#   thread termina (ex.: a thread de uma requisição /video_feed), a instância
+#   volta ao pool e é reaproveitada pela próxima, em vez de ser recriada.
+#   preload() deixa instâncias prontas no pool (aquecimento dos apps), para
+#   a primeira requisição de vídeo não pagar a carga.
+#
+# O XML de cada cascade é lido do disco uma vez; as demais instâncias são
+# construídas a partir do texto em memória.
+
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable
+
+import cv2
+
+# Nomes curtos dos classificadores distribuídos com o OpenCV
+CASCADES = {
+    'frontalface': 'haarcascade_frontalface_default.xml',
+    'eye': 'haarcascade_eye.xml',
+    'smile': 'haarcascade_smile.xml',
+}
+
+
+class SharedModel:
+    """Instância única de um modelo, com chamadas (inferência) serializadas"""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self.model(*args, **kwargs)
+
+    def __getattr__(self, nome):
+        # Atributos do modelo (names, etc.) sem passar pelo lock
+        return getattr(self.model, nome)
+
+
+class _Lease:
+    """Instâncias emprestadas a uma thread; devolvidas ao pool quando ela termina"""
+
+    def __init__(self):
+        self.instancias: Dict[str, Any] = {}
+
+
+class ModelRegistry:
+    """Cache de modelos por processo"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # Carga dos modelos compartilhados
+        self._sources: Dict[str, Any] = {}  # Conteúdo lido uma vez (XML do cascade)
+        self._pool: Dict[str, list] = {}  # Instâncias livres por modelo
+        self._loads: Dict[str, int] = {}  # Instâncias criadas por modelo
+        self._shared: Dict[str, SharedModel] = {}
+
+    # ----- Pool por thread -----
+
+    def _lease(self) -> _Lease:
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            lease = self._local.lease = _Lease()
+            # O thread-local é descartado quando a thread termina
+            weakref.finalize(lease, self._give_back, lease.instancias)
+        return lease
+
+    def _give_back(self, instancias: Dict[str, Any]):
+        with self._lock:
+            for chave, instancia in instancias.items():
+                self._pool.setdefault(chave, []).append(instancia)
+
+    def _take(self, chave: str, criar: Callable[[], Any]) -> Any:
+        """Instância livre do pool, ou uma nova"""
+        with self._lock:
+            livres = self._pool.get(chave)
+            if livres:
+                return livres.pop()
+        instancia = criar()
+        with self._lock:
+            self._loads[chave] = self._loads.get(chave, 0) + 1
+        return instancia
+
+    def _per_thread(self, chave: str, criar: Callable[[], Any]) -> Any:
+        instancias = self._lease().instancias
+        instancia = instancias.get(chave)
+        if instancia is None:
+            instancia = instancias[chave] = self._take(chave, criar)
+        return instancia
+
+    # ----- Haar cascades -----
+
+    @staticmethod
+    def cascade_path(nome: str) -> str:
+        """Caminho do XML: nome curto (CASCADES), arquivo do OpenCV ou caminho"""
+        arquivo = CASCADES.get(nome, nome)
+        if os.path.isfile(arquivo):
+            return arquivo
+        return os.path.join(cv2.data.haarcascades, arquivo)
+
+    def _cascade_source(self, caminho: str) -> str:
+        with self._lock:
+            texto = self._sources.get(caminho)
+            if texto is None:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    texto = self._sources[caminho] = f.read()
+            return texto
+
+    def _load_cascade(self, caminho: str) -> cv2.CascadeClassifier:
+        classificador = cv2.CascadeClassifier()
+        try:
+            texto = self._cascade_source(caminho)
+            armazenamento = cv2.FileStorage(texto, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+            classificador.read(armazenamento.getFirstTopLevelNode())
+            armazenamento.release()
+        except (OSError, cv2.error):
+            pass
+        if classificador.empty():
+            # Formato antigo (ou leitura em memória indisponível): carrega do arquivo
+            classificador = cv2.CascadeClassifier(caminho)
+        if classificador.empty():
+            raise ValueError(f"Classificador Haar não carregado: {caminho}")
+        return classificador
+
+    def cascade(self, nome: str = 'frontalface') -> cv2.CascadeClassifier:
+        """
+        Classificador Haar da thread atual
+
+        Raises:
+            ValueError: Se o XML não existir ou for inválido
+        """
+        caminho = self.cascade_path(nome)
+        return self._per_thread(f'cascade:{caminho}', lambda: self._load_cascade(caminho))
+
+    # ----- YOLO -----
+
+    def yolo(self, weights: str = 'yolov8n.pt') -> SharedModel:
+        """Modelo YOLO (ultralytics) do processo, carregado uma única vez"""
+        chave = f'yolo:{weights}'
+        modelo = self._shared.get(chave)
+        if modelo is None:
+            with self._load_lock:
+                modelo = self._shared.get(chave)
+                if modelo is None:
+                    from ultralytics import YOLO
+                    modelo = SharedModel(YOLO(weights))
+                    with self._lock:
+                        self._shared[chave] = modelo
+                        self._loads[chave] = 1
+        return modelo
+
+    # ----- Aquecimento -----
+
+    def preload(self, cascades: Iterable[str] = (), yolo: Iterable[str] = ()):
+        """Carrega os modelos e deixa uma instância livre de cada cascade no pool"""
+        for peso in yolo:
+            self.yolo(peso)
+        for nome in cascades:
+            caminho = self.cascade_path(nome)
+            chave = f'cascade:{caminho}'
+            with self._lock:
+                if self._pool.get(chave):
+                    continue
+            instancia = self._take(chave, lambda: self._load_cascade(caminho))
+            self._give_back({chave: instancia})
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                chave: {'instances': self._loads[chave],
+                        'idle': len(self._pool.get(chave, ())),
+                        'shared': chave in self._shared}
+                for chave in self._loads
+            }
+
+
+models = ModelRegistry()
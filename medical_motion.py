@@ -0,0 +1,259 @@
+# Modelo de Movimento da Cabeça
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Filtro de Kalman de velocidade constante sobre o centro da cabeça, usado
+# para sinalizar um movimento em formação antes que o deslocamento de um
+# único frame ultrapasse o limite de estabilidade (estado de pré-alerta),
+# e, opcionalmente, para suavizar centro e tamanho da caixa detectada,
+# removendo o tremor da detecção Haar do cálculo de movimento.
+# O tempo é medido em frames (não em segundos), na mesma unidade do
+# movimento calculado pelo analisador, o que mantém o resultado
+# independente da velocidade da máquina.
+
+import math
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+
+
+class ConstantVelocityKalman:
+    """
+    Filtro de Kalman de velocidade constante, eixos independentes
+
+    Estado por eixo: [posição, velocidade]. Como os eixos não se acoplam, a
+    covariância é guardada como um bloco 2x2 por eixo e todas as operações
+    são vetorizadas sobre os eixos.
+    """
+
+    def __init__(self, dims: int = 2, process_noise: float = 0.5, measurement_noise: float = 4.0):
+        """
+        Args:
+            dims: Número de eixos medidos (ex.: 2 para o centro x, y)
+            process_noise: Densidade espectral da aceleração (px²/frame³)
+            measurement_noise: Variância do ruído da detecção (px²), escalar ou por eixo
+        """
+        self.dims = dims
+        self.q = process_noise
+        self.r = np.broadcast_to(np.asarray(measurement_noise, dtype=float), (dims,)).copy()
+        self.reset()
+
+    def reset(self):
+        self.position = None  # np.ndarray (dims,)
+        self.velocity = np.zeros(self.dims)
+        self.covariance = None  # np.ndarray (dims, 2, 2)
+
+    @property
+    def position_std(self) -> np.ndarray:
+        """Desvio padrão da posição estimada, por eixo"""
+        return np.sqrt(self.covariance[:, 0, 0])
+
+    def inflate(self, fator: float):
+        """Aumenta a incerteza (ex.: após uma inovação incompatível com o modelo)"""
+        self.covariance = self.covariance * fator
+
+    @property
+    def initialized(self) -> bool:
+        return self.position is not None
+
+    def initialize(self, medida: Sequence[float]):
+        self.position = np.asarray(medida, dtype=float).copy()
+        self.velocity = np.zeros(self.dims)
+        # Posição conhecida com a precisão da detecção; velocidade desconhecida
+        self.covariance = np.zeros((self.dims, 2, 2))
+        self.covariance[:, 0, 0] = self.r
+        self.covariance[:, 1, 1] = 100.0
+
+    def predict(self, dt: float = 1.0):
+        """Propaga o estado dt frames à frente"""
+        p = self.covariance
+        self.position = self.position + self.velocity * dt
+        # P = F P F' + Q, com F = [[1, dt], [0, 1]]
+        p00 = p[:, 0, 0] + dt * (p[:, 1, 0] + p[:, 0, 1]) + dt * dt * p[:, 1, 1]
+        p01 = p[:, 0, 1] + dt * p[:, 1, 1]
+        p11 = p[:, 1, 1]
+        q = self.q
+        p00 = p00 + q * dt ** 3 / 3.0
+        p01 = p01 + q * dt ** 2 / 2.0
+        p11 = p11 + q * dt
+        self.covariance = np.stack([np.stack([p00, p01], axis=-1),
+                                    np.stack([p01, p11], axis=-1)], axis=-2)
+
+    def update(self, medida: Sequence[float]) -> np.ndarray:
+        """Incorpora uma medida de posição; retorna a inovação (medida - previsão)"""
+        z = np.asarray(medida, dtype=float)
+        p = self.covariance
+        inovacao = z - self.position
+        s = p[:, 0, 0] + self.r
+        k0 = p[:, 0, 0] / s
+        k1 = p[:, 1, 0] / s
+        self.position = self.position + k0 * inovacao
+        self.velocity = self.velocity + k1 * inovacao
+        # P = (I - K H) P
+        p00 = (1 - k0) * p[:, 0, 0]
+        p01 = (1 - k0) * p[:, 0, 1]
+        p11 = p[:, 1, 1] - k1 * p[:, 0, 1]
+        self.covariance = np.stack([np.stack([p00, p01], axis=-1),
+                                    np.stack([p01, p11], axis=-1)], axis=-2)
+        return inovacao
+
+    def step(self, medida: Sequence[float], dt: float = 1.0) -> np.ndarray:
+        """Predição + atualização; inicializa o filtro na primeira medida"""
+        if not self.initialized:
+            self.initialize(medida)
+            return np.zeros(self.dims)
+        self.predict(dt)
+        return self.update(medida)
+
+
+class MovementOnsetDetector:
+    """
+    Detecta movimento em formação a partir da tendência de velocidade
+
+    Pré-alerta quando a velocidade filtrada do centro passa de uma fração do
+    limite de estabilidade, ou quando está acelerando de forma consistente e
+    a velocidade projetada `horizon` frames à frente ultrapassa o limite.
+    Um piso de ruído evita que o tremor da detecção gere pré-alertas.
+    """
+
+    def __init__(self, pre_alert_fraction: float = 0.6, noise_floor_fraction: float = 0.25,
+                 horizon: float = 3.0, trend_frames: int = 2, accel_smoothing: float = 0.5,
+                 process_noise: float = 0.5, measurement_noise: float = 4.0):
+        self.pre_alert_fraction = pre_alert_fraction
+        self.noise_floor_fraction = noise_floor_fraction
+        self.horizon = horizon
+        self.trend_frames = trend_frames
+        self.accel_smoothing = accel_smoothing
+        self.kalman = ConstantVelocityKalman(2, process_noise, measurement_noise)
+        self.reset()
+
+    def reset(self):
+        self.kalman.reset()
+        self.speed = 0.0  # px/frame
+        self.acceleration = 0.0  # px/frame²
+        self.projected_speed = 0.0
+        self._accelerating = 0
+
+    def update(self, center: Sequence[float], threshold: float, frames_elapsed: float = 1.0) -> bool:
+        """
+        Atualiza o modelo com o centro detectado
+
+        Args:
+            center: (x, y) do centro da cabeça
+            threshold: Limite de movimento por frame do analisador (px)
+            frames_elapsed: Frames desde a última detecção (detecção intercalada)
+
+        Returns:
+            True se há movimento em formação (pré-alerta)
+        """
+        dt = max(1.0, float(frames_elapsed))
+        if not self.kalman.initialized:
+            self.kalman.step(center, dt)
+            return False
+        self.kalman.step(center, dt)
+        return self.evaluate(self.kalman.velocity, threshold, dt)
+
+    def evaluate(self, velocidade: Sequence[float], threshold: float, dt: float = 1.0) -> bool:
+        """Avalia a tendência a partir de uma velocidade já filtrada (px/frame)"""
+        speed = math.hypot(velocidade[0], velocidade[1])
+        accel = (speed - self.speed) / dt
+        self.acceleration += self.accel_smoothing * (accel - self.acceleration)
+        self.speed = speed
+        self._accelerating = self._accelerating + 1 if self.acceleration > 0 else 0
+        self.projected_speed = speed + max(0.0, self.acceleration) * self.horizon
+
+        if speed < threshold * self.noise_floor_fraction:
+            return False
+        if speed >= threshold * self.pre_alert_fraction:
+            return True
+        return self._accelerating >= self.trend_frames and self.projected_speed >= threshold
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'speed': round(self.speed, 2),
+            'acceleration': round(self.acceleration, 3),
+            'projected_speed': round(self.projected_speed, 2)
+        }
+
+
+class HeadTrackFilter:
+    """
+    Suavização da trajetória da cabeça (centro e tamanho)
+
+    Filtro de Kalman de velocidade constante sobre (cx, cy, w, h). Retorna a
+    posição filtrada, a velocidade e uma incerteza (px) do centro. Inovações
+    muito maiores que o esperado (movimento real, não tremor) inflam a
+    covariância para que o filtro acompanhe o movimento sem atraso.
+    """
+
+    def __init__(self, process_noise: float = 0.05, center_noise: float = 9.0,
+                 size_noise: float = 25.0, gate: float = 9.0, inflation: float = 10.0,
+                 consistency_smoothing: float = 0.3):
+        """
+        Args:
+            process_noise: Densidade espectral da aceleração (px²/frame³)
+            center_noise: Variância do tremor do centro detectado (px²)
+            size_noise: Variância do tremor da largura/altura detectada (px²)
+            gate: Limite da inovação normalizada (quadrado) para inflar a covariância
+            inflation: Fator de inflação aplicado quando a inovação passa do gate
+            consistency_smoothing: Peso da média móvel da inovação normalizada
+        """
+        self.kalman = ConstantVelocityKalman(
+            4, process_noise, [center_noise, center_noise, size_noise, size_noise])
+        self.gate = gate
+        self.inflation = inflation
+        self.consistency_smoothing = consistency_smoothing
+        self.reset()
+
+    def reset(self):
+        self.kalman.reset()
+        self.consistency = 1.0  # Média móvel da inovação normalizada (1 = conforme o modelo)
+
+    @property
+    def initialized(self) -> bool:
+        return self.kalman.initialized
+
+    def update(self, head_pos: Sequence[float], frames_elapsed: float = 1.0) -> Tuple[float, float, float, float]:
+        """
+        Incorpora uma detecção (cx, cy, w, h) e retorna a posição filtrada
+        """
+        dt = max(1.0, float(frames_elapsed))
+        if not self.kalman.initialized:
+            self.kalman.initialize(head_pos)
+            return tuple(float(v) for v in head_pos)
+        self.kalman.predict(dt)
+        # Inovação normalizada do centro, antes da atualização
+        previsto = self.kalman.position[:2]
+        variancia = self.kalman.covariance[:2, 0, 0] + self.kalman.r[:2]
+        inovacao = np.asarray(head_pos[:2], dtype=float) - previsto
+        nis = float(np.mean(inovacao ** 2 / variancia))
+        self.consistency += self.consistency_smoothing * (nis - self.consistency)
+        if nis > self.gate:
+            # Movimento incompatível com "cabeça parada + tremor": reabre o filtro
+            self.kalman.inflate(self.inflation)
+        self.kalman.update(head_pos)
+        return tuple(float(v) for v in self.kalman.position)
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.kalman.velocity
+
+    @property
+    def uncertainty(self) -> float:
+        """Incerteza do centro (px), ampliada quando as inovações fogem do modelo"""
+        if not self.kalman.initialized:
+            return float('inf')
+        std = float(np.max(self.kalman.position_std[:2]))
+        return std * math.sqrt(max(1.0, self.consistency))
+
+    def status(self) -> Dict[str, Any]:
+        if not self.kalman.initialized:
+            return {'initialized': False}
+        cx, cy, w, h = self.kalman.position
+        vx, vy = self.kalman.velocity[:2]
+        return {
+            'initialized': True,
+            'position': [round(float(cx), 1), round(float(cy), 1), round(float(w), 1), round(float(h), 1)],
+            'velocity': [round(float(vx), 2), round(float(vy), 2)],
+            'uncertainty': round(self.uncertainty, 2),
+            'consistency': round(self.consistency, 2)
+        }
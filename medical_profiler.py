@@ -0,0 +1,192 @@
+# Profiling Sob Demanda do Loop de Frames
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Permite perfilar o loop de análise em execução sem reiniciar o exame.
+# O loop chama profiler.tick() uma vez por frame; enquanto nenhuma sessão
+# foi solicitada, o custo é a leitura de um único atributo.
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+MAX_PROFILE_SECONDS = 120
+SAMPLE_INTERVAL = 0.005  # 5 ms entre amostras no modo 'collapsed'
+
+# A partir do 3.12 o cProfile usa sys.monitoring: vale para o processo todo e
+# pode ser desligado de qualquer thread. Antes, só pela thread que o ligou.
+DISABLE_FROM_ANY_THREAD = sys.version_info >= (3, 12)
+
+
+class ProfileSession:
+    """Uma sessão de profiling solicitada por um endpoint administrativo"""
+
+    def __init__(self, seconds: float, mode: str, sort: str, limit: int):
+        self.seconds = seconds
+        self.mode = mode
+        self.sort = sort
+        self.limit = limit
+        self.deadline = None
+        self.thread_id = None
+        self.profile = None
+        self.samples = Counter()
+        self.sample_count = 0
+        self.result = None
+        self.done = threading.Event()
+
+
+class FrameLoopProfiler:
+    """
+    Profiler ativado sob demanda na thread do loop de análise
+
+    Modos:
+    - 'pstats': cProfile habilitado na própria thread do loop
+    - 'collapsed': amostragem de pilha (sys._current_frames) em uma thread
+      auxiliar, no formato de pilhas colapsadas (flamegraph.pl / speedscope)
+    """
+
+    MODES = ('pstats', 'collapsed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Optional[ProfileSession] = None
+        self._active: Optional[ProfileSession] = None
+        # Sessões pstats abandonadas por tempo esgotado, por thread dona (até
+        # 3.11): disable() só vale na thread que chamou enable(), então é ela
+        # que desliga; se a thread terminou, o profiler morreu com ela
+        self._orphans: Dict[int, ProfileSession] = {}
+
+    @property
+    def busy(self):
+        return self._pending is not None or self._active is not None
+
+    def tick(self):
+        """Chamado uma vez por frame pela thread do loop de análise"""
+        if self._pending is None and self._active is None and not self._orphans:
+            return
+        self._tick_slow()
+
+    def _tick_slow(self):
+        if self._orphans:
+            self._drop_orphans()
+        with self._lock:
+            if self._pending is not None and self._active is None:
+                self._start(self._pending)
+                self._pending = None
+                return
+            session = self._active
+        if session is not None and session.thread_id == threading.get_ident():
+            if time.monotonic() >= session.deadline:
+                self._finish(session)
+
+    def _drop_orphans(self):
+        with self._lock:
+            orfa = self._orphans.pop(threading.get_ident(), None)
+            vivas = {thread.ident for thread in threading.enumerate()}
+            for ident in [i for i in self._orphans if i not in vivas]:
+                del self._orphans[ident]
+        if orfa is not None:
+            orfa.profile.disable()
+
+    def _start(self, session: ProfileSession):
+        session.thread_id = threading.get_ident()
+        session.deadline = time.monotonic() + session.seconds
+        self._active = session
+        if session.mode == 'pstats':
+            session.profile = cProfile.Profile()
+            session.profile.enable()
+        else:
+            sampler = threading.Thread(target=self._sample_loop, args=(session,), daemon=True)
+            sampler.start()
+
+    def _sample_loop(self, session: ProfileSession):
+        """Amostra a pilha da thread do loop até o prazo da sessão"""
+        while time.monotonic() < session.deadline and not session.done.is_set():
+            frame = sys._current_frames().get(session.thread_id)
+            if frame is not None:
+                pilha = []
+                while frame is not None:
+                    code = frame.f_code
+                    pilha.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                session.samples[';'.join(reversed(pilha))] += 1
+                session.sample_count += 1
+            time.sleep(SAMPLE_INTERVAL)
+        self._finish(session)
+
+    def _finish(self, session: ProfileSession):
+        with self._lock:
+            if self._active is not session:
+                return
+            self._active = None
+
+        try:
+            if session.mode == 'pstats':
+                session.profile.disable()
+                stream = io.StringIO()
+                stats = pstats.Stats(session.profile, stream=stream)
+                stats.sort_stats(session.sort).print_stats(session.limit)
+                session.result = stream.getvalue()
+            else:
+                linhas = [f"{pilha} {contagem}" for pilha, contagem in session.samples.most_common()]
+                session.result = '\n'.join(linhas) + '\n'
+        except Exception as e:
+            session.result = f"Erro ao gerar relatório: {e}\n"
+        finally:
+            session.done.set()
+
+    def profile(self, seconds: float = 10, mode: str = 'pstats', sort: str = 'cumulative',
+                limit: int = 60, start_timeout: float = 5.0) -> str:
+        """
+        Solicita uma sessão de profiling e bloqueia até o resultado
+
+        Args:
+            seconds: Duração da sessão (limitada a MAX_PROFILE_SECONDS)
+            mode: 'pstats' ou 'collapsed'
+            sort: Chave de ordenação do pstats
+            limit: Número de linhas do relatório pstats
+            start_timeout: Tempo máximo aguardando o loop de frames iniciar a sessão
+
+        Returns:
+            Relatório em texto
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Modo '{mode}' inválido (use {', '.join(self.MODES)})")
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            raise ValueError(f"Ordenação '{sort}' inválida")
+        seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+        session = ProfileSession(seconds, mode, sort, limit)
+
+        with self._lock:
+            if self.busy:
+                raise RuntimeError("Já existe uma sessão de profiling em andamento")
+            self._pending = session
+
+        if not session.done.wait(seconds + start_timeout):
+            with self._lock:
+                iniciou = self._active is session
+                if self._pending is session:
+                    self._pending = None
+                if iniciou and session.mode == 'pstats' and not DISABLE_FROM_ANY_THREAD:
+                    # O loop parou de chamar tick() depois de iniciar a sessão; o
+                    # cProfile é desligado pela própria thread, no próximo tick()
+                    self._active = None
+                    self._orphans[session.thread_id] = session
+            if session.done.is_set():
+                return session.result  # Terminou entre o prazo e o lock
+            if not iniciou:
+                raise TimeoutError("Loop de frames inativo - abra o vídeo para perfilar")
+            if session.mode == 'pstats' and not DISABLE_FROM_ANY_THREAD:
+                raise TimeoutError("Loop de frames parou durante a sessão - sem relatório")
+            # Amostragem, ou cProfile do 3.12+: pode ser encerrado daqui
+            self._finish(session)
+        return session.result
+
+
+# Profiler global do processo
+profiler = FrameLoopProfiler()
@@ -0,0 +1,253 @@
+# Gravador de Trajetória do Procedimento
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Registra, a cada frame do procedimento, apenas números: instante, centro e
+# tamanho da cabeça, movimento e estado. Nenhuma imagem é gravada (mantém a
+# promessa de privacidade do README). As linhas vão para um buffer numpy
+# estruturado pré-alocado; quando ele enche, é trocado por um buffer vazio e
+# gravado em disco como um bloco .npy por uma thread separada, de modo que o
+# loop de frames só faz uma atribuição por frame.
+#
+# Cada registro ocupa 29 bytes: uma sessão de PET de 90 minutos a 30 fps
+# (~162 mil frames) ocupa ~4,7 MB.
+
+import json
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_SESSIONS_DIR = os.path.join(os.path.expanduser('~'), '.estabilidade_cranio', 'sessions')
+
+TRACE_DTYPE = np.dtype([
+    ('t', '<f8'),         # Instante do frame (s)
+    ('cx', '<f4'),        # Centro da cabeça (px); NaN sem detecção
+    ('cy', '<f4'),
+    ('w', '<f4'),         # Tamanho da caixa (px)
+    ('h', '<f4'),
+    ('movement', '<f4'),  # Movimento por frame (px); NaN sem medida
+    ('state', 'u1'),      # STATE_*, com FLAG_PRE_ALERT
+])
+
+# Estados
+STATE_NO_HEAD = 0
+STATE_UNSTABLE = 1
+STATE_STABLE = 2
+STATE_READY = 3
+FLAG_PRE_ALERT = 0x10
+
+CHUNK_PATTERN = 'chunk_{:05d}.npy'
+META_FILE = 'session.json'
+
+
+def sessions_dir() -> str:
+    return os.environ.get('ESTABILIDADE_SESSIONS_DIR', DEFAULT_SESSIONS_DIR)
+
+
+def analyzer_state(analyzer) -> int:
+    """Codifica o estado do analisador em um byte"""
+    if analyzer.last_head_pos is None:
+        estado = STATE_NO_HEAD
+    elif analyzer.is_ready_for_procedure:
+        estado = STATE_READY
+    elif analyzer.is_stable:
+        estado = STATE_STABLE
+    else:
+        estado = STATE_UNSTABLE
+    if analyzer.pre_alert:
+        estado |= FLAG_PRE_ALERT
+    return estado
+
+
+class MotionRecorder:
+    """
+    Gravador de trajetória de uma sessão
+
+    record() é chamado pelo loop de frames; close() (ex.: em stop_procedure)
+    grava o bloco parcial e os metadados. Os blocos podem ser lidos com
+    load_session(), inclusive enquanto a sessão ainda está em andamento.
+    """
+
+    def __init__(self, session_id: str = None, directory: str = None,
+                 chunk_frames: int = 9000, meta: Dict[str, Any] = None):
+        """
+        Args:
+            session_id: Identificador da sessão (gerado se omitido)
+            directory: Diretório base das sessões
+            chunk_frames: Registros por bloco (9000 = 5 min a 30 fps, ~260 KB)
+            meta: Metadados extras (procedimento, população, thresholds...)
+        """
+        self.session_id = session_id or datetime.now().strftime('%Y%m%d_%H%M%S_') + uuid.uuid4().hex[:6]
+        self.path = os.path.join(directory or sessions_dir(), self.session_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.chunk_frames = chunk_frames
+        self.meta = dict(meta or {})
+        self.meta.update({
+            'session_id': self.session_id,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'dtype': TRACE_DTYPE.descr,
+            'chunk_frames': chunk_frames
+        })
+
+        self._buffer = np.empty(chunk_frames, dtype=TRACE_DTYPE)
+        self._spare = np.empty(chunk_frames, dtype=TRACE_DTYPE)
+        self._count = 0
+        self._chunks = 0
+        self.frames = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+        self._pending = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='motion-recorder', daemon=True)
+        self._writer.start()
+        self._write_meta()
+
+    # ----- Loop de frames -----
+
+    def record(self, analyzer, timestamp: float):
+        """Registra o estado atual do analisador (uma linha)"""
+        head = analyzer.last_head_pos
+        movimento = analyzer.last_movement
+        with self._lock:
+            if self.closed:
+                return
+            linha = (
+                timestamp,
+                head[0] if head else np.nan, head[1] if head else np.nan,
+                head[2] if head else np.nan, head[3] if head else np.nan,
+                movimento if (head and movimento is not None) else np.nan,
+                analyzer_state(analyzer)
+            )
+            self._buffer[self._count] = linha
+            self._count += 1
+            self.frames += 1
+            if self._count == self.chunk_frames:
+                self._spill()
+
+    def _spill(self):
+        """Entrega o buffer cheio para a thread de gravação (chamado com o lock)"""
+        cheio = self._buffer
+        self._pending.put((self._chunks, cheio, self._count))
+        self._chunks += 1
+        # O buffer reserva volta a ser usado quando a gravação anterior terminar
+        self._buffer = self._spare if self._spare is not None else np.empty(self.chunk_frames, dtype=TRACE_DTYPE)
+        self._spare = None
+        self._count = 0
+
+    # ----- Thread de gravação -----
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            indice, buffer, count = item
+            caminho = os.path.join(self.path, CHUNK_PATTERN.format(indice))
+            temporario = caminho + '.tmp'
+            try:
+                with open(temporario, 'wb') as f:
+                    np.save(f, buffer[:count])
+                os.replace(temporario, caminho)
+            except OSError as e:
+                print(f"❌ Erro ao gravar trajetória ({caminho}): {e}")
+            with self._lock:
+                if self._spare is None and len(buffer) == self.chunk_frames:
+                    self._spare = buffer
+
+    def _write_meta(self):
+        caminho = os.path.join(self.path, META_FILE)
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+        os.replace(caminho + '.tmp', caminho)
+
+    def close(self, **extra_meta):
+        """Grava o bloco parcial e os metadados finais; aguarda a gravação"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._count:
+                self._pending.put((self._chunks, self._buffer.copy(), self._count))
+                self._chunks += 1
+                self._count = 0
+        self._pending.put(None)
+        self._writer.join()
+        self.meta.update(extra_meta)
+        self.meta.update({
+            'ended_at': datetime.now().isoformat(timespec='seconds'),
+            'frames': self.frames,
+            'chunks': self._chunks
+        })
+        self._write_meta()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'frames': self.frames,
+            'chunks': self._chunks,
+            'bytes': self.frames * TRACE_DTYPE.itemsize,
+            'closed': self.closed
+        }
+
+
+class SessionRecording:
+    """Gravação da sessão em andamento de um app (no máximo uma por vez)"""
+
+    def __init__(self, **meta):
+        self.meta = meta  # Metadados comuns a todas as sessões (ex.: app)
+        self.recorder: Optional[MotionRecorder] = None
+
+    def start(self, analyzer, **meta) -> Optional[MotionRecorder]:
+        """Fecha a gravação anterior e abre a da sessão que está começando"""
+        self.stop(analyzer)
+        if analyzer is None:
+            return None
+        try:
+            self.recorder = MotionRecorder(meta={
+                **self.meta, **meta,
+                'stability_threshold': analyzer.stability_threshold,
+                'time_threshold': analyzer.time_threshold
+            })
+        except OSError as e:
+            print(f"⚠️ Gravação da trajetória indisponível: {e}")
+            self.recorder = None
+        return self.recorder
+
+    def stop(self, analyzer=None):
+        """Fecha a gravação da sessão atual, se houver"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close(report=analyzer.get_stability_report() if analyzer else None)
+            print(f"💾 Trajetória gravada: {recorder.path} ({recorder.frames} frames)")
+
+
+def load_session(session: str, mmap: bool = True) -> np.ndarray:
+    """
+    Carrega a trajetória de uma sessão (id ou caminho)
+
+    Com mmap=True cada bloco é mapeado em memória; o resultado concatenado é
+    uma cópia, mas blocos isolados podem ser lidos com load_chunks().
+    """
+    blocos = load_chunks(session, mmap)
+    if not blocos:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.concatenate(blocos)
+
+
+def load_chunks(session: str, mmap: bool = True) -> List[np.ndarray]:
+    caminho = session if os.path.isdir(session) else os.path.join(sessions_dir(), session)
+    nomes = sorted(n for n in os.listdir(caminho) if n.startswith('chunk_') and n.endswith('.npy'))
+    return [np.load(os.path.join(caminho, n), mmap_mode='r' if mmap else None) for n in nomes]
+
+
+def load_meta(session: str) -> Optional[Dict[str, Any]]:
+    caminho = session if os.path.isdir(session) else os.path.join(sessions_dir(), session)
+    try:
+        with open(os.path.join(caminho, META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,536 @@
+# Sistema de Voz
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Cache de frases pré-sintetizadas: as frases fixas são sintetizadas para
+# WAV uma única vez (na inicialização ou no primeiro uso), indexadas por
+# texto/voz/velocidade, e tocadas direto da memória. Frases dinâmicas
+# (ex.: durações) são montadas a partir de fragmentos em cache.
+#
+# Engine persistente: um único engine pyttsx3 por thread de voz, recriado
+# apenas após falhas, com medição da latência fila -> início do áudio.
+#
+# Fila de voz com prioridades: alertas de movimento passam à frente de
+# controle de procedimento, que passa à frente de mensagens informativas;
+# frases idênticas pendentes são unificadas e mensagens vencidas descartadas.
+
+import hashlib
+import heapq
+import io
+import itertools
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import wave
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+from medical_metrics import metrics
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.estabilidade_cranio', 'tts_cache')
+
+# Texto simples ou sequência de fragmentos a serem concatenados
+Utterance = Union[str, Sequence[str]]
+
+
+def audio_player_available() -> bool:
+    """Indica se há reprodutor de WAV em memória nesta plataforma"""
+    if sys.platform == 'win32':
+        return True
+    try:
+        import simpleaudio  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _play_wav_bytes(dados: bytes) -> bool:
+    """
+    Toca um WAV a partir da memória (bloqueante)
+
+    Windows usa winsound; nas demais plataformas usa simpleaudio se estiver
+    instalado. Retorna False se não houver reprodutor disponível.
+    """
+    if sys.platform == 'win32':
+        import winsound
+        winsound.PlaySound(dados, winsound.SND_MEMORY)
+        return True
+    try:
+        import simpleaudio
+    except ImportError:
+        return False
+    with wave.open(io.BytesIO(dados), 'rb') as wav:
+        frames = wav.readframes(wav.getnframes())
+        play = simpleaudio.play_buffer(frames, wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+    play.wait_done()
+    return True
+
+
+def concat_wav(partes: Iterable[bytes]) -> Optional[bytes]:
+    """Concatena WAVs com o mesmo formato em um único WAV"""
+    saida = io.BytesIO()
+    params = None
+    escritor = None
+    for dados in partes:
+        with wave.open(io.BytesIO(dados), 'rb') as wav:
+            atuais = (wav.getnchannels(), wav.getsampwidth(), wav.getframerate())
+            if params is None:
+                params = atuais
+                escritor = wave.open(saida, 'wb')
+                escritor.setnchannels(params[0])
+                escritor.setsampwidth(params[1])
+                escritor.setframerate(params[2])
+            elif atuais != params:
+                escritor.close()
+                return None
+            escritor.writeframes(wav.readframes(wav.getnframes()))
+    if escritor is None:
+        return None
+    escritor.close()
+    return saida.getvalue()
+
+
+def duration_fragments(prefixo: str, total_seconds: int) -> List[str]:
+    """
+    Fragmentos para anunciar uma duração, reaproveitáveis entre frases
+
+    Ex.: ("Procedimento finalizado. Duração:", 83) ->
+         ["Procedimento finalizado. Duração:", "1 minuto", "e 23 segundos"]
+    """
+    minutos, segundos = divmod(int(total_seconds), 60)
+    fragmentos = [prefixo]
+    if minutos:
+        fragmentos.append(f"{minutos} minuto" if minutos == 1 else f"{minutos} minutos")
+    if segundos or not minutos:
+        texto = f"{segundos} segundo" if segundos == 1 else f"{segundos} segundos"
+        fragmentos.append(f"e {texto}" if minutos else texto)
+    return fragmentos
+
+
+class PhraseCache:
+    """
+    Cache de frases sintetizadas em WAV
+
+    Deve ser usado somente na thread dona do engine pyttsx3 (o engine não é
+    thread-safe). Os WAVs também são guardados em disco para que a próxima
+    inicialização não precise sintetizar de novo.
+    """
+
+    def __init__(self, engine, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self._memoria: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, texto: str) -> str:
+        voz = self.engine.getProperty('voice')
+        velocidade = self.engine.getProperty('rate')
+        return hashlib.sha1(f"{voz}|{velocidade}|{texto}".encode('utf-8')).hexdigest()
+
+    def _load_from_disk(self, chave: str) -> Optional[bytes]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, chave + '.wav'), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _synthesize(self, texto: str, chave: str) -> Optional[bytes]:
+        """Sintetiza o texto para WAV usando o engine (bloqueante)"""
+        fd, caminho = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        try:
+            self.engine.save_to_file(texto, caminho)
+            self.engine.runAndWait()
+            with open(caminho, 'rb') as f:
+                dados = f.read()
+        finally:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+        # Alguns drivers (ex.: macOS) gravam AIFF: nesse caso não há cache
+        if not dados.startswith(b'RIFF'):
+            return None
+        if self.cache_dir:
+            try:
+                with open(os.path.join(self.cache_dir, chave + '.wav'), 'wb') as f:
+                    f.write(dados)
+            except OSError:
+                pass
+        return dados
+
+    def get(self, texto: str, synthesize: bool = True) -> Optional[bytes]:
+        """Retorna o WAV da frase, sintetizando no primeiro uso"""
+        chave = self._key(texto)
+        with self._lock:
+            dados = self._memoria.get(chave)
+        if dados is not None:
+            self.hits += 1
+            return dados
+
+        self.misses += 1
+        dados = self._load_from_disk(chave)
+        if dados is None and synthesize:
+            try:
+                dados = self._synthesize(texto, chave)
+            except Exception as e:
+                print(f"⚠️ Falha ao sintetizar '{texto}': {e}")
+                dados = None
+        if dados is not None:
+            with self._lock:
+                self._memoria[chave] = dados
+        return dados
+
+    def warm(self, frases: Iterable[str]):
+        """Pré-sintetiza as frases conhecidas"""
+        total = 0
+        for texto in frases:
+            if self.get(texto) is not None:
+                total += 1
+        print(f"🔊 Cache de voz: {total} frases prontas")
+
+    def speak(self, utterance: Utterance) -> bool:
+        """
+        Fala uma frase (ou sequência de fragmentos) a partir do cache
+
+        Retorna False se a frase não pôde ser tocada do cache; nesse caso o
+        chamador deve usar engine.say() normalmente.
+        """
+        fragmentos = [utterance] if isinstance(utterance, str) else list(utterance)
+        partes = []
+        for fragmento in fragmentos:
+            dados = self.get(fragmento)
+            if dados is None:
+                return False
+            partes.append(dados)
+        dados = partes[0] if len(partes) == 1 else concat_wav(partes)
+        if dados is None:
+            return False
+        return _play_wav_bytes(dados)
+
+
+def utterance_text(utterance: Utterance) -> str:
+    """Texto completo de uma frase ou sequência de fragmentos"""
+    return utterance if isinstance(utterance, str) else ' '.join(utterance)
+
+
+class PersistentEngine:
+    """
+    Engine pyttsx3 de vida longa com verificação de saúde
+
+    O engine é criado uma única vez e reaproveitado entre as falas; só é
+    recriado depois de uma falha. Também mede a latência entre o
+    enfileiramento da frase e o início do áudio (evento 'started-utterance').
+    Deve ser usado somente pela thread de voz.
+    """
+
+    def __init__(self, factory: Callable[[], Any], health_interval: float = 30.0):
+        """
+        Args:
+            factory: Função que cria e configura um engine pyttsx3
+            health_interval: Intervalo mínimo entre verificações em repouso (segundos)
+        """
+        self.factory = factory
+        self.health_interval = health_interval
+        self.engine = None
+        self.failures = 0
+        self.recreations = 0
+        self._last_check = 0.0
+        self._utterance_enqueued_at = None
+        self.latency = {'count': 0, 'last_ms': None, 'mean_ms': None, 'max_ms': None}
+
+    def ensure(self) -> bool:
+        """Garante um engine pronto, criando-o se necessário"""
+        if self.engine is not None:
+            return True
+        try:
+            engine = self.factory()
+            engine.connect('started-utterance', self._on_started)
+            if self.failures:
+                self.recreations += 1
+                print("🔊 Engine de voz recriado após falha")
+            self.engine = engine
+            return True
+        except Exception as e:
+            print(f"⚠️ Erro ao criar engine de voz: {e}")
+            self.engine = None
+            return False
+
+    def _discard(self):
+        engine, self.engine = self.engine, None
+        if engine is not None:
+            try:
+                engine.stop()
+            except Exception:
+                pass
+
+    def check_health(self, force: bool = False) -> bool:
+        """Verificação leve: o driver ainda responde a getProperty?"""
+        agora = time.monotonic()
+        if not force and agora - self._last_check < self.health_interval:
+            return self.engine is not None
+        self._last_check = agora
+        if self.engine is None:
+            return self.ensure()
+        try:
+            self.engine.getProperty('rate')
+            return True
+        except Exception as e:
+            print(f"⚠️ Engine de voz não responde: {e}")
+            self.failures += 1
+            self._discard()
+            return self.ensure()
+
+    def _on_started(self, name=None):
+        if self._utterance_enqueued_at is None:
+            return
+        latencia = time.perf_counter() - self._utterance_enqueued_at
+        self._utterance_enqueued_at = None
+        self._record_latency(latencia)
+
+    def _record_latency(self, segundos: float):
+        ms = segundos * 1000
+        dados = self.latency
+        dados['count'] += 1
+        dados['last_ms'] = round(ms, 1)
+        dados['mean_ms'] = round(ms if dados['mean_ms'] is None
+                                 else dados['mean_ms'] + (ms - dados['mean_ms']) / dados['count'], 1)
+        dados['max_ms'] = round(max(ms, dados['max_ms'] or 0), 1)
+        metrics.observe('tts_latency_seconds', segundos)
+
+    def say(self, texto: str, enqueued_at: float = None) -> bool:
+        """
+        Fala o texto (bloqueante)
+
+        Args:
+            enqueued_at: Instante do enfileiramento (time.perf_counter) para medir latência
+        """
+        if not self.ensure():
+            return False
+        self._utterance_enqueued_at = enqueued_at
+        try:
+            self.engine.say(texto)
+            self.engine.runAndWait()
+            return True
+        except Exception as e:
+            print(f"⚠️ Erro ao falar '{texto}': {e}")
+            self.failures += 1
+            self._discard()
+            return False
+        finally:
+            self._utterance_enqueued_at = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'engine_ready': self.engine is not None,
+            'failures': self.failures,
+            'recreations': self.recreations,
+            'latency': dict(self.latency)
+        }
+
+
+# Prioridades da fila de voz (menor = mais urgente)
+PRIORITY_ALERT = 0     # Alerta de movimento
+PRIORITY_CONTROL = 1   # Controle do procedimento (início, fim, reinício)
+PRIORITY_INFO = 2      # Mensagens informativas
+
+# Validade padrão de cada prioridade (segundos): depois disso a frase é descartada
+DEFAULT_TTL = {
+    PRIORITY_ALERT: 3.0,
+    PRIORITY_CONTROL: 15.0,
+    PRIORITY_INFO: 6.0
+}
+
+_STOP = object()
+
+
+class SpeechMessage:
+    """Mensagem pendente na fila de voz"""
+
+    __slots__ = ('payload', 'priority', 'key', 'group', 'enqueued_at', 'expires_at', 'cancelled')
+
+    def __init__(self, payload, priority, key, group, enqueued_at, expires_at):
+        self.payload = payload
+        self.priority = priority
+        self.key = key
+        self.group = group
+        self.enqueued_at = enqueued_at
+        self.expires_at = expires_at
+        self.cancelled = False
+
+
+class SpeechQueue:
+    """
+    Fila de voz com prioridades, deduplicação e validade
+
+    Compatível com o uso de queue.Queue nos workers (get(timeout=...),
+    put(None) para parar, qsize, empty, task_done). Um alerta espera no
+    máximo a frase que já está sendo falada.
+    """
+
+    def __init__(self, maxsize: int = 20):
+        self.maxsize = maxsize
+        self._heap = []
+        self._pending: Dict[Any, SpeechMessage] = {}
+        self._groups: Dict[str, SpeechMessage] = {}
+        self._count = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.dropped = {'expired': 0, 'duplicate': 0, 'superseded': 0, 'overflow': 0}
+
+    def _drop(self, msg: SpeechMessage, reason: str):
+        msg.cancelled = True
+        self._count -= 1
+        self._forget(msg)
+        self.dropped[reason] += 1
+        metrics.inc('tts_dropped_total', reason=reason)
+
+    def _forget(self, msg: SpeechMessage):
+        if self._pending.get(msg.key) is msg:
+            del self._pending[msg.key]
+        if msg.group is not None and self._groups.get(msg.group) is msg:
+            del self._groups[msg.group]
+
+    def put(self, payload, priority: int = PRIORITY_INFO, ttl: float = None,
+            group: str = None, block=True, timeout=None) -> bool:
+        """
+        Enfileira uma frase
+
+        Args:
+            payload: Texto ou sequência de fragmentos (None = sinal de parada)
+            priority: PRIORITY_ALERT, PRIORITY_CONTROL ou PRIORITY_INFO
+            ttl: Validade em segundos (padrão por prioridade)
+            group: Frases do mesmo grupo se substituem (ex.: 'status'):
+                   só a mais recente continua pendente
+
+        Returns:
+            False se a frase foi unificada com uma idêntica já pendente
+        """
+        agora = time.monotonic()
+        with self._cond:
+            if payload is None:
+                heapq.heappush(self._heap, (-1, next(self._seq), _STOP))
+                self._cond.notify()
+                return True
+
+            key = utterance_text(payload)
+            existente = self._pending.get(key)
+            if existente is not None and not existente.cancelled:
+                # Frase idêntica pendente: mantém a posição, renova validade e prioridade
+                ttl_atual = ttl if ttl is not None else DEFAULT_TTL.get(priority, 6.0)
+                existente.expires_at = max(existente.expires_at, agora + ttl_atual)
+                if priority < existente.priority:
+                    existente.cancelled = True
+                    self._count -= 1
+                    self._forget(existente)
+                else:
+                    self.dropped['duplicate'] += 1
+                    metrics.inc('tts_dropped_total', reason='duplicate')
+                    return False
+
+            if group is not None:
+                anterior = self._groups.get(group)
+                if anterior is not None and not anterior.cancelled:
+                    self._drop(anterior, 'superseded')
+
+            if self.maxsize and self._count >= self.maxsize:
+                # Descarta a mensagem menos urgente e mais antiga
+                candidatas = [m for _, _, m in self._heap if m is not _STOP and not m.cancelled]
+                pior = max(candidatas, key=lambda m: (m.priority, -m.enqueued_at))
+                if pior.priority < priority:
+                    self.dropped['overflow'] += 1
+                    metrics.inc('tts_dropped_total', reason='overflow')
+                    return False
+                self._drop(pior, 'overflow')
+
+            ttl = ttl if ttl is not None else DEFAULT_TTL.get(priority, 6.0)
+            msg = SpeechMessage(payload, priority, key, group, time.perf_counter(), agora + ttl)
+            heapq.heappush(self._heap, (priority, next(self._seq), msg))
+            self._pending[key] = msg
+            if group is not None:
+                self._groups[group] = msg
+            self._count += 1
+            self._cond.notify()
+            return True
+
+    def say(self, payload, priority: int = PRIORITY_INFO, group: str = None, **kwargs) -> bool:
+        """
+        put() instrumentado (etapa tts_enqueue): o falar() dos apps
+
+        Alertas passam à frente de controle, que passa à frente de informativos;
+        frases de um mesmo grupo se substituem enquanto pendentes.
+        """
+        with metrics.stage('tts_enqueue'):
+            return self.put(payload, priority=priority, group=group, **kwargs)
+
+    def put_nowait(self, payload, **kwargs) -> bool:
+        return self.put(payload, block=False, **kwargs)
+
+    def get_message(self, block=True, timeout=None) -> Optional[SpeechMessage]:
+        """
+        Retira a próxima mensagem válida (None = sinal de parada)
+
+        Raises:
+            queue.Empty: se não houver mensagem dentro do timeout
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                agora = time.monotonic()
+                while self._heap:
+                    _, _, msg = heapq.heappop(self._heap)
+                    if msg is _STOP:
+                        return None
+                    if msg.cancelled:
+                        continue
+                    if msg.expires_at < agora:
+                        self._drop(msg, 'expired')
+                        continue
+                    self._count -= 1
+                    self._forget(msg)
+                    metrics.observe('tts_queue_wait_seconds', time.perf_counter() - msg.enqueued_at,
+                                    priority=str(msg.priority))
+                    return msg
+                if not block:
+                    raise queue.Empty
+                restante = None if limite is None else limite - agora
+                if restante is not None and restante <= 0:
+                    raise queue.Empty
+                self._cond.wait(restante)
+
+    def get(self, block=True, timeout=None):
+        """Como queue.Queue.get: retorna o texto (ou None para parar)"""
+        msg = self.get_message(block, timeout)
+        return None if msg is None else msg.payload
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def clear(self, below_priority: int = None):
+        """Descarta mensagens pendentes (opcionalmente só as menos urgentes)"""
+        with self._cond:
+            for _, _, msg in self._heap:
+                if msg is _STOP or msg.cancelled:
+                    continue
+                if below_priority is None or msg.priority > below_priority:
+                    self._drop(msg, 'superseded')
+
+    def qsize(self) -> int:
+        return self._count
+
+    def empty(self) -> bool:
+        return self._count == 0
+
+    def full(self) -> bool:
+        return bool(self.maxsize) and self._count >= self.maxsize
+
+    def task_done(self):
+        """Compatibilidade com queue.Queue"""
+        pass
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Servidor de Voz Fora do Processo
+Sistema Médico de Estabilidade da Cabeça
+
+O runAndWait do pyttsx3 às vezes trava o driver de áudio. Rodando numa
+thread do mesmo processo, isso segura recursos e pode impedir o
+encerramento do interpretador. Aqui o TTS roda num subprocesso pequeno,
+alimentado por um pipe (uma mensagem JSON por linha); um watchdog no
+processo principal reinicia o servidor se ele travar ou morrer. O loop de
+frames só enfileira mensagens e fica isolado de qualquer travamento de áudio.
+
+O subprocesso é iniciado com `python medical_speech_server.py` (e não com
+multiprocessing) para não reimportar o módulo principal da aplicação, que
+abre câmera e áudio na importação.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from medical_metrics import metrics
+from medical_tracing import tracer
+from medical_speech import utterance_text
+
+VOICE_HINTS = ('portuguese', 'brazil', 'brasil', 'pt-br', 'pt_br')
+
+# Espera entre tentativas quando o subprocesso nem chega a iniciar (dobra a cada falha)
+SPAWN_BACKOFF_MIN = 1.0
+SPAWN_BACKOFF_MAX = 30.0
+
+
+class SpeechServer:
+    """
+    Cliente do servidor de voz, com watchdog
+
+    Uma única thread (start_worker) consome a fila de voz e envia cada frase
+    ao subprocesso, aguardando a conclusão com prazo proporcional ao tamanho
+    do texto. Estouro de prazo, pipe quebrado ou falha no ping reiniciam o
+    subprocesso.
+    """
+
+    def __init__(self, rate: int = 150, volume: float = 0.8, phrases: Iterable[str] = (),
+                 base_timeout: float = 5.0, per_char_timeout: float = 0.12,
+                 start_timeout: float = 30.0, health_interval: float = 30.0):
+        self.config = {'rate': rate, 'volume': volume, 'phrases': list(phrases)}
+        self.base_timeout = base_timeout
+        self.per_char_timeout = per_char_timeout
+        self.start_timeout = start_timeout
+        self.health_interval = health_interval
+
+        self._process: Optional[subprocess.Popen] = None
+        self._responses: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._worker = None
+        self._stopping = False
+        self._fresh = True
+        self._backoff = 0.0
+        self._retry_at = 0.0  # Antes disso não tenta iniciar de novo (falha ao iniciar)
+        self.restarts = 0
+        self.timeouts = 0
+        self.last_error = None
+
+    # ----- Ciclo de vida do subprocesso -----
+
+    def _spawn(self):
+        script = os.path.abspath(__file__)
+        # O protocolo é UTF-8 nos dois sentidos; sem isso o filho decodifica
+        # os pipes com o codec local (cp1252 no Windows) e corrompe acentos
+        env = dict(os.environ, PYTHONIOENCODING='utf-8')
+        self._process = subprocess.Popen(
+            [sys.executable, '-u', script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(script),
+            env=env,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        self._responses = queue.Queue()
+        self._fresh = True  # Primeira resposta inclui carregar engine e cache
+        reader = threading.Thread(target=self._read_responses,
+                                  args=(self._process, self._responses),
+                                  name='speech-server-reader', daemon=True)
+        reader.start()
+        self._send({'cmd': 'config', **self.config})
+
+    @staticmethod
+    def _read_responses(process, responses):
+        """Lê respostas do subprocesso (uma por linha) até o pipe fechar"""
+        for linha in process.stdout:
+            try:
+                responses.put(json.loads(linha))
+            except ValueError:
+                continue
+        responses.put({'id': None, 'eof': True})
+
+    def _kill(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.kill()
+            process.wait(timeout=2)
+        except Exception:
+            pass
+
+    def _try_spawn(self) -> bool:
+        """Inicia o subprocesso; se falhar (Popen, pipe), agenda nova tentativa com backoff"""
+        try:
+            self._spawn()
+        except (OSError, ValueError) as e:
+            self._kill()
+            self._backoff = min(SPAWN_BACKOFF_MAX, self._backoff * 2) if self._backoff else SPAWN_BACKOFF_MIN
+            self._retry_at = time.monotonic() + self._backoff
+            self.last_error = f'falha ao iniciar ({e})'
+            print(f"❌ Servidor de voz não iniciou: {e} - nova tentativa em {self._backoff:.0f}s")
+            return False
+        return True
+
+    def _restart(self, motivo: str):
+        print(f"⚠️ Servidor de voz reiniciado: {motivo}")
+        self.last_error = motivo
+        self.restarts += 1
+        metrics.inc('tts_server_restarts_total')
+        self._kill()
+        if not self._stopping:
+            self._try_spawn()
+
+    def start(self):
+        """Inicia o subprocesso de voz (se falhar, a thread de voz tenta de novo)"""
+        with self._lock:
+            self._stopping = False
+            if not self.alive:
+                self._try_spawn()
+        if self.alive:
+            print(f"🔊 Servidor de voz iniciado (pid {self._process.pid})")
+
+    def stop(self, timeout: float = 2.0):
+        """Encerra o subprocesso sem depender do driver de áudio responder"""
+        self._stopping = True
+        process = self._process
+        if process is None:
+            return
+        # A thread de voz pode estar esperando uma frase: se o lock não vier
+        # a tempo, encerra sem enviar (escrever sem ele intercalaria no pipe)
+        if self._lock.acquire(timeout=timeout):
+            try:
+                self._send({'cmd': 'stop'})
+                process.wait(timeout=timeout)
+            except Exception:
+                pass
+            finally:
+                self._lock.release()
+        self._kill()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    # ----- Protocolo -----
+
+    def _send(self, mensagem: Dict[str, Any]):
+        self._process.stdin.write(json.dumps(mensagem, ensure_ascii=False) + '\n')
+        self._process.stdin.flush()
+
+    def _request(self, mensagem: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """Envia uma mensagem e aguarda a resposta correspondente (None = falha)"""
+        with self._lock:
+            if self._stopping:
+                return None
+            if not self.alive:
+                if time.monotonic() < self._retry_at:
+                    return None  # Aguardando o backoff da última falha ao iniciar
+                self._restart('processo encerrado')
+                if not self.alive:
+                    return None
+            self._next_id += 1
+            mensagem['id'] = self._next_id
+            try:
+                self._send(mensagem)
+            except (OSError, ValueError) as e:
+                self._restart(f'pipe quebrado ({e})')
+                return None
+
+            if self._fresh:
+                timeout += self.start_timeout
+            limite = time.monotonic() + timeout
+            while True:
+                restante = limite - time.monotonic()
+                try:
+                    resposta = self._responses.get(timeout=max(0.0, restante))
+                except queue.Empty:
+                    self.timeouts += 1
+                    self._restart(f"sem resposta em {timeout:.1f}s ({mensagem['cmd']})")
+                    return None
+                if resposta.get('eof'):
+                    self._restart('processo encerrado')
+                    return None
+                if resposta.get('id') == mensagem['id']:
+                    self._fresh = False
+                    self._backoff = 0.0
+                    return resposta
+
+    def speak(self, payload) -> bool:
+        """Fala uma frase no subprocesso (bloqueia apenas a thread de voz)"""
+        texto = utterance_text(payload)
+        timeout = self.base_timeout + self.per_char_timeout * len(texto)
+        resposta = self._request({'cmd': 'say', 'payload': payload}, timeout)
+        return bool(resposta and resposta.get('ok'))
+
+    def ping(self) -> bool:
+        """Verificação de saúde do subprocesso e do engine"""
+        resposta = self._request({'cmd': 'ping'}, self.base_timeout)
+        return bool(resposta and resposta.get('ok'))
+
+    # ----- Thread de voz do processo principal -----
+
+    def start_worker(self, fala_queue):
+        """Inicia a thread que consome a fila de voz e alimenta o subprocesso"""
+        self.start()
+        self._worker = threading.Thread(target=self._worker_loop, args=(fala_queue,),
+                                        name='speech-server-worker', daemon=True)
+        self._worker.start()
+        return self._worker
+
+    def _worker_loop(self, fala_queue):
+        ultimo_contato = time.monotonic()
+        while not self._stopping:
+            try:
+                payload = fala_queue.get(timeout=1)
+            except queue.Empty:
+                if time.monotonic() - ultimo_contato > self.health_interval:
+                    self.ping()
+                    ultimo_contato = time.monotonic()
+                continue
+            if payload is None:  # Sinal para parar
+                break
+            inicio = time.perf_counter()
+            try:
+                with tracer.span('tts.speak', cat='tts', texto=utterance_text(payload)):
+                    if not self.speak(payload):
+                        print(f"❌ Erro no TTS: '{utterance_text(payload)}' não foi falada")
+            except Exception as e:
+                # A thread de voz não pode morrer: a próxima frase tenta de novo
+                print(f"❌ Erro inesperado no servidor de voz: {e}")
+                self.last_error = str(e)
+            metrics.observe('tts_speak_seconds', time.perf_counter() - inicio)
+            ultimo_contato = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'alive': self.alive,
+            'pid': self._process.pid if self._process else None,
+            'restarts': self.restarts,
+            'timeouts': self.timeouts,
+            'last_error': self.last_error,
+            'retry_in': round(max(0.0, self._retry_at - time.monotonic()), 1)
+        }
+
+
+# ===== LADO DO SUBPROCESSO =====
+
+def create_engine(rate: int, volume: float):
+    """Cria e configura um engine pyttsx3 com voz em português, se houver"""
+    import pyttsx3
+    engine = pyttsx3.init()
+    for voice in engine.getProperty('voices') or []:
+        nome = f"{voice.name} {voice.id}".lower()
+        if any(indicador in nome for indicador in VOICE_HINTS):
+            engine.setProperty('voice', voice.id)
+            print(f"🇧🇷 Voz em português encontrada: {voice.name}")
+            break
+    engine.setProperty('rate', rate)
+    engine.setProperty('volume', volume)
+    return engine
+
+
+def serve():
+    """Loop do subprocesso: lê comandos do stdin e responde no stdout"""
+    from medical_speech import PersistentEngine, PhraseCache, audio_player_available
+
+    # Mesmo sem PYTHONIOENCODING (execução manual), os pipes são UTF-8
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+
+    # stdout é reservado ao protocolo; mensagens de log vão para stderr
+    protocolo = sys.stdout
+    sys.stdout = sys.stderr
+
+    def responder(mensagem):
+        protocolo.write(json.dumps(mensagem) + '\n')
+        protocolo.flush()
+
+    config = {'rate': 150, 'volume': 0.8, 'phrases': []}
+    tts = None
+    cache = None
+
+    for linha in sys.stdin:
+        try:
+            mensagem = json.loads(linha)
+        except ValueError:
+            continue
+        cmd = mensagem.get('cmd')
+
+        if cmd == 'config':
+            config.update({k: v for k, v in mensagem.items() if k != 'cmd'})
+            tts = PersistentEngine(lambda: create_engine(config['rate'], config['volume']))
+            if tts.ensure() and audio_player_available():
+                try:
+                    cache = PhraseCache(tts.engine)
+                    cache.warm(config['phrases'])
+                except Exception as e:
+                    print(f"⚠️ Cache de voz desativado: {e}")
+                    cache = None
+        elif cmd == 'say':
+            payload = mensagem.get('payload')
+            ok = False
+            if tts is not None and tts.ensure():
+                if cache is not None:
+                    cache.engine = tts.engine
+                    try:
+                        ok = cache.speak(payload)
+                    except Exception as e:
+                        print(f"⚠️ Erro no cache de voz: {e}")
+                if not ok:
+                    ok = tts.say(utterance_text(payload))
+            responder({'id': mensagem.get('id'), 'ok': ok})
+        elif cmd == 'ping':
+            ok = tts is not None and tts.check_health(force=True)
+            responder({'id': mensagem.get('id'), 'ok': ok})
+        elif cmd == 'stop':
+            break
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,100 @@
+# Inicialização Preguiçosa dos Apps
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Importar um app não abre câmera, áudio nem modelos: os recursos são
+# inicializados uma única vez, no primeiro uso (primeira requisição que
+# precisa deles) ou pelo aquecimento em segundo plano, iniciado logo depois
+# que o servidor já está ouvindo. A página inicial responde imediatamente;
+# rotas que dependem dos recursos esperam o aquecimento terminar (ou recebem
+# 503 se ele falhou). Os modelos carregados no aquecimento ficam no registro
+# (medical_models), não na thread de aquecimento, e servem às rotas de vídeo.
+
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from flask import Flask, jsonify, request
+
+# Rotas que não dependem dos recursos (não esperam o aquecimento)
+DEFAULT_EXEMPT = ('index', 'static', 'metrics_endpoint')
+
+
+class LazyResources:
+    """Executa a função de inicialização uma única vez, sob demanda ou em segundo plano"""
+
+    def __init__(self, name: str, init: Callable[[], Any]):
+        self.name = name
+        self._init = init
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.error = None
+        self.duration = None
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def ensure(self) -> bool:
+        """Inicializa se ainda não foi feito (bloqueia durante a inicialização); True se sem erro"""
+        if self._done.is_set():
+            return self.error is None
+        with self._lock:
+            if not self._done.is_set():
+                inicio = time.perf_counter()
+                try:
+                    self._init()
+                except Exception as e:
+                    # Não tenta de novo a cada requisição: o erro fica em status()
+                    self.error = str(e)
+                    print(f"❌ Erro ao inicializar {self.name}: {e}")
+                self.duration = time.perf_counter() - inicio
+                self._done.set()
+                if self.error is None:
+                    print(f"✅ {self.name} pronto ({self.duration:.1f}s)")
+        return self.error is None
+
+    def warm_up(self) -> threading.Thread:
+        """Inicializa numa thread em segundo plano (idempotente)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.ensure, name=f'{self.name}-warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'error': self.error,
+            'duration_s': round(self.duration, 2) if self.duration is not None else None
+        }
+
+
+def guard(app: Flask, resources: LazyResources, exempt: Iterable[str] = DEFAULT_EXEMPT):
+    """
+    Faz as rotas (exceto `exempt`) esperarem pelos recursos antes de executar
+
+    Se a inicialização falhou, responde 503 em vez de executar a rota com os
+    recursos ausentes.
+    """
+    isentas = frozenset(exempt)
+
+    @app.before_request
+    def garantir_recursos():
+        if request.endpoint not in isentas and not resources.ensure():
+            return jsonify({
+                'error': f'{resources.name} indisponível: {resources.error}',
+                'startup': resources.status()
+            }), 503
+
+
+def serve(app: Flask, resources: LazyResources, host: str = '0.0.0.0', port: int = 5000):
+    """Abre o socket, inicia o aquecimento em segundo plano e atende as requisições"""
+    from werkzeug.serving import make_server
+
+    servidor = make_server(host, port, app, threaded=True)
+    print(f"🌐 Servidor ouvindo em http://{host}:{port}")
+    resources.warm_up()
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.server_close()
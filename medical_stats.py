@@ -0,0 +1,166 @@
+# Estatísticas da Sessão em Memória Constante
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Estimadores em fluxo para o controle de qualidade clínico: quantis do
+# movimento (p50/p95/p99) pelo algoritmo P² de Jain e Chlamtac, histograma
+# de buckets fixos, tempo em cada estado e maior trecho estável. Nenhuma
+# amostra é guardada: a memória por sessão é a mesma para um exame de 30
+# segundos ou um PET de 90 minutos.
+
+import math
+from typing import Any, Dict, Optional, Sequence
+
+from medical_metrics import Histogram
+
+# Limites dos buckets de movimento (px/frame)
+MOVEMENT_BUCKETS = (0.5, 1, 2, 3, 5, 8, 10, 15, 20, 30, 50)
+
+STATES = ('no_head', 'unstable', 'stable', 'ready')
+
+
+class P2Quantile:
+    """
+    Estimador P² de um quantil (Jain & Chlamtac, 1985)
+
+    Mantém cinco marcadores cujas alturas são ajustadas por interpolação
+    parabólica a cada observação; memória e custo O(1).
+    """
+
+    def __init__(self, p: float):
+        self.p = p
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        p = self.p
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def observe(self, valor: float):
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            q.append(valor)
+            q.sort()
+            return
+
+        n = self._positions
+        # Célula onde a observação cai (ajusta os extremos)
+        if valor < q[0]:
+            q[0] = valor
+            k = 0
+        elif valor >= q[4]:
+            q[4] = valor
+            k = 3
+        else:
+            k = 0
+            while valor >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Ajusta os marcadores intermediários
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if d > 0 else -1
+                candidato = self._parabolic(i, s)
+                if not q[i - 1] < candidato < q[i + 1]:
+                    candidato = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = candidato
+                n[i] += s
+
+    def _parabolic(self, i: int, s: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + s / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            # Poucas amostras: quantil exato das amostras ordenadas
+            indice = min(len(self._heights) - 1, int(math.ceil(self.p * len(self._heights))) - 1)
+            return self._heights[max(0, indice)]
+        return self._heights[2]
+
+
+class SessionStats:
+    """
+    Estatísticas de uma sessão alimentadas por analyze_stability
+
+    advance() é chamado no início de cada frame, com o estado em que o
+    analisador ficou desde o frame anterior; observe_movement() recebe cada
+    movimento medido.
+    """
+
+    def __init__(self, quantiles: Sequence[float] = (0.5, 0.95, 0.99), buckets=MOVEMENT_BUCKETS):
+        self.quantiles = tuple(quantiles)
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self._estimators = [P2Quantile(p) for p in self.quantiles]
+        self.histogram = Histogram(self.buckets)
+        self.movement_max = 0.0
+        self.time_in_state = dict.fromkeys(STATES, 0.0)
+        self.longest_stable_run = 0.0
+        self._run_start = None  # Início do trecho estável corrente
+        self._last_time = None
+        self.started_at = None
+
+    def observe_movement(self, movimento: float):
+        for estimador in self._estimators:
+            estimador.observe(movimento)
+        self.histogram.observe(movimento)
+        self.movement_max = max(self.movement_max, movimento)
+
+    def advance(self, agora: float, estado: str):
+        """Credita o intervalo desde a chamada anterior ao estado mantido nele"""
+        if self._last_time is None:
+            self.started_at = agora
+            self._last_time = agora
+            return
+        intervalo = max(0.0, agora - self._last_time)
+        self.time_in_state[estado] += intervalo
+
+        if estado in ('stable', 'ready'):
+            if self._run_start is None:
+                self._run_start = self._last_time
+            self.longest_stable_run = max(self.longest_stable_run, agora - self._run_start)
+        else:
+            self._run_start = None
+        self._last_time = agora
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumo serializável em JSON"""
+        total = sum(self.time_in_state.values())
+        quantis = {}
+        for p, estimador in zip(self.quantiles, self._estimators):
+            valor = estimador.value
+            quantis[f'p{p * 100:g}'] = round(valor, 2) if valor is not None else None
+        contagem = self.histogram.count
+        return {
+            'movement': {
+                'count': contagem,
+                'mean': round(self.histogram.sum / contagem, 2) if contagem else None,
+                'max': round(self.movement_max, 2),
+                **quantis
+            },
+            'histogram': {
+                'buckets': list(self.buckets) + ['+Inf'],
+                'counts': list(self.histogram.counts)
+            },
+            'time_in_state': {estado: round(t, 2) for estado, t in self.time_in_state.items()},
+            'time_in_state_pct': {estado: round(t / total * 100, 1) if total else 0.0
+                                  for estado, t in self.time_in_state.items()},
+            'longest_stable_run': round(self.longest_stable_run, 2),
+            'duration': round(total, 2)
+        }
@@ -0,0 +1,507 @@
+# Armazenamento de Sessões em SQLite
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Persiste procedimentos, transições de estado e estatísticas de resumo num
+# banco SQLite local em modo WAL. As escritas são apenas enfileiradas pelo
+# loop de frames e pelas rotas; uma thread de gravação as agrupa e grava em
+# uma única transação por lote, de modo que nenhuma chamada feita durante o
+# procedimento toca o disco. Leituras usam conexões próprias e, graças ao
+# WAL, não bloqueiam nem são bloqueadas pela thread de gravação.
+#
+# Painéis consultam tabelas de agregação diária e semanal (rollup_daily,
+# rollup_weekly), atualizadas incrementalmente quando cada sessão termina, de
+# modo que nenhuma consulta de histórico varre sessões ou transições.
+#
+# O banco fica em ESTABILIDADE_DB (padrão: ~/.estabilidade_cranio/sessions.db).
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser('~'), '.estabilidade_cranio', 'sessions.db')
+
+SCHEMA_VERSION = 2
+
+# Exame repetido (heurística): mesmo procedimento na mesma sala iniciado até
+# esse intervalo (s) depois do fim do anterior; o operador pode informar
+# explicitamente (flag repeat em start_procedure), o que prevalece.
+REPEAT_WINDOW = 15 * 60
+
+ROLLUP_TABLES = ('rollup_daily', 'rollup_weekly')
+
+ROLLUP_SCHEMA = '''CREATE TABLE IF NOT EXISTS {tabela} (
+    period_start TEXT NOT NULL,      -- AAAA-MM-DD (semanal: segunda-feira)
+    room TEXT NOT NULL,
+    procedure_type TEXT NOT NULL,
+    population TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    repeats INTEGER NOT NULL DEFAULT 0,
+    forced INTEGER NOT NULL DEFAULT 0,
+    ready_sessions INTEGER NOT NULL DEFAULT 0,
+    time_to_ready_sum REAL NOT NULL DEFAULT 0,
+    duration_s REAL NOT NULL DEFAULT 0,
+    unstable_s REAL NOT NULL DEFAULT 0,
+    alarms INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period_start, room, procedure_type, population)
+)'''
+
+SCHEMA_V1 = [
+    '''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        room TEXT NOT NULL,
+        app TEXT,
+        procedure_type TEXT NOT NULL,
+        population TEXT,
+        day TEXT NOT NULL,               -- AAAA-MM-DD (data local do início)
+        started_at TEXT NOT NULL,        -- ISO 8601
+        ended_at TEXT,
+        duration_s REAL,
+        forced INTEGER NOT NULL DEFAULT 0,
+        time_to_ready_s REAL,            -- Posicionamento: detecção contínua da cabeça -> pronto
+        stability_percentage REAL,
+        max_movement REAL,
+        movement_p50 REAL,
+        movement_p95 REAL,
+        movement_p99 REAL,
+        time_stable_s REAL,
+        time_unstable_s REAL,
+        time_no_head_s REAL,
+        longest_stable_run_s REAL,
+        alarms INTEGER NOT NULL DEFAULT 0,
+        trace_path TEXT,
+        stats_json TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS transitions (
+        id INTEGER PRIMARY KEY,
+        session_id TEXT NOT NULL REFERENCES sessions(id),
+        at REAL NOT NULL,                -- Relógio do sistema (epoch)
+        offset_s REAL,                   -- Segundos desde o início da sessão
+        stable INTEGER NOT NULL,
+        reason TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_room_day ON sessions(room, day)',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_procedure_day ON sessions(procedure_type, day)',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_day ON sessions(day)',
+    'CREATE INDEX IF NOT EXISTS idx_transitions_session ON transitions(session_id, at)',
+]
+
+SCHEMA_V2 = [
+    'ALTER TABLE sessions ADD COLUMN repeat INTEGER',
+    'ALTER TABLE sessions ADD COLUMN repeat_source TEXT',  # 'flag' ou 'heuristic'
+    'ALTER TABLE sessions ADD COLUMN rolled_up INTEGER NOT NULL DEFAULT 0',
+    'CREATE INDEX IF NOT EXISTS idx_sessions_room_procedure ON sessions(room, procedure_type, started_at)',
+] + [ROLLUP_SCHEMA.format(tabela=tabela) for tabela in ROLLUP_TABLES]
+
+MIGRATIONS = {1: SCHEMA_V1, 2: SCHEMA_V2}
+
+# Colunas dos agregados somadas a cada sessão encerrada
+ROLLUP_COLUMNS = ('sessions', 'repeats', 'forced', 'ready_sessions', 'time_to_ready_sum',
+                  'duration_s', 'unstable_s', 'alarms')
+
+
+def db_path() -> str:
+    return os.environ.get('ESTABILIDADE_DB', DEFAULT_DB_PATH)
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conexao = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    conexao.row_factory = sqlite3.Row
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.execute('PRAGMA synchronous=NORMAL')  # Seguro em WAL; fsync só no checkpoint
+    conexao.execute('PRAGMA foreign_keys=ON')
+    return conexao
+
+
+class SessionStore:
+    """
+    Banco de sessões com gravação em lote numa thread dedicada
+
+    Os métodos de escrita (begin_session, add_transition, end_session) só
+    enfileiram; flush() espera o que já foi enfileirado chegar ao disco.
+    """
+
+    def __init__(self, path: str = None, batch_size: int = 500, flush_interval: float = 0.5):
+        """
+        Args:
+            path: Arquivo do banco (padrão: ESTABILIDADE_DB)
+            batch_size: Máximo de operações por transação
+            flush_interval: Tempo máximo (s) que uma operação espera pelo lote
+        """
+        self.path = path or db_path()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._writer = None
+        self._local = threading.local()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    # ----- Ciclo de vida -----
+
+    def start(self):
+        """Cria o esquema (síncrono) e inicia a thread de gravação"""
+        if self._writer is not None:
+            return
+        diretorio = os.path.dirname(self.path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        conexao = _open(self.path)
+        try:
+            self._migrate(conexao)
+        finally:
+            conexao.close()
+        self._writer = threading.Thread(target=self._write_loop, name='session-store', daemon=True)
+        self._writer.start()
+
+    def _migrate(self, conexao: sqlite3.Connection):
+        versao = conexao.execute('PRAGMA user_version').fetchone()[0]
+        for alvo in range(versao + 1, SCHEMA_VERSION + 1):
+            with conexao:
+                for comando in MIGRATIONS[alvo]:
+                    conexao.execute(comando)
+                if alvo == 2 and versao >= 1:
+                    # Sessões gravadas antes dos agregados entram de uma vez
+                    self._rebuild_rollups(conexao)
+                conexao.execute(f'PRAGMA user_version={alvo}')
+
+    def close(self, timeout: float = 5.0):
+        """Grava o que estiver pendente e encerra a thread"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join(timeout)
+        self._writer = None
+
+    # ----- Escrita (enfileirada) -----
+
+    def _submit(self, sql, params: tuple = ()):
+        """Enfileira um comando SQL ou uma função f(conexao) executada no lote"""
+        self._queue.put((sql, params))
+
+    def begin_session(self, session_id: str, room: str, procedure_type: str, population: str = None,
+                      app: str = None, started_at: datetime = None, forced: bool = False,
+                      trace_path: str = None, repeat: bool = None):
+        """
+        Abre uma sessão
+
+        Args:
+            repeat: Exame repetido informado pelo operador; None aplica a
+                heurística (REPEAT_WINDOW) quando a sessão terminar
+        """
+        inicio = started_at or datetime.now()
+        self._submit(
+            'INSERT OR REPLACE INTO sessions (id, room, app, procedure_type, population, day, started_at, '
+            'forced, trace_path, repeat, repeat_source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (session_id, room, app, procedure_type, population, inicio.strftime('%Y-%m-%d'),
+             inicio.isoformat(timespec='seconds'), int(forced), trace_path,
+             None if repeat is None else int(repeat), None if repeat is None else 'flag'))
+
+    def add_transition(self, session_id: str, stable: bool, reason: str,
+                       offset_s: float = None, at: float = None):
+        self._submit(
+            'INSERT INTO transitions (session_id, at, offset_s, stable, reason) VALUES (?, ?, ?, ?, ?)',
+            (session_id, at if at is not None else time.time(), offset_s, int(stable), reason))
+
+    def end_session(self, session_id: str, duration_s: float, stats: Dict[str, Any] = None,
+                    report: Dict[str, Any] = None, time_to_ready_s: float = None, ended_at: datetime = None):
+        """Fecha a sessão com o resumo de SessionStats.summary() e o relatório do analisador"""
+        stats = stats or {}
+        report = report or {}
+        movimento = stats.get('movement', {})
+        estados = stats.get('time_in_state', {})
+        self._submit(
+            'UPDATE sessions SET ended_at = ?, duration_s = ?, time_to_ready_s = ?, stability_percentage = ?, '
+            'max_movement = ?, movement_p50 = ?, movement_p95 = ?, movement_p99 = ?, time_stable_s = ?, '
+            'time_unstable_s = ?, time_no_head_s = ?, longest_stable_run_s = ?, stats_json = ?, '
+            "alarms = (SELECT COUNT(*) FROM transitions WHERE session_id = ? AND reason = 'movement') "
+            'WHERE id = ?',
+            ((ended_at or datetime.now()).isoformat(timespec='seconds'), duration_s, time_to_ready_s,
+             report.get('stability_percentage'), movimento.get('max'),
+             movimento.get('p50'), movimento.get('p95'), movimento.get('p99'),
+             (estados.get('stable', 0.0) + estados.get('ready', 0.0)) if estados else None,
+             estados.get('unstable'), estados.get('no_head'), stats.get('longest_stable_run'),
+             json.dumps(stats, ensure_ascii=False) if stats else None,
+             session_id, session_id))
+        self._submit(self._close_session, (session_id,))
+
+    # ----- Agregados (executados na thread de gravação) -----
+
+    def _close_session(self, conexao: sqlite3.Connection, session_id: str):
+        """Classifica repetição (se não informada) e soma a sessão aos agregados"""
+        sessao = conexao.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if sessao is None or sessao['rolled_up']:
+            return
+        if sessao['repeat'] is None:
+            anterior = conexao.execute(
+                'SELECT ended_at FROM sessions WHERE room = ? AND procedure_type = ? AND started_at < ? '
+                'AND id != ? AND ended_at IS NOT NULL ORDER BY started_at DESC LIMIT 1',
+                (sessao['room'], sessao['procedure_type'], sessao['started_at'], session_id)).fetchone()
+            repetido = anterior is not None and (
+                datetime.fromisoformat(sessao['started_at']) - datetime.fromisoformat(anterior['ended_at'])
+            ).total_seconds() <= REPEAT_WINDOW
+            conexao.execute("UPDATE sessions SET repeat = ?, repeat_source = 'heuristic' WHERE id = ?",
+                            (int(repetido), session_id))
+            sessao = conexao.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        self._add_to_rollups(conexao, sessao)
+        conexao.execute('UPDATE sessions SET rolled_up = 1 WHERE id = ?', (session_id,))
+
+    @staticmethod
+    def _add_to_rollups(conexao: sqlite3.Connection, sessao: sqlite3.Row):
+        dia = date.fromisoformat(sessao['day'])
+        semana = dia - timedelta(days=dia.weekday())
+        pronto = sessao['time_to_ready_s'] is not None
+        valores = (1, int(bool(sessao['repeat'])), int(bool(sessao['forced'])), int(pronto),
+                   sessao['time_to_ready_s'] or 0.0, sessao['duration_s'] or 0.0,
+                   sessao['time_unstable_s'] or 0.0, sessao['alarms'] or 0)
+        colunas = ', '.join(ROLLUP_COLUMNS)
+        marcadores = ', '.join('?' * len(ROLLUP_COLUMNS))
+        somas = ', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_COLUMNS)
+        for tabela, inicio in (('rollup_daily', dia), ('rollup_weekly', semana)):
+            conexao.execute(
+                f'INSERT INTO {tabela} (period_start, room, procedure_type, population, {colunas}) '
+                f'VALUES (?, ?, ?, ?, {marcadores}) '
+                f'ON CONFLICT(period_start, room, procedure_type, population) DO UPDATE SET {somas}',
+                (inicio.isoformat(), sessao['room'], sessao['procedure_type'],
+                 sessao['population'] or '', *valores))
+
+    def _rebuild_rollups(self, conexao: sqlite3.Connection):
+        """Recalcula os agregados a partir das sessões encerradas"""
+        for tabela in ROLLUP_TABLES:
+            conexao.execute(f'DELETE FROM {tabela}')
+        conexao.execute('UPDATE sessions SET rolled_up = 0')
+        for sessao in conexao.execute('SELECT * FROM sessions WHERE ended_at IS NOT NULL').fetchall():
+            self._add_to_rollups(conexao, sessao)
+            conexao.execute('UPDATE sessions SET rolled_up = 1 WHERE id = ?', (sessao['id'],))
+
+    def rebuild_rollups(self):
+        """Enfileira a reconstrução dos agregados (ex.: após correção manual de sessões)"""
+        self._submit(self._rebuild_rollups)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera as operações já enfileiradas serem gravadas"""
+        if self._writer is None:
+            return False
+        gravado = threading.Event()
+        self._queue.put(gravado)
+        return gravado.wait(timeout)
+
+    # ----- Thread de gravação -----
+
+    def _write_loop(self):
+        conexao = _open(self.path)
+        encerrar = False
+        while not encerrar:
+            item = self._queue.get()
+            lote, eventos = [], []
+            prazo = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    encerrar = True
+                elif isinstance(item, threading.Event):
+                    eventos.append(item)
+                    item = None
+                    break  # flush(): grava já
+                else:
+                    lote.append(item)
+                if encerrar or len(lote) >= self.batch_size:
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=restante)
+                except queue.Empty:
+                    break
+            try:
+                self._execute(conexao, lote)
+            except Exception as e:
+                # Nada pode derrubar a thread: flush() ficaria esperando para sempre
+                self.errors += 1
+                print(f"❌ Erro inesperado na gravação de sessões: {e}")
+            finally:
+                for evento in eventos:
+                    evento.set()
+        conexao.close()
+
+    @staticmethod
+    def _apply(conexao: sqlite3.Connection, operacao: tuple):
+        sql, params = operacao
+        if callable(sql):
+            sql(conexao, *params)
+        else:
+            conexao.execute(sql, params)
+
+    def _execute(self, conexao: sqlite3.Connection, lote: List[tuple]):
+        if not lote:
+            return
+        try:
+            with conexao:
+                for operacao in lote:
+                    self._apply(conexao, operacao)
+            self.written += len(lote)
+            self.batches += 1
+            return
+        except Exception as e:
+            if len(lote) == 1:
+                self.errors += 1
+                print(f"❌ Erro ao gravar sessões: {e}")
+                return
+        # Um comando inválido desfez o lote: refaz um a um, descartando só os que falham
+        for operacao in lote:
+            try:
+                with conexao:
+                    self._apply(conexao, operacao)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Operação de sessão descartada: {e}")
+        self.batches += 1
+
+    # ----- Leitura -----
+
+    def connect(self) -> sqlite3.Connection:
+        """Conexão de leitura da thread atual (reaproveitada entre consultas)"""
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = self._local.conexao = _open(self.path)
+        return conexao
+
+    @staticmethod
+    def _session_filters(room=None, procedure_type=None, since=None, until=None):
+        filtros, params = [], []
+        for coluna, operador, valor in (('room', '=', room), ('procedure_type', '=', procedure_type),
+                                        ('day', '>=', since), ('day', '<=', until)):
+            if valor is not None:
+                filtros.append(f'{coluna} {operador} ?')
+                params.append(valor)
+        return (f"WHERE {' AND '.join(filtros)}" if filtros else ''), params
+
+    def list_sessions(self, room: str = None, procedure_type: str = None, since: str = None,
+                      until: str = None, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        """Sessões mais recentes primeiro; since/until são datas AAAA-MM-DD (inclusivas)"""
+        where, params = self._session_filters(room, procedure_type, since, until)
+        linhas = self.connect().execute(
+            f'SELECT * FROM sessions {where} ORDER BY started_at DESC LIMIT ? OFFSET ?',
+            (*params, limit, offset)).fetchall()
+        return [self._session_dict(linha) for linha in linhas]
+
+    def iter_sessions(self, room: str = None, procedure_type: str = None, since: str = None,
+                      until: str = None, batch: int = 1000) -> Iterator[List[sqlite3.Row]]:
+        """
+        Percorre as sessões em ordem cronológica, `batch` linhas por vez
+
+        Usa uma conexão própria (fechada ao final), pois o consumidor pode
+        ser uma resposta em streaming que dura mais que a requisição.
+        """
+        where, params = self._session_filters(room, procedure_type, since, until)
+        conexao = _open(self.path)
+        try:
+            cursor = conexao.execute(f'SELECT * FROM sessions {where} ORDER BY started_at', params)
+            while True:
+                linhas = cursor.fetchmany(batch)
+                if not linhas:
+                    break
+                yield linhas
+        finally:
+            conexao.close()
+
+    def session_columns(self) -> List[tuple]:
+        """(nome, tipo declarado) das colunas da tabela de sessões"""
+        return [(linha['name'], linha['type']) for linha in
+                self.connect().execute('PRAGMA table_info(sessions)')]
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Sessão com suas transições"""
+        conexao = self.connect()
+        linha = conexao.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if linha is None:
+            return None
+        sessao = self._session_dict(linha)
+        sessao['transitions'] = [dict(t) for t in conexao.execute(
+            'SELECT at, offset_s, stable, reason FROM transitions WHERE session_id = ? ORDER BY at',
+            (session_id,))]
+        return sessao
+
+    @staticmethod
+    def _session_dict(linha: sqlite3.Row) -> Dict[str, Any]:
+        sessao = dict(linha)
+        sessao['forced'] = bool(sessao['forced'])
+        stats = sessao.pop('stats_json', None)
+        sessao['stats'] = json.loads(stats) if stats else None
+        return sessao
+
+    # ----- Histórico (consultas só sobre os agregados) -----
+
+    def _rollup_query(self, period: str, select: str, group: List[str], since: str = None,
+                      until: str = None, **filtros) -> List[Dict[str, Any]]:
+        if period not in ('day', 'week'):
+            raise ValueError(f"period deve ser 'day' ou 'week', recebido '{period}'")
+        tabela = 'rollup_daily' if period == 'day' else 'rollup_weekly'
+        condicoes, params = [], []
+        if since is not None:
+            condicoes.append('period_start >= ?')
+            params.append(since)
+        if until is not None:
+            condicoes.append('period_start <= ?')
+            params.append(until)
+        for coluna, valor in filtros.items():
+            if valor is not None:
+                condicoes.append(f'{coluna} = ?')
+                params.append(valor)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+        agrupamento = ', '.join(group)
+        linhas = self.connect().execute(
+            f'SELECT {agrupamento}, {select} FROM {tabela} {where} '
+            f'GROUP BY {agrupamento} ORDER BY {agrupamento}', params).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def repeat_rates(self, period: str = 'week', since: str = None, until: str = None,
+                     room: str = None) -> List[Dict[str, Any]]:
+        """Taxa de exames repetidos por procedimento e período"""
+        linhas = self._rollup_query(
+            period, 'SUM(sessions) AS sessions, SUM(repeats) AS repeats',
+            ['period_start', 'procedure_type'], since, until, room=room)
+        for linha in linhas:
+            linha['repeat_rate'] = round(linha['repeats'] / linha['sessions'], 4) if linha['sessions'] else 0.0
+        return linhas
+
+    def time_to_ready(self, period: str = 'week', since: str = None, until: str = None,
+                      procedure_type: str = None) -> List[Dict[str, Any]]:
+        """Tempo médio de posicionamento (até ficar pronto) por população e período"""
+        linhas = self._rollup_query(
+            period, 'SUM(sessions) AS sessions, SUM(ready_sessions) AS ready_sessions, '
+                    'SUM(time_to_ready_sum) AS time_to_ready_sum',
+            ['period_start', 'population'], since, until, procedure_type=procedure_type)
+        for linha in linhas:
+            soma = linha.pop('time_to_ready_sum')
+            linha['mean_time_to_ready_s'] = (round(soma / linha['ready_sessions'], 2)
+                                             if linha['ready_sessions'] else None)
+        return linhas
+
+    def instability(self, period: str = 'day', since: str = None, until: str = None,
+                    room: str = None) -> List[Dict[str, Any]]:
+        """Minutos de instabilidade por sala e período"""
+        linhas = self._rollup_query(
+            period, 'SUM(sessions) AS sessions, SUM(unstable_s) AS unstable_s, '
+                    'SUM(duration_s) AS duration_s, SUM(alarms) AS alarms',
+            ['period_start', 'room'], since, until, room=room)
+        for linha in linhas:
+            linha['unstable_minutes'] = round(linha.pop('unstable_s') / 60.0, 2)
+            linha['procedure_minutes'] = round(linha.pop('duration_s') / 60.0, 2)
+        return linhas
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'running': self._writer is not None,
+            'pending': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors
+        }
@@ -14,22 +14,45 @@ Aplicação: Monitoramento de estabilidade da cabeça durante exames médicos:
 from flask import Flask, Response, jsonify, render_template_string, request
 import cv2
 import numpy as np
-import threading
+import os
 import time
 import json
 from datetime import datetime, timedelta
-import queue
-import pyttsx3
 from medical_head_stability import MedicalHeadStabilityAnalyzer
 from medical_configs import get_procedure_config
+from medical_metrics import metrics
+from medical_models import models
+from medical_profiler import profiler
+from medical_budget import FrameBudgetScheduler
+from medical_calibration import calibrate, pipeline_settings
+from medical_speech import SpeechQueue, duration_fragments, PRIORITY_CONTROL
+from medical_speech_server import SpeechServer
+from medical_alarm import MovementAlarm, movement_feedback
+from medical_recorder import SessionRecording
+from medical_store import SessionStore
+from medical_export import CONTENT_TYPES, export
+from medical_admin import admin_permitido, register as register_admin
+from medical_startup import DEFAULT_EXEMPT, LazyResources, guard, serve
+from medical_capture import CameraSource, source_from_env
+from medical_announcements import AnnouncementScheduler
 
 app = Flask(__name__)
 
+# /metrics, /admin/* e spans das requisições (antes de guard: o span inclui a espera)
+register_admin(app)
+
 # ===== CONFIGURAÇÕES GLOBAIS =====
 camera = None
 analyzer = None
-fala_queue = queue.Queue()
-tts_engine = None
+fala_queue = SpeechQueue()
+speech_server = None
+movement_alarm = None
+gravacao = SessionRecording(app='medical_system_pro')  # Trajetória do procedimento em andamento (sem imagens)
+session_store = None  # Banco SQLite de sessões (gravação em lote)
+current_session = None  # {'id', 'source_start'} do procedimento em andamento
+positioning = {'since': None, 'time_to_ready': None}  # Posicionamento do paciente atual
+ROOM_ID = os.environ.get('ESTABILIDADE_SALA', 'sala-1')
+frame_budget = FrameBudgetScheduler(budget_ms=33, base_settings={'jpeg_quality': 95})
 system_status = {
     'procedure_active': False,
     'start_time': None,
@@ -42,49 +65,169 @@ system_status = {
     'warnings': []
 }
 
+falar = fala_queue.say  # Instrumentado (tts_enqueue); prioridade e grupo como em put()
+
+metrics.gauge_callback('tts_queue_depth', fala_queue.qsize)
+
+# Anúncios periódicos no intervalo da população (feedback_frequency)
+announcements = AnnouncementScheduler(lambda room, texto: falar(texto, group='status'))
+
+def configure_announcements():
+    """Aplica procedimento e população atuais ao agendador de anúncios"""
+    announcements.configure_room(ROOM_ID, system_status['procedure_name'],
+                                 system_status['patient_population'])
+
+# Frases fixas pré-sintetizadas pelo servidor de voz
+FRASES_CONHECIDAS = [
+    "Procedimento médico iniciado. Paciente estável.",
+    "Procedimento iniciado com paciente instável. Monitorando.",
+    "Procedimento finalizado. Duração:",
+    "Movimento detectado. Mantenha a cabeça imóvel.",
+    "Paciente estável. Sistema pronto para iniciar procedimento médico.",
+    "Paciente em posição. Mantendo estabilidade.",
+]
+
 def init_tts():
-    """Inicializa sistema de Text-to-Speech"""
-    global tts_engine
+    """Inicializa o servidor de voz (subprocesso) e a thread que o alimenta"""
+    global speech_server
     try:
         print("🔊 Configurando sistema de voz...")
-        tts_engine = pyttsx3.init()
-        
-        voices = tts_engine.getProperty('voices')
-        for voice in voices:
-            if 'portuguese' in voice.name.lower() or 'brazil' in voice.name.lower():
-                tts_engine.setProperty('voice', voice.id)
-                print(f"🇧🇷 Voz em português encontrada: {voice.name}")
-                break
-        
-        tts_engine.setProperty('rate', 150)
-        tts_engine.setProperty('volume', 0.8)
+        speech_server = SpeechServer(rate=150, volume=0.8, phrases=FRASES_CONHECIDAS)
+        speech_server.start_worker(fala_queue)
         print("🔊 TTS inicializado com sucesso")
-        
-        # Thread para processar fala
-        def process_speech():
-            while True:
-                try:
-                    text = fala_queue.get(timeout=1)
-                    if text:
-                        tts_engine.say(text)
-                        tts_engine.runAndWait()
-                except queue.Empty:
-                    continue
-                except Exception as e:
-                    print(f"❌ Erro no TTS: {e}")
-        
-        speech_thread = threading.Thread(target=process_speech, daemon=True)
-        speech_thread.start()
-        
     except Exception as e:
         print(f"❌ Erro ao inicializar TTS: {e}")
 
+def init_alarm():
+    """Inicializa o alarme sonoro de movimento (independente da fila de voz)"""
+    global movement_alarm
+    try:
+        movement_alarm = MovementAlarm(debounce=2.0)
+        movement_alarm.start()
+        print("🔔 Alarme de movimento pronto")
+    except Exception as e:
+        print(f"❌ Erro ao inicializar alarme: {e}")
+
+def on_analyzer_state(is_stable, reason):
+    """Transições vão para o banco; bipe e voz para movimento do paciente"""
+    if not system_status['procedure_active']:
+        return
+    registrar_transicao(is_stable, reason)
+    movement_feedback(movement_alarm, falar, is_stable, reason)
+
+def iniciar_gravacao():
+    """Abre a gravação da trajetória do procedimento que está começando"""
+    gravacao.start(analyzer, room=ROOM_ID, procedure=system_status['procedure_name'],
+                   population=system_status['patient_population'])
+
+def init_store():
+    """Abre o banco de sessões e inicia a thread de gravação"""
+    global session_store
+    try:
+        session_store = SessionStore()
+        session_store.start()
+        print(f"🗄️ Banco de sessões: {session_store.path}")
+    except Exception as e:
+        print(f"❌ Erro ao abrir banco de sessões: {e}")
+        session_store = None
+
+def init_resources():
+    """Inicializa todos os sistemas (uma vez, no primeiro uso ou no aquecimento)"""
+    init_tts()
+    init_alarm()
+    init_store()
+    configure_announcements()
+    announcements.start()
+    init_camera()
+    init_analyzer()
+    init_calibration()
+
+# Importar o módulo não abre câmera nem áudio; rotas que usam os recursos esperam por eles
+resources = LazyResources('medical_system_pro', init_resources)
+guard(app, resources, exempt=DEFAULT_EXEMPT + ('get_status',))  # Status mostra o aquecimento
+
+def create_app(warm_up=True):
+    """Fábrica do app: com warm_up, inicializa os recursos em segundo plano"""
+    if warm_up:
+        resources.warm_up()
+    return app
+
+def reiniciar_posicionamento():
+    """Descarta a tentativa de posicionamento em andamento"""
+    positioning['since'] = None
+    positioning['time_to_ready'] = None
+
+def acompanhar_posicionamento(timestamp):
+    """
+    Tempo do posicionamento: detecção da cabeça até ficar pronto, numa
+    tentativa contínua (perda da cabeça ou análise reiniciada começam outra,
+    para não contar tempo ocioso nem a troca de paciente)
+    """
+    if system_status['procedure_active'] or timestamp is None:
+        return
+    if analyzer.last_head_pos is None:
+        # Também cobre reset_analysis, que limpa last_head_pos
+        reiniciar_posicionamento()
+        return
+    if positioning['since'] is None:
+        positioning['since'] = timestamp
+    if (analyzer.is_ready_for_procedure and positioning['since'] is not None
+            and positioning['time_to_ready'] is None):
+        positioning['time_to_ready'] = timestamp - positioning['since']
+
+def iniciar_sessao(forced, repeat=None):
+    """Registra o início do procedimento no banco (apenas enfileira)"""
+    global current_session
+    if session_store is None:
+        return
+    recorder = gravacao.recorder
+    session_id = recorder.session_id if recorder else datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    current_session = {'id': session_id, 'source_start': camera.timestamp if camera else None}
+    session_store.begin_session(
+        session_id, ROOM_ID, system_status['procedure_name'], system_status['patient_population'],
+        app='medical_system_pro', started_at=system_status['start_time'], forced=forced,
+        trace_path=recorder.path if recorder else None, repeat=repeat)
+
+def registrar_transicao(is_stable, reason):
+    """Transição de estado durante o procedimento (chamada no loop de frames)"""
+    sessao = current_session
+    if session_store is None or sessao is None:
+        return
+    offset = None
+    if camera is not None and camera.timestamp is not None and sessao['source_start'] is not None:
+        offset = camera.timestamp - sessao['source_start']
+    session_store.add_transition(sessao['id'], is_stable, reason, offset_s=offset)
+
+def finalizar_sessao(total_time, session_stats):
+    """Fecha o procedimento no banco com as estatísticas da sessão"""
+    global current_session
+    sessao, current_session = current_session, None
+    if session_store is not None and sessao is not None:
+        session_store.end_session(
+            sessao['id'], total_time, stats=session_stats,
+            report=analyzer.get_stability_report() if analyzer else None,
+            time_to_ready_s=positioning['time_to_ready'])
+    # O próximo paciente começa um novo posicionamento
+    reiniciar_posicionamento()
+
 def init_camera():
     """Inicializa câmera"""
     global camera
     try:
         print("📹 Inicializando sistema de câmera...")
         
+        # Gravação no lugar da câmera (ESTABILIDADE_SOURCE); se inválida, usa a webcam
+        try:
+            camera = source_from_env()
+        except (ValueError, OSError) as e:
+            print(f"⚠️ ESTABILIDADE_SOURCE inválida ({e}) - usando a webcam")
+            camera = None
+        if camera is not None:
+            if camera.isOpened():
+                return
+            print("⚠️ Fonte de captura não pôde ser aberta - usando a webcam")
+            camera = None
+        
         # Tenta diferentes índices de câmera
         for camera_index in [0, 1, 2]:
             try:
@@ -103,6 +246,7 @@ def init_camera():
                         camera.set(cv2.CAP_PROP_FPS, 30)
                         
                         print("📹 Câmera configurada: 1280x720 @ 30fps")
+                        camera = CameraSource(camera)
                         return
                     else:
                         camera.release()
@@ -126,11 +270,14 @@ def init_analyzer():
     global analyzer
     try:
         print("🏥 Inicializando Sistema Médico de Estabilidade...")
+        # Cascade no pool do registro: a thread de /video_feed o recebe pronto
+        models.preload(cascades=('frontalface',))
         
         analyzer = MedicalHeadStabilityAnalyzer(
             stability_threshold=5,
             time_threshold=3.0,
-            sensitivity='high'
+            sensitivity='high',
+            smoothing=True  # Threshold apertado: filtra o tremor da detecção
         )
         print("✅ Sistema Médico inicializado!")
         
@@ -138,6 +285,24 @@ def init_analyzer():
         print(f"❌ Erro ao inicializar analisador: {e}")
         # Criar um analisador básico se falhar
         analyzer = MedicalHeadStabilityAnalyzer()
+    analyzer.add_state_listener(on_analyzer_state)
+
+def init_calibration():
+    """Ajusta o pipeline ao desempenho medido desta máquina"""
+    if camera is None or analyzer is None:
+        return
+    try:
+        ret, frame = camera.read()
+        if ret and frame is not None:
+            # Só salva medições feitas na câmera (não em gravações)
+            settings = calibrate(analyzer, frame, target_fps=30,
+                                 force=os.environ.get('ESTABILIDADE_RECALIBRATE') == '1',
+                                 save=camera.live)
+            frame_budget.set_base_settings(pipeline_settings(settings))
+            analyzer.reset_analysis()
+            reiniciar_posicionamento()
+    except Exception as e:
+        print(f"⚠️ Calibração indisponível: {e}")
 
 def generate_frames():
     """Gera frames do vídeo com análise"""
@@ -156,8 +321,15 @@ def generate_frames():
                 time.sleep(0.1)
                 continue
                 
-            success, frame = camera.read()
+            profiler.tick()
+            frame_start = time.perf_counter()
+            with metrics.stage('capture'):
+                success, frame = camera.read()
             if not success:
+                metrics.inc('frames_dropped_total', reason='capture')
+                if camera.finished:
+                    print("🎞️ Fim da gravação")
+                    break
                 continue
                 
             if analyzer is None:
@@ -166,8 +338,15 @@ def generate_frames():
                 yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n'
                 continue
             
-            # Análise da estabilidade
-            analysis_result = analyzer.analyze_stability(frame)
+            # Análise da estabilidade (custo medido sem a espera da câmera)
+            process_start = time.perf_counter()
+            frame_budget.apply_to(analyzer)
+            # Timestamp da fonte: em gravações, as durações seguem o tempo do vídeo
+            analysis_result = analyzer.analyze_stability(frame, timestamp=camera.timestamp)  # Alarme via on_analyzer_state
+            recorder = gravacao.recorder
+            if recorder is not None:
+                recorder.record(analyzer, camera.timestamp)
+            acompanhar_posicionamento(camera.timestamp)
             
             # Atualiza status do sistema
             if analyzer:
@@ -176,25 +355,46 @@ def generate_frames():
                 else:
                     system_status['stability_level'] = 'red'
                 
+                # Anúncios de voz: só informa o estado; o agendador cuida dos intervalos
+                if system_status['procedure_active']:
+                    announcements.update_state(ROOM_ID, 'procedure')
+                elif analyzer.is_ready_for_procedure:
+                    announcements.update_state(ROOM_ID, 'ready')
+                elif analyzer.is_stable:
+                    announcements.update_state(ROOM_ID, 'positioning')
+                else:
+                    announcements.update_state(ROOM_ID, 'unstable')
+                
                 # Atualiza tempo decorrido se procedimento ativo
                 if system_status['procedure_active'] and system_status['start_time']:
                     elapsed = datetime.now() - system_status['start_time']
                     system_status['elapsed_time'] = int(elapsed.total_seconds())
             
             # Desenha overlay no frame
-            frame_with_overlay = draw_medical_overlay(frame, analyzer)
+            with metrics.stage('overlay'):
+                frame_with_overlay = draw_medical_overlay(
+                    frame, analyzer, detail=frame_budget.settings['overlay_detail'])
             
-            ret, buffer = cv2.imencode('.jpg', frame_with_overlay)
+            with metrics.stage('jpeg_encode'):
+                ret, buffer = cv2.imencode('.jpg', frame_with_overlay,
+                                           [cv2.IMWRITE_JPEG_QUALITY, frame_budget.settings['jpeg_quality']])
+            frame_budget.record_frame(time.perf_counter() - process_start)
+            if not ret:
+                metrics.inc('frames_dropped_total', reason='encode')
+                continue
             frame_bytes = buffer.tobytes()
+            metrics.inc('frames_total')
+            metrics.observe_stage('frame', time.perf_counter() - frame_start, start=frame_start)
             yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n'
             
         except Exception as e:
+            metrics.inc('frames_dropped_total', reason='error')
             print(f"❌ Erro na geração de frames: {e}")
             time.sleep(0.1)
             continue
 
-def draw_medical_overlay(frame, analyzer):
-    """Desenha overlay médico profissional no frame"""
+def draw_medical_overlay(frame, analyzer, detail=True):
+    """Desenha overlay médico profissional no frame (detail=False omite o indicador central)"""
     h, w = frame.shape[:2]
     
     if not analyzer:
@@ -227,7 +427,7 @@ def draw_medical_overlay(frame, analyzer):
     cv2.putText(frame, status_text, (20, 45), cv2.FONT_HERSHEY_SIMPLEX, 0.8, status_color, 2)
     
     # Informações adicionais
-    if hasattr(analyzer, 'stability_score'):
+    if detail and hasattr(analyzer, 'stability_score'):
         score_text = f"Estabilidade: {analyzer.stability_score:.1f}%"
         cv2.putText(frame, score_text, (20, 65), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
     
@@ -240,6 +440,9 @@ def draw_medical_overlay(frame, analyzer):
         cv2.putText(frame, timer_text, (timer_bg[0]+10, timer_bg[1]+30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         cv2.putText(frame, "ATIVO", (timer_bg[0]+10, timer_bg[1]+55), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
     
+    if not detail:
+        return frame
+    
     # Indicador de estabilidade no centro inferior
     stability_indicator_y = h - 80
     
@@ -282,6 +485,7 @@ def start_procedure():
     try:
         data = request.get_json() or {}
         force_start = data.get('force_start', False)
+        repeat = data.get('repeat')  # Exame repetido (None: heurística do banco)
         
         if system_status['procedure_active']:
             return jsonify({'success': False, 'message': 'Procedimento já está ativo'})
@@ -303,12 +507,17 @@ def start_procedure():
             system_status['start_time'] = datetime.now()
             system_status['elapsed_time'] = 0
             system_status['current_status'] = 'Procedimento em Andamento'
+            if analyzer:
+                analyzer.stats.reset()  # Estatísticas por procedimento
+            iniciar_gravacao()
+            iniciar_sessao(forced=not (analyzer and analyzer.is_ready_for_procedure),
+                           repeat=None if repeat is None else bool(repeat))
             
             # Feedback por voz
             if analyzer and analyzer.is_ready_for_procedure:
-                fala_queue.put("Procedimento médico iniciado. Paciente estável.")
+                falar("Procedimento médico iniciado. Paciente estável.", priority=PRIORITY_CONTROL)
             else:
-                fala_queue.put("Procedimento iniciado com paciente instável. Monitorando.")
+                falar("Procedimento iniciado com paciente instável. Monitorando.", priority=PRIORITY_CONTROL)
             
             return jsonify({
                 'success': True,
@@ -349,15 +558,19 @@ def stop_procedure():
         system_status['start_time'] = None
         system_status['elapsed_time'] = 0
         system_status['current_status'] = 'Procedimento Finalizado'
+        session_stats = analyzer.stats.summary() if analyzer else None
+        finalizar_sessao(total_time, session_stats)
+        gravacao.stop(analyzer)
         
         # Feedback por voz
-        fala_queue.put(f"Procedimento finalizado. Duração: {format_time(total_time)}")
+        falar(duration_fragments("Procedimento finalizado. Duração:", total_time), priority=PRIORITY_CONTROL)
         
         return jsonify({
             'success': True,
             'message': 'Procedimento finalizado',
             'total_time': total_time,
-            'formatted_time': format_time(total_time)
+            'formatted_time': format_time(total_time),
+            'session_stats': session_stats
         })
         
     except Exception as e:
@@ -374,25 +587,23 @@ def update_settings():
         # Atualiza tipo de procedimento
         if 'procedure_type' in data:
             system_status['procedure_name'] = data['procedure_type']
+        if 'population' in data:
+            system_status['patient_population'] = data['population']
+        if 'procedure_type' in data or 'population' in data:
+            configure_announcements()
         
         # Atualiza sensibilidade
         if 'sensitivity' in data:
             system_status['sensitivity'] = data['sensitivity']
             
-            # Reinicializa analisador com nova sensibilidade
+            # Aplica a nova sensibilidade sem reiniciar (o histórico é reavaliado)
             if analyzer:
                 if data['sensitivity'] == 'high':
-                    analyzer.stability_threshold = 3
-                    analyzer.time_threshold = 2.0
+                    analyzer.update_thresholds(stability_threshold=3, time_threshold=2.0)
                 elif data['sensitivity'] == 'medium':
-                    analyzer.stability_threshold = 8
-                    analyzer.time_threshold = 3.0
+                    analyzer.update_thresholds(stability_threshold=8, time_threshold=3.0)
                 else:  # low
-                    analyzer.stability_threshold = 15
-                    analyzer.time_threshold = 4.0
-                
-                # Reset do histórico para aplicar nova configuração
-                analyzer.reset_analysis()
+                    analyzer.update_thresholds(stability_threshold=15, time_threshold=4.0)
         
         return jsonify({'success': True, 'message': 'Configurações atualizadas'})
         
@@ -415,9 +626,88 @@ def get_status():
             
         system_status['stability_score'] = analyzer.stability_score
         system_status['message'] = analyzer.message
+        system_status['pre_alert'] = analyzer.pre_alert
+    
+    system_status['degradation'] = frame_budget.status()
+    system_status['tts'] = speech_server.status() if speech_server else None
+    system_status['alarm'] = movement_alarm.status() if movement_alarm else None
+    system_status['store'] = session_store.status() if session_store else None
+    system_status['startup'] = resources.status()
     
     return jsonify(system_status)
 
+# ===== HISTÓRICO (agregados do banco de sessões) =====
+
+def consultar_historico(consulta):
+    """Executa uma consulta do banco; 503 sem banco, 400 em parâmetro inválido"""
+    if session_store is None:
+        return jsonify({'success': False, 'message': 'Banco de sessões indisponível'}), 503
+    try:
+        return jsonify({'success': True, 'data': consulta()})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+@app.route('/api/history/sessions', methods=['GET'])
+def history_sessions():
+    """Sessões (mais recentes primeiro), filtradas por sala, procedimento e datas"""
+    args = request.args
+    return consultar_historico(lambda: session_store.list_sessions(
+        room=args.get('room'), procedure_type=args.get('procedure'),
+        since=args.get('since'), until=args.get('until'),
+        limit=min(args.get('limit', 100, type=int), 1000), offset=args.get('offset', 0, type=int)))
+
+@app.route('/api/history/sessions/<session_id>', methods=['GET'])
+def history_session(session_id):
+    """Uma sessão com suas transições de estado"""
+    if session_store is None:
+        return jsonify({'success': False, 'message': 'Banco de sessões indisponível'}), 503
+    sessao = session_store.get_session(session_id)
+    if sessao is None:
+        return jsonify({'success': False, 'message': 'Sessão não encontrada'}), 404
+    return jsonify({'success': True, 'data': sessao})
+
+@app.route('/api/history/repeat_rate', methods=['GET'])
+def history_repeat_rate():
+    """Taxa de exames repetidos por procedimento (period=day|week)"""
+    args = request.args
+    return consultar_historico(lambda: session_store.repeat_rates(
+        args.get('period', 'week'), args.get('since'), args.get('until'), room=args.get('room')))
+
+@app.route('/api/history/time_to_ready', methods=['GET'])
+def history_time_to_ready():
+    """Tempo médio até ficar pronto por população (period=day|week)"""
+    args = request.args
+    return consultar_historico(lambda: session_store.time_to_ready(
+        args.get('period', 'week'), args.get('since'), args.get('until'),
+        procedure_type=args.get('procedure')))
+
+@app.route('/api/history/instability', methods=['GET'])
+def history_instability():
+    """Minutos de instabilidade por sala (period=day|week)"""
+    args = request.args
+    return consultar_historico(lambda: session_store.instability(
+        args.get('period', 'day'), args.get('since'), args.get('until'), room=args.get('room')))
+
+@app.route('/api/export/<kind>', methods=['GET'])
+def export_endpoint(kind):
+    """Download em streaming de trajetórias ('traces') ou sessões ('sessions'), CSV ou Parquet"""
+    if not admin_permitido():
+        return jsonify({'success': False, 'message': 'Acesso negado'}), 403
+    if session_store is None:
+        return jsonify({'success': False, 'message': 'Banco de sessões indisponível'}), 503
+    args = request.args
+    fmt = args.get('format', 'csv')
+    try:
+        blocos = export(kind, fmt, session_store, ids=args.getlist('session') or None,
+                        room=args.get('room'), procedure_type=args.get('procedure'),
+                        since=args.get('since'), until=args.get('until'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 501
+    return Response(blocos, mimetype=CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+
 # ===== TEMPLATE HTML =====
 
 HTML_TEMPLATE = '''
@@ -1195,11 +1485,6 @@ if __name__ == '__main__':
     print("   Monitoramento de Estabilidade da Cabeça")
     print("=" * 50)
     
-    # Inicialização dos sistemas
-    init_tts()
-    init_camera()
-    init_analyzer()
-    
     print("\n🏥 Sistema Médico de Estabilidade da Cabeça")
     print("🌐 Acesse: http://127.0.0.1:5000")
     print("📋 Procedimentos suportados:")
@@ -1209,10 +1494,20 @@ if __name__ == '__main__':
     print("=" * 50)
     
     try:
-        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+        # Os sistemas são inicializados em segundo plano, depois que o servidor já está ouvindo
+        serve(app, resources, host='0.0.0.0', port=5000)
     except KeyboardInterrupt:
         print("\n🛑 Sistema finalizado pelo usuário")
     finally:
+        gravacao.stop(analyzer)
+        if session_store:
+            session_store.close()
+        fala_queue.put(None)
+        if speech_server:
+            speech_server.stop()
+        if movement_alarm:
+            movement_alarm.stop()
+        announcements.stop()
         if camera:
             camera.release()
         cv2.destroyAllWindows()
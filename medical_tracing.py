@@ -0,0 +1,113 @@
+# Rastreamento do Pipeline de Frames (Chrome Trace / Perfetto)
+# Sistema Médico de Estabilidade da Cabeça
+#
+# Registra spans de início/fim por frame e por etapa, com o id da thread,
+# em um buffer circular em memória. O resultado é exportado no formato
+# Chrome trace-event JSON, que abre diretamente em https://ui.perfetto.dev
+# ou chrome://tracing - útil para ver a thread de voz (runAndWait)
+# disputando CPU com o loop de frames.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_MAX_EVENTS = 200_000
+
+
+class Tracer:
+    """
+    Coletor de spans com buffer limitado
+
+    Quando desabilitado, span() custa apenas a verificação de um atributo.
+    Eventos mais antigos são descartados quando o buffer enche.
+    """
+
+    def __init__(self, max_events: int = DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self._events = deque(maxlen=max_events)
+        self._thread_names = {}
+        self._pid = os.getpid()
+        self._started_at = None
+
+    def start(self, max_events: int = None):
+        """Limpa o buffer e habilita o rastreamento"""
+        if max_events:
+            self._events = deque(maxlen=int(max_events))
+        else:
+            self._events.clear()
+        self._thread_names.clear()
+        self._started_at = time.time()
+        self.enabled = True
+
+    def stop(self):
+        """Desabilita o rastreamento, mantendo o buffer para download"""
+        self.enabled = False
+
+    def complete(self, name: str, start: float, duration: float, cat: str = 'pipeline', args: dict = None):
+        """
+        Registra um span completo
+
+        Args:
+            start: Instante inicial em time.perf_counter()
+            duration: Duração em segundos
+        """
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        evento = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': duration * 1e6,
+            'pid': self._pid,
+            'tid': tid
+        }
+        if args:
+            evento['args'] = args
+        # deque.append é atômico: não precisa de lock entre threads
+        self._events.append(evento)
+
+    @contextmanager
+    def span(self, name: str, cat: str = 'pipeline', **args):
+        """Context manager que registra um span se o rastreamento estiver ativo"""
+        if not self.enabled:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, inicio, time.perf_counter() - inicio, cat, args or None)
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'events': len(self._events),
+            'max_events': self._events.maxlen,
+            'started_at': self._started_at
+        }
+
+    def export(self) -> dict:
+        """Retorna o rastreamento no formato Chrome trace-event"""
+        eventos = list(self._events)
+        metadados = [
+            {'name': 'process_name', 'ph': 'M', 'pid': self._pid, 'tid': 0,
+             'args': {'name': 'Sistema Médico de Estabilidade'}}
+        ]
+        for tid, nome in list(self._thread_names.items()):
+            metadados.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+                              'args': {'name': nome}})
+        return {'traceEvents': metadados + eventos, 'displayTimeUnit': 'ms'}
+
+    def export_json(self) -> str:
+        return json.dumps(self.export(), ensure_ascii=False)
+
+
+# Rastreador global do processo
+tracer = Tracer()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Replay "E Se?" de Thresholds sobre Trajetórias Gravadas
+Sistema Médico de Estabilidade da Cabeça
+
+Reexecuta a máquina de estados de analyze_stability sobre trajetórias já
+gravadas (sessões do MotionRecorder ou séries do medical_batch) para uma
+grade inteira de combinações threshold x tempo x sensibilidade, sem
+reprocessar vídeo e sem novos pacientes. Para cada combinação reporta a
+fração do tempo em "pronto", o tempo até ficar pronto e os alarmes
+(incluindo falsos alarmes: instabilidades curtas, típicas de tremor da
+detecção).
+
+A vetorização explora a estrutura da máquina de estados:
+  - "estável" num frame depende só do threshold (movimento <= threshold);
+  - o score é a fração de frames estáveis na janela das últimas
+    min_detections avaliações (depende de threshold e sensibilidade);
+  - "pronto" = estável, score >= 80 e duração do trecho estável >= tempo.
+Por isso, para cada par (threshold, sensibilidade), todos os tempos da
+grade saem de uma ordenação e de buscas binárias.
+
+Aproximações: frames de detecção intercalada são tratados como avaliações
+(a gravação não os distingue) e o decremento do score em frames instáveis
+não é modelado (não afeta a prontidão).
+
+Uso:
+    python medical_whatif.py ~/.estabilidade_cranio/sessions/* \\
+        --thresholds 3:20:1 --times 1:6:0.5 --output grade.csv
+"""
+
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from medical_head_stability import SENSITIVITY_CONFIG
+from medical_recorder import STATE_NO_HEAD, load_session
+
+READY_SCORE = 80  # Score mínimo para "pronto" (%)
+DEFAULT_FALSE_ALARM_MAX = 0.5  # Instabilidade mais curta que isso (s) conta como falso alarme
+
+RESULT_FIELDS = ['threshold', 'time_threshold', 'sensitivity', 'ready_fraction', 'mean_time_to_ready',
+                 'sessions_ready', 'sessions', 'alarms', 'false_alarms', 'false_alarms_per_hour']
+
+
+# ===== LEITURA DAS TRAJETÓRIAS =====
+
+def load_trace(path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Carrega uma trajetória: (timestamps, movimento por frame, cabeça detectada)
+
+    Aceita um diretório de sessão do MotionRecorder ou um CSV de série do
+    medical_batch.
+    """
+    if os.path.isdir(path):
+        dados = load_session(path)
+        detectado = (dados['state'] & 0x0F) != STATE_NO_HEAD
+        return dados['t'].astype(float), dados['movement'].astype(float), detectado
+
+    t, movimento, detectado = [], [], []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for linha in csv.DictReader(f):
+            t.append(float(linha['timestamp']))
+            movimento.append(float(linha['movement']) if linha['movement'] else np.nan)
+            detectado.append(linha['detected'] == '1')
+    return np.asarray(t), np.asarray(movimento), np.asarray(detectado, dtype=bool)
+
+
+class Trace:
+    """Trajetória reduzida aos frames avaliados (cabeça detectada e movimento medido)"""
+
+    def __init__(self, t: np.ndarray, movimento: np.ndarray, detectado: np.ndarray, name: str = ''):
+        self.name = name
+        avaliado = detectado & np.isfinite(movimento)
+        indices = np.flatnonzero(avaliado)
+        self.t = t[indices]
+        self.movement = movimento[indices]
+        self.t0 = float(t[0]) if len(t) else 0.0
+        self.duration = float(t[-1] - t[0]) if len(t) > 1 else 0.0
+
+        # Cabeça perdida entre a avaliação anterior e esta (interrompe o trecho estável)
+        perdidos = np.cumsum(~detectado)
+        perdidos_aqui = perdidos[indices]
+        self.lost_before = np.diff(np.concatenate(([0], perdidos_aqui))) > 0
+
+        # Tempo em que o estado de cada avaliação vale (até o próximo frame gravado)
+        if len(t) > 1:
+            passo = float(np.median(np.diff(t)))
+            proximo = np.minimum(indices + 1, len(t) - 1)
+            self.dt = np.where(indices + 1 < len(t), t[proximo] - t[indices], passo)
+        else:
+            self.dt = np.zeros(len(indices))
+
+    def __len__(self):
+        return len(self.t)
+
+
+# ===== REPLAY VETORIZADO =====
+
+def replay_trace(trace: Trace, thresholds: np.ndarray, times: np.ndarray, windows: np.ndarray,
+                 false_alarm_max: float = DEFAULT_FALSE_ALARM_MAX) -> Dict[str, np.ndarray]:
+    """
+    Replay de uma trajetória para a grade completa
+
+    Returns:
+        ready_time, time_to_ready (NaN se nunca ficou pronto): (A, B, C)
+        alarms, false_alarms: (A,)
+    """
+    A, B, C = len(thresholds), len(times), len(windows)
+    K = len(trace)
+    ready_time = np.zeros((A, B, C))
+    time_to_ready = np.full((A, B, C), np.nan)
+    alarms = np.zeros(A, dtype=int)
+    false_alarms = np.zeros(A, dtype=int)
+    if K == 0:
+        return {'ready_time': ready_time, 'time_to_ready': time_to_ready,
+                'alarms': alarms, 'false_alarms': false_alarms}
+
+    k = np.arange(K)
+    t = trace.t
+    estavel = trace.movement[None, :] <= thresholds[:, None]  # (A, K)
+
+    # Início do trecho estável corrente: depois do último frame instável ou da última perda da cabeça
+    marcas = np.maximum(np.where(trace.lost_before, k, 0)[None, :], np.where(~estavel, k + 1, 0))
+    inicio = np.minimum(np.maximum.accumulate(marcas, axis=1), K - 1)
+    duracao = t[None, :] - t[inicio]
+
+    # Soma acumulada de frames estáveis para as janelas do score
+    acumulado = np.zeros((A, K + 1), dtype=np.int64)
+    np.cumsum(estavel, axis=1, out=acumulado[:, 1:])
+
+    for c, janela in enumerate(windows):
+        janela = int(janela)
+        antes = np.maximum(k + 1 - janela, 0)
+        na_janela = acumulado[:, k + 1] - acumulado[:, antes]
+        # score >= 80 ⇔ estáveis * 100 >= 80 * janela (em inteiros)
+        score_ok = (k + 1 >= janela)[None, :] & (na_janela * 100 >= READY_SCORE * janela)
+        candidato = estavel & score_ok
+
+        for a in range(A):
+            mascara = candidato[a]
+            if not mascara.any():
+                continue
+            dur = duracao[a]
+            # Tempo até ficar pronto: primeiro frame candidato com duração >= tempo
+            maximo = np.maximum.accumulate(np.where(mascara, dur, -np.inf))
+            primeiro = np.searchsorted(maximo, times, side='left')
+            alcancou = primeiro < K
+            time_to_ready[a, alcancou, c] = t[primeiro[alcancou]] - trace.t0
+
+            # Tempo total em "pronto": soma de dt dos candidatos com duração >= tempo
+            dur_c = dur[mascara]
+            ordem = np.argsort(dur_c, kind='stable')
+            dur_ordenada = dur_c[ordem]
+            sufixo = np.concatenate((np.cumsum(trace.dt[mascara][ordem][::-1])[::-1], [0.0]))
+            ready_time[a, :, c] = sufixo[np.searchsorted(dur_ordenada, times, side='left')]
+
+    # Alarmes: transições estável -> instável (sem perda de cabeça entre elas)
+    if K > 1:
+        transicao = estavel[:, :-1] & ~estavel[:, 1:] & ~trace.lost_before[None, 1:]
+        alarms[:] = transicao.sum(axis=1)
+        # Próximo frame estável a partir de cada índice (K se não houver)
+        proximo_estavel = np.minimum.accumulate(np.where(estavel, k, K)[:, ::-1], axis=1)[:, ::-1]
+        for a in range(A):
+            origens = np.flatnonzero(transicao[a]) + 1
+            if len(origens) == 0:
+                continue
+            fins = proximo_estavel[a, origens]
+            terminou = fins < K
+            curtos = (t[np.minimum(fins, K - 1)] - t[origens]) < false_alarm_max
+            false_alarms[a] = int(np.count_nonzero(terminou & curtos))
+
+    return {'ready_time': ready_time, 'time_to_ready': time_to_ready,
+            'alarms': alarms, 'false_alarms': false_alarms}
+
+
+def sweep(traces: Iterable[Trace], thresholds: Sequence[float], times: Sequence[float],
+          sensitivities: Sequence[str] = ('high', 'medium', 'low'),
+          false_alarm_max: float = DEFAULT_FALSE_ALARM_MAX) -> List[Dict[str, Any]]:
+    """Agrega o replay de todas as trajetórias; uma linha por combinação"""
+    thresholds = np.asarray(thresholds, dtype=float)
+    times = np.asarray(times, dtype=float)
+    windows = np.asarray([SENSITIVITY_CONFIG[s]['min_detections'] for s in sensitivities])
+    A, B, C = len(thresholds), len(times), len(windows)
+
+    total_ready = np.zeros((A, B, C))
+    soma_ttr = np.zeros((A, B, C))
+    prontas = np.zeros((A, B, C), dtype=int)
+    alarms = np.zeros(A, dtype=int)
+    false_alarms = np.zeros(A, dtype=int)
+    duracao_total = 0.0
+    sessoes = 0
+
+    for trace in traces:
+        r = replay_trace(trace, thresholds, times, windows, false_alarm_max)
+        total_ready += r['ready_time']
+        alcancou = np.isfinite(r['time_to_ready'])
+        soma_ttr += np.where(alcancou, r['time_to_ready'], 0.0)
+        prontas += alcancou
+        alarms += r['alarms']
+        false_alarms += r['false_alarms']
+        duracao_total += trace.duration
+        sessoes += 1
+
+    horas = duracao_total / 3600.0
+    linhas = []
+    for a in range(A):
+        for b in range(B):
+            for c in range(C):
+                linhas.append({
+                    'threshold': float(thresholds[a]),
+                    'time_threshold': float(times[b]),
+                    'sensitivity': sensitivities[c],
+                    'ready_fraction': round(total_ready[a, b, c] / duracao_total, 4) if duracao_total else 0.0,
+                    'mean_time_to_ready': (round(soma_ttr[a, b, c] / prontas[a, b, c], 2)
+                                           if prontas[a, b, c] else None),
+                    'sessions_ready': int(prontas[a, b, c]),
+                    'sessions': sessoes,
+                    'alarms': int(alarms[a]),
+                    'false_alarms': int(false_alarms[a]),
+                    'false_alarms_per_hour': round(false_alarms[a] / horas, 2) if horas else None
+                })
+    return linhas
+
+
+# ===== LINHA DE COMANDO =====
+
+def parse_grid(texto: str) -> List[float]:
+    """'3:20:1' (início:fim:passo, fim incluso) ou '3,5,8'"""
+    if ':' in texto:
+        inicio, fim, passo = (float(v) for v in texto.split(':'))
+        return list(np.round(np.arange(inicio, fim + passo / 2, passo), 6))
+    return [float(v) for v in texto.split(',') if v]
+
+
+def expand_inputs(caminhos: Sequence[str]) -> List[str]:
+    """Sessões (diretórios com chunk_*.npy) e séries CSV; diretórios de sessões são expandidos"""
+    entradas = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho) and not glob.glob(os.path.join(caminho, 'chunk_*.npy')):
+            entradas.extend(sorted(
+                p for p in glob.glob(os.path.join(caminho, '*'))
+                if (os.path.isdir(p) and glob.glob(os.path.join(p, 'chunk_*.npy'))) or p.endswith('.csv')
+            ))
+        else:
+            entradas.append(caminho)
+    return entradas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay de thresholds sobre trajetórias gravadas')
+    parser.add_argument('inputs', nargs='+', help='Sessões gravadas, diretórios de sessões ou séries CSV')
+    parser.add_argument('--thresholds', default='3:20:1', help='Thresholds (px/frame), ex.: 3:20:1 ou 5,8,10')
+    parser.add_argument('--times', default='1:6:0.5', help='Tempos de estabilidade (s)')
+    parser.add_argument('--sensitivities', default='high,medium,low', help='Janelas do score por sensibilidade')
+    parser.add_argument('--false-alarm-max', type=float, default=DEFAULT_FALSE_ALARM_MAX,
+                        help='Instabilidade mais curta que isso (s) conta como falso alarme')
+    parser.add_argument('--output', '-o', default=None, help='CSV com todas as combinações')
+    parser.add_argument('--top', type=int, default=10, help='Combinações a exibir')
+    args = parser.parse_args(argv)
+
+    sensibilidades = [s for s in args.sensitivities.split(',') if s]
+    for s in sensibilidades:
+        if s not in SENSITIVITY_CONFIG:
+            parser.error(f"sensibilidade inválida: {s}")
+
+    inicio = time.perf_counter()
+    traces = []
+    for caminho in expand_inputs(args.inputs):
+        try:
+            traces.append(Trace(*load_trace(caminho), name=caminho))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Trajetória ignorada ({caminho}): {e}")
+    if not traces:
+        print("❌ Nenhuma trajetória carregada")
+        return 1
+    carregado = time.perf_counter()
+
+    linhas = sweep(traces, parse_grid(args.thresholds), parse_grid(args.times),
+                   sensibilidades, args.false_alarm_max)
+    fim = time.perf_counter()
+    frames = sum(len(t) for t in traces)
+    print(f"📊 {len(linhas)} combinações x {len(traces)} trajetórias ({frames} frames): "
+          f"leitura {carregado - inicio:.1f}s, replay {fim - carregado:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            escritor = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            escritor.writeheader()
+            escritor.writerows(linhas)
+        print(f"💾 Resultados gravados em {args.output}")
+
+    # Melhores: menos falsos alarmes, depois mais tempo pronto
+    melhores = sorted(linhas, key=lambda l: (l['false_alarms'], -l['ready_fraction']))[:args.top]
+    for l in melhores:
+        ttr = f"{l['mean_time_to_ready']:.1f}s" if l['mean_time_to_ready'] is not None else '—'
+        print(f"   • {l['threshold']:g}px / {l['time_threshold']:g}s / {l['sensitivity']}: "
+              f"pronto {l['ready_fraction'] * 100:.1f}%, até pronto {ttr}, "
+              f"falsos alarmes {l['false_alarms']} ({l['sessions_ready']}/{l['sessions']} sessões prontas)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
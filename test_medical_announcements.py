@@ -0,0 +1,98 @@
+# Testes da Roda de Temporizadores e do Balde de Fichas (medical_announcements)
+# Sistema Médico de Estabilidade da Cabeça
+
+import threading
+
+import pytest
+
+from medical_announcements import SpeechRateLimiter, TimerWheel
+
+
+def avancar(roda, ticks):
+    """Avança a roda sem a thread, executando os vencidos; retorna os ticks em que venceram"""
+    disparos = []
+    for tick in range(1, ticks + 1):
+        for callback, args in roda._advance():
+            callback(*args)
+            disparos.append(tick)
+    return disparos
+
+
+def test_temporizador_vence_no_tick_certo():
+    roda = TimerWheel(tick=0.1, slots=16)
+    chamados = []
+    roda.schedule(0.3, chamados.append, 'a')
+    roda.schedule(0.5, chamados.append, 'b')
+
+    assert roda.pending() == 2
+    assert avancar(roda, 3) == [3]
+    assert chamados == ['a']
+    assert avancar(roda, 2) == [2]
+    assert chamados == ['a', 'b']
+    assert roda.pending() == 0
+
+
+def test_temporizador_mais_longo_que_uma_volta():
+    roda = TimerWheel(tick=0.1, slots=4)
+    chamados = []
+    roda.schedule(1.0, chamados.append, 'longo')  # 10 ticks = 2 voltas e meia
+
+    assert avancar(roda, 9) == []
+    assert avancar(roda, 1) == [1]
+    assert chamados == ['longo']
+
+
+def test_atraso_minimo_de_um_tick():
+    roda = TimerWheel(tick=0.1, slots=8)
+    chamados = []
+    roda.schedule(0.0, chamados.append, 'já')
+    assert avancar(roda, 1) == [1]
+
+
+def test_cancelar_temporizador():
+    roda = TimerWheel(tick=0.1, slots=8)
+    chamados = []
+    timer_id = roda.schedule(0.2, chamados.append, 'x')
+
+    assert roda.cancel(timer_id) is True
+    assert roda.cancel(timer_id) is False
+    assert roda.cancel(None) is False
+    assert avancar(roda, 8) == []
+    assert chamados == []
+
+
+def test_thread_da_roda_dispara_callbacks():
+    roda = TimerWheel(tick=0.01, slots=8)
+    disparou = threading.Event()
+    roda.start()
+    try:
+        roda.schedule(0.02, lambda: 1 / 0)  # Erro no callback não derruba a roda
+        roda.schedule(0.05, disparou.set)
+        assert disparou.wait(2.0)
+    finally:
+        roda.stop()
+    assert not roda._thread.is_alive()
+
+
+def test_balde_permite_rajada_e_depois_limita():
+    limitador = SpeechRateLimiter(per_minute=12.0, burst=3)
+    assert [limitador.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    espera = limitador.try_acquire()
+    # 12 por minuto = uma ficha a cada 5 s
+    assert espera == pytest.approx(5.0, abs=0.05)
+
+
+def test_balde_reabastece_com_o_tempo():
+    limitador = SpeechRateLimiter(per_minute=12.0, burst=2)
+    limitador.try_acquire()
+    limitador.try_acquire()
+    assert limitador.try_acquire() > 0
+
+    limitador._updated -= 5.0  # 5 s depois: uma ficha
+    assert limitador.try_acquire() == 0.0
+    assert limitador.try_acquire() > 0
+
+    limitador._updated -= 600.0  # Muito tempo depois: nunca passa da rajada
+    assert [limitador.try_acquire() for _ in range(2)] == [0.0, 0.0]
+    assert limitador.try_acquire() > 0
@@ -0,0 +1,125 @@
+# Testes do Modelo de Movimento da Cabeça (medical_motion)
+# Sistema Médico de Estabilidade da Cabeça
+
+import math
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from medical_motion import ConstantVelocityKalman, HeadTrackFilter, MovementOnsetDetector
+
+
+def test_kalman_estima_velocidade_constante():
+    filtro = ConstantVelocityKalman(dims=2, process_noise=0.01, measurement_noise=1.0)
+    rng = random.Random(1)
+    for frame in range(100):
+        medida = (100 + 2.0 * frame + rng.gauss(0, 1), 50 - 1.0 * frame + rng.gauss(0, 1))
+        filtro.step(medida)
+
+    assert filtro.velocity[0] == pytest.approx(2.0, abs=0.3)
+    assert filtro.velocity[1] == pytest.approx(-1.0, abs=0.3)
+    assert filtro.position[0] == pytest.approx(100 + 2.0 * 99, abs=2.0)
+
+
+def test_kalman_primeira_medida_inicializa():
+    filtro = ConstantVelocityKalman(dims=2)
+    assert not filtro.initialized
+    inovacao = filtro.step((10.0, 20.0))
+    assert filtro.initialized
+    assert list(inovacao) == [0.0, 0.0]
+    assert list(filtro.position) == [10.0, 20.0]
+    assert list(filtro.velocity) == [0.0, 0.0]
+
+
+def test_kalman_predicao_aumenta_incerteza():
+    filtro = ConstantVelocityKalman(dims=1, process_noise=0.5, measurement_noise=4.0)
+    filtro.initialize([0.0])
+    antes = float(filtro.position_std[0])
+    filtro.predict(dt=3.0)
+    assert float(filtro.position_std[0]) > antes
+    filtro.update([0.0])
+    assert float(filtro.position_std[0]) < antes * 2
+
+
+def test_onset_nao_alerta_com_tremor():
+    detector = MovementOnsetDetector()
+    rng = random.Random(2)
+    alertas = [detector.update((320 + rng.gauss(0, 1.5), 240 + rng.gauss(0, 1.5)), threshold=10)
+               for _ in range(200)]
+    assert not any(alertas)
+
+
+def test_onset_alerta_antes_de_ultrapassar_o_threshold():
+    detector = MovementOnsetDetector()
+    threshold = 10.0
+    x = 320.0
+    for _ in range(20):
+        detector.update((x, 240.0), threshold)
+
+    # Movimento acelerando: a velocidade por frame cresce até passar do threshold
+    pre_alerta = None
+    ultrapassou = None
+    for frame in range(1, 30):
+        velocidade = 0.8 * frame
+        x += velocidade
+        if detector.update((x, 240.0), threshold) and pre_alerta is None:
+            pre_alerta = frame
+        if velocidade > threshold and ultrapassou is None:
+            ultrapassou = frame
+    assert pre_alerta is not None
+    assert pre_alerta < ultrapassou
+
+
+def test_onset_reset():
+    detector = MovementOnsetDetector()
+    for frame in range(10):
+        detector.update((320 + 5 * frame, 240), threshold=10)
+    detector.reset()
+    assert detector.speed == 0.0
+    assert not detector.kalman.initialized
+    assert detector.update((0, 0), threshold=10) is False
+
+
+def test_track_filter_reduz_tremor():
+    filtro = HeadTrackFilter()
+    rng = random.Random(3)
+    brutos, filtrados = [], []
+    for _ in range(300):
+        medida = (320 + rng.gauss(0, 3), 240 + rng.gauss(0, 3), 120 + rng.gauss(0, 5), 150 + rng.gauss(0, 5))
+        brutos.append(medida[0])
+        filtrados.append(filtro.update(medida)[0])
+
+    def movimento_medio(serie):
+        return sum(abs(b - a) for a, b in zip(serie[50:], serie[51:])) / (len(serie) - 51)
+
+    assert movimento_medio(filtrados) < movimento_medio(brutos) / 3
+    assert filtro.uncertainty < 3.0
+    assert filtro.status()['initialized'] is True
+
+
+def test_track_filter_acompanha_movimento_real():
+    filtro = HeadTrackFilter()
+    for _ in range(60):
+        filtro.update((320.0, 240.0, 120.0, 150.0))
+    incerteza_parado = filtro.uncertainty
+
+    # Salto de 40 px: a inovação passa do gate e o filtro reabre
+    posicao = filtro.update((360.0, 240.0, 120.0, 150.0))
+    assert posicao[0] > 350.0
+    assert filtro.consistency > 1.0
+
+    for _ in range(60):
+        posicao = filtro.update((360.0, 240.0, 120.0, 150.0))
+    assert posicao[0] == pytest.approx(360.0, abs=0.5)
+    assert filtro.uncertainty == pytest.approx(incerteza_parado, rel=0.5)
+
+
+def test_track_filter_primeira_deteccao_e_reset():
+    filtro = HeadTrackFilter()
+    assert filtro.uncertainty == math.inf
+    assert filtro.status() == {'initialized': False}
+    assert filtro.update((10, 20, 30, 40)) == (10.0, 20.0, 30.0, 40.0)
+    filtro.reset()
+    assert not filtro.initialized
@@ -0,0 +1,124 @@
+# Testes da Fila de Voz (medical_speech.SpeechQueue)
+# Sistema Médico de Estabilidade da Cabeça
+
+import queue
+
+import pytest
+
+from medical_speech import PRIORITY_ALERT, PRIORITY_CONTROL, PRIORITY_INFO, SpeechQueue
+
+
+def drenar(fila):
+    textos = []
+    while True:
+        try:
+            textos.append(fila.get_nowait())
+        except queue.Empty:
+            return textos
+
+
+def test_prioridade_antes_da_ordem_de_chegada():
+    fila = SpeechQueue()
+    fila.put('info 1', priority=PRIORITY_INFO)
+    fila.put('controle', priority=PRIORITY_CONTROL)
+    fila.put('info 2', priority=PRIORITY_INFO)
+    fila.put('alerta', priority=PRIORITY_ALERT)
+
+    assert fila.qsize() == 4
+    assert drenar(fila) == ['alerta', 'controle', 'info 1', 'info 2']
+    assert fila.empty()
+
+
+def test_frase_identica_pendente_e_unificada():
+    fila = SpeechQueue()
+    assert fila.put('Mantenha a cabeça imóvel') is True
+    assert fila.put('Mantenha a cabeça imóvel') is False
+    assert fila.qsize() == 1
+    assert fila.dropped['duplicate'] == 1
+    assert drenar(fila) == ['Mantenha a cabeça imóvel']
+
+
+def test_fragmentos_e_texto_equivalentes_sao_unificados():
+    fila = SpeechQueue()
+    fila.put(['Paciente', 'estável.'])
+    assert fila.put('Paciente estável.') is False
+    assert fila.qsize() == 1
+
+
+def test_duplicata_mais_urgente_sobe_de_prioridade():
+    fila = SpeechQueue()
+    fila.put('a', priority=PRIORITY_INFO)
+    fila.put('b', priority=PRIORITY_INFO)
+    assert fila.put('b', priority=PRIORITY_ALERT) is True
+    assert fila.qsize() == 2
+
+    mensagem = fila.get_message(block=False)
+    assert (mensagem.payload, mensagem.priority) == ('b', PRIORITY_ALERT)
+    assert drenar(fila) == ['a']
+
+
+def test_grupo_mantem_so_a_mais_recente():
+    fila = SpeechQueue()
+    fila.put('Aguardando', group='status')
+    fila.put('Início', priority=PRIORITY_CONTROL)
+    fila.put('Paciente em posição', group='status')
+    fila.put('Paciente estável', group='status')
+
+    assert fila.qsize() == 2
+    assert fila.dropped['superseded'] == 2
+    assert drenar(fila) == ['Início', 'Paciente estável']
+
+
+def test_frase_vencida_e_descartada():
+    fila = SpeechQueue()
+    fila.put('velha', ttl=-1.0)
+    fila.put('nova', ttl=10.0)
+
+    assert drenar(fila) == ['nova']
+    assert fila.dropped['expired'] == 1
+    assert fila.empty()
+
+
+def test_fila_cheia_descarta_a_menos_urgente():
+    fila = SpeechQueue(maxsize=2)
+    fila.put('info antiga', priority=PRIORITY_INFO)
+    fila.put('info nova', priority=PRIORITY_INFO)
+    assert fila.put('alerta', priority=PRIORITY_ALERT) is True
+    assert fila.dropped['overflow'] == 1
+    assert drenar(fila) == ['alerta', 'info nova']
+
+    fila.put('alerta 1', priority=PRIORITY_ALERT)
+    fila.put('alerta 2', priority=PRIORITY_ALERT)
+    assert fila.put('info', priority=PRIORITY_INFO) is False
+    assert fila.qsize() == 2
+
+
+def test_clear_abaixo_da_prioridade():
+    fila = SpeechQueue()
+    fila.put('alerta', priority=PRIORITY_ALERT)
+    fila.put('controle', priority=PRIORITY_CONTROL)
+    fila.put('info', priority=PRIORITY_INFO)
+    fila.clear(below_priority=PRIORITY_CONTROL)
+    assert drenar(fila) == ['alerta', 'controle']
+
+
+def test_none_e_sinal_de_parada():
+    fila = SpeechQueue()
+    fila.put('info')
+    fila.put(None)
+    assert fila.get(timeout=1) is None
+    assert fila.get(timeout=1) == 'info'
+
+
+def test_get_com_timeout_sem_mensagens():
+    fila = SpeechQueue()
+    with pytest.raises(queue.Empty):
+        fila.get(timeout=0.01)
+
+
+def test_say_enfileira_com_prioridade_e_grupo():
+    fila = SpeechQueue()
+    fila.say('status 1', group='status')
+    fila.say('alerta', priority=PRIORITY_ALERT)
+    fila.say('status 2', group='status')
+    assert drenar(fila) == ['alerta', 'status 2']
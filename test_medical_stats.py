@@ -0,0 +1,93 @@
+# Testes das Estatísticas da Sessão (medical_stats)
+# Sistema Médico de Estabilidade da Cabeça
+
+import random
+
+import pytest
+
+from medical_stats import P2Quantile, SessionStats
+
+
+def quantil_exato(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+
+@pytest.mark.parametrize('p', [0.5, 0.95, 0.99])
+def test_p2_aproxima_quantil_exato(p):
+    rng = random.Random(42)
+    amostras = [rng.expovariate(0.5) for _ in range(20000)]
+    estimador = P2Quantile(p)
+    for valor in amostras:
+        estimador.observe(valor)
+
+    exato = quantil_exato(amostras, p)
+    assert estimador.count == len(amostras)
+    assert estimador.value == pytest.approx(exato, rel=0.05)
+
+
+def test_p2_poucas_amostras_usa_quantil_exato():
+    estimador = P2Quantile(0.5)
+    assert estimador.value is None
+    for valor in (9.0, 1.0, 5.0):
+        estimador.observe(valor)
+    assert estimador.value == 5.0
+
+    p99 = P2Quantile(0.99)
+    for valor in (3.0, 1.0, 2.0, 8.0, 4.0):
+        p99.observe(valor)
+    assert p99.value == 8.0
+
+
+def test_p2_monotono_em_entrada_ordenada():
+    estimador = P2Quantile(0.5)
+    for valor in range(1001):
+        estimador.observe(float(valor))
+    assert estimador.value == pytest.approx(500.0, abs=5.0)
+
+
+def test_p2_reset():
+    estimador = P2Quantile(0.95)
+    for valor in range(100):
+        estimador.observe(float(valor))
+    estimador.reset()
+    assert estimador.count == 0
+    assert estimador.value is None
+
+
+def test_session_stats_tempo_em_cada_estado():
+    stats = SessionStats()
+    stats.advance(100.0, 'no_head')  # Primeiro frame: só marca o início
+    stats.advance(101.0, 'no_head')
+    stats.advance(103.0, 'stable')
+    stats.advance(104.0, 'ready')
+    stats.advance(104.5, 'unstable')
+    stats.advance(105.0, 'stable')
+
+    resumo = stats.summary()
+    assert resumo['time_in_state'] == {'no_head': 1.0, 'unstable': 0.5, 'stable': 2.5, 'ready': 1.0}
+    assert resumo['duration'] == 5.0
+    assert resumo['time_in_state_pct']['stable'] == 50.0
+    # stable + ready contínuos de 101 a 104
+    assert resumo['longest_stable_run'] == 3.0
+
+
+def test_session_stats_movimento_e_histograma():
+    stats = SessionStats(buckets=(1, 5))
+    for movimento in (0.5, 2.0, 3.0, 7.0):
+        stats.observe_movement(movimento)
+
+    resumo = stats.summary()
+    assert resumo['movement']['count'] == 4
+    assert resumo['movement']['mean'] == 3.12
+    assert resumo['movement']['max'] == 7.0
+    assert resumo['movement']['p50'] == 2.0
+    assert resumo['histogram'] == {'buckets': [1, 5, '+Inf'], 'counts': [1, 2, 1]}
+
+
+def test_session_stats_vazia():
+    resumo = SessionStats().summary()
+    assert resumo['movement']['count'] == 0
+    assert resumo['movement']['mean'] is None
+    assert resumo['movement']['p95'] is None
+    assert resumo['duration'] == 0.0
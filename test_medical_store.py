@@ -0,0 +1,148 @@
+# Testes do Banco de Sessões (medical_store)
+# Sistema Médico de Estabilidade da Cabeça
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from medical_store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    banco = SessionStore(str(tmp_path / 'sessions.db'), flush_interval=0.05)
+    banco.start()
+    yield banco
+    banco.close()
+
+
+def sessao(store, session_id, inicio, duracao=60.0, room='sala1', procedure='ressonancia_magnetica',
+           population='padrao', time_to_ready=None, instavel=0.0, alarmes=0, repeat=None):
+    store.begin_session(session_id, room, procedure, population, started_at=inicio, repeat=repeat)
+    for i in range(alarmes):
+        store.add_transition(session_id, False, 'movement', offset_s=float(i))
+    stats = {'movement': {'max': 4.0, 'p50': 1.0, 'p95': 3.0, 'p99': 3.5},
+             'time_in_state': {'stable': duracao - instavel, 'unstable': instavel, 'no_head': 0.0},
+             'longest_stable_run': duracao - instavel}
+    store.end_session(session_id, duracao, stats, {'stability_percentage': 90.0},
+                      time_to_ready_s=time_to_ready, ended_at=inicio + timedelta(seconds=duracao))
+
+
+def test_sessao_gravada_em_lote(store):
+    inicio = datetime(2024, 3, 4, 9, 0, 0)
+    sessao(store, 's1', inicio, time_to_ready=12.5, instavel=6.0, alarmes=2)
+    assert store.flush()
+
+    gravada = store.get_session('s1')
+    assert gravada['room'] == 'sala1'
+    assert gravada['day'] == '2024-03-04'
+    assert gravada['time_to_ready_s'] == 12.5
+    assert gravada['movement_p95'] == 3.0
+    assert gravada['time_unstable_s'] == 6.0
+    assert gravada['alarms'] == 2
+    assert gravada['rolled_up'] == 1
+    assert gravada['repeat'] == 0 and gravada['repeat_source'] == 'heuristic'
+    assert gravada['stats']['longest_stable_run'] == 54.0
+    assert [t['reason'] for t in gravada['transitions']] == ['movement', 'movement']
+
+    status = store.status()
+    assert status['errors'] == 0
+    assert status['written'] == 5
+    assert status['batches'] >= 1
+
+
+def test_operacao_invalida_nao_desfaz_o_lote(store):
+    inicio = datetime(2024, 3, 4, 9, 0, 0)
+    store.begin_session('s1', 'sala1', 'ressonancia_magnetica', started_at=inicio)
+    store.add_transition('inexistente', False, 'movement')  # Viola a chave estrangeira
+    store.add_transition('s1', True, 'stable')
+    store._submit(lambda conexao: 1 / 0)
+    store.add_transition('s1', False, 'movement')
+    assert store.flush()
+
+    gravada = store.get_session('s1')
+    assert [t['reason'] for t in gravada['transitions']] == ['stable', 'movement']
+    assert store.errors == 2
+    assert store.written == 3
+
+
+def test_thread_de_gravacao_sobrevive_a_erros(store):
+    store._submit(lambda conexao: 1 / 0)
+    assert store.flush()
+    store.begin_session('s2', 'sala1', 'tomografia', started_at=datetime(2024, 3, 4, 10, 0, 0))
+    assert store.flush()
+    assert store.get_session('s2') is not None
+
+
+def test_agregados_diarios_e_semanais(store):
+    segunda = datetime(2024, 3, 4, 8, 0, 0)
+    sessao(store, 'a', segunda, duracao=120.0, time_to_ready=10.0, instavel=30.0, alarmes=1)
+    sessao(store, 'b', segunda + timedelta(hours=2), duracao=60.0, time_to_ready=20.0, instavel=30.0)
+    sessao(store, 'c', segunda + timedelta(days=2), duracao=60.0, room='sala2', population='pediatrico')
+    assert store.flush()
+
+    diario = store.instability(period='day')
+    assert diario == [
+        {'period_start': '2024-03-04', 'room': 'sala1', 'sessions': 2, 'alarms': 1,
+         'unstable_minutes': 1.0, 'procedure_minutes': 3.0},
+        {'period_start': '2024-03-06', 'room': 'sala2', 'sessions': 1, 'alarms': 0,
+         'unstable_minutes': 0.0, 'procedure_minutes': 1.0},
+    ]
+
+    semanal = store.time_to_ready(period='week')
+    assert semanal == [
+        {'period_start': '2024-03-04', 'population': 'padrao', 'sessions': 2, 'ready_sessions': 2,
+         'mean_time_to_ready_s': 15.0},
+        {'period_start': '2024-03-04', 'population': 'pediatrico', 'sessions': 1, 'ready_sessions': 0,
+         'mean_time_to_ready_s': None},
+    ]
+    assert store.instability(period='week', room='sala2')[0]['sessions'] == 1
+
+
+def test_repeticao_pela_heuristica_e_pelo_operador(store):
+    inicio = datetime(2024, 3, 4, 8, 0, 0)
+    sessao(store, 'r1', inicio, duracao=60.0)
+    # Mesmo procedimento na mesma sala 5 min depois do fim: repetição
+    sessao(store, 'r2', inicio + timedelta(minutes=6), duracao=60.0)
+    # Uma hora depois: não é repetição
+    sessao(store, 'r3', inicio + timedelta(hours=1), duracao=60.0)
+    # Informado pelo operador prevalece sobre a heurística
+    sessao(store, 'r4', inicio + timedelta(hours=3), duracao=60.0, repeat=True)
+    assert store.flush()
+
+    assert store.get_session('r2')['repeat'] == 1
+    assert store.get_session('r3')['repeat'] == 0
+    assert store.get_session('r4')['repeat_source'] == 'flag'
+
+    taxas = store.repeat_rates(period='week')
+    assert taxas == [{'period_start': '2024-03-04', 'procedure_type': 'ressonancia_magnetica',
+                      'sessions': 4, 'repeats': 2, 'repeat_rate': 0.5}]
+
+
+def test_reconstrucao_dos_agregados(store):
+    inicio = datetime(2024, 3, 4, 8, 0, 0)
+    sessao(store, 'a', inicio, duracao=60.0, instavel=12.0)
+    assert store.flush()
+    antes = store.instability(period='day')
+
+    store.rebuild_rollups()
+    store.rebuild_rollups()
+    assert store.flush()
+    assert store.instability(period='day') == antes
+
+
+def test_periodo_invalido(store):
+    with pytest.raises(ValueError):
+        store.repeat_rates(period='month')
+
+
+def test_escritas_sem_thread_sao_gravadas_no_close(tmp_path):
+    caminho = str(tmp_path / 'sessions.db')
+    banco = SessionStore(caminho, flush_interval=5.0)
+    banco.start()
+    banco.begin_session('s1', 'sala1', 'tomografia', started_at=datetime(2024, 3, 4, 9, 0, 0))
+    banco.close()
+
+    leitura = SessionStore(caminho)
+    assert leitura.get_session('s1')['procedure_type'] == 'tomografia'
+    assert leitura.flush() is False  # Sem thread de gravação
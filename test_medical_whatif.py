@@ -0,0 +1,139 @@
+# Testes do Replay "E Se?" (medical_whatif)
+# Sistema Médico de Estabilidade da Cabeça
+#
+# O replay vetorizado precisa reproduzir o analisador ao vivo: cada
+# combinação da grade é comparada com um MedicalHeadStabilityAnalyzer
+# alimentado pela mesma trajetória, gravada pelo MotionRecorder.
+
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from medical_head_stability import SENSITIVITY_CONFIG, MedicalHeadStabilityAnalyzer
+from medical_recorder import MotionRecorder
+from medical_whatif import Trace, load_trace, parse_grid, replay_trace, sweep
+
+FPS = 30.0
+THRESHOLDS = [3.5, 8.5]
+TIMES = [0.2, 0.4, 1.0]
+SENSITIVITIES = ['high', 'medium', 'low']
+
+
+def trajetoria(frames=400, seed=11):
+    """Posições (cx, cy, w, h) por frame: tremor, movimentos reais e perdas da cabeça"""
+    rng = random.Random(seed)
+    x, y = 320, 240
+    posicoes = []
+    for frame in range(frames):
+        if 150 <= frame < 156 or 300 <= frame < 303:
+            posicoes.append(None)
+            continue
+        if rng.random() < 0.03:
+            x += rng.choice((-12, 12))  # Movimento real
+        else:
+            x += rng.randint(-3, 3)
+            y += rng.randint(-3, 3)
+        posicoes.append((x, y, 120, 150))
+    return posicoes
+
+
+def analisar(posicoes, threshold, time_threshold, sensitivity, recorder=None):
+    """Roda o analisador ao vivo; retorna (tempo até pronto, tempo pronto, alarmes)"""
+    analyzer = MedicalHeadStabilityAnalyzer(sensitivity=sensitivity, prediction=False)
+    analyzer.stability_threshold = threshold
+    analyzer.time_threshold = time_threshold
+    alarmes = []
+    analyzer.add_state_listener(lambda estavel, motivo: alarmes.append(motivo) if motivo == 'movement' else None)
+
+    posicao = iter(posicoes)
+    analyzer.detect_head_position = lambda frame: (lambda p: (p, [p] if p else []))(next(posicao))
+
+    ate_pronto, tempo_pronto = None, 0.0
+    for i in range(len(posicoes)):
+        t = i / FPS
+        pronto = analyzer.analyze_stability(None, timestamp=t)
+        if recorder is not None:
+            recorder.record(analyzer, t)
+        if pronto:
+            tempo_pronto += 1 / FPS
+            if ate_pronto is None:
+                ate_pronto = t
+    return ate_pronto, tempo_pronto, len(alarmes)
+
+
+@pytest.fixture(scope='module')
+def gravacao(tmp_path_factory):
+    posicoes = trajetoria()
+    recorder = MotionRecorder(directory=str(tmp_path_factory.mktemp('sessions')), chunk_frames=128)
+    analisar(posicoes, 8.5, 1.0, 'medium', recorder=recorder)
+    recorder.close()
+    return posicoes, recorder.path
+
+
+def test_trajetoria_gravada_e_carregada(gravacao):
+    posicoes, caminho = gravacao
+    t, movimento, detectado = load_trace(caminho)
+    assert len(t) == len(posicoes)
+    assert list(detectado) == [p is not None for p in posicoes]
+    # Primeira detecção e frames sem cabeça não têm movimento medido
+    assert math.isnan(movimento[0])
+    assert np.isnan(movimento[~detectado]).all()
+
+    trace = Trace(t, movimento, detectado)
+    assert len(trace) == int(np.count_nonzero(detectado)) - 1
+    assert trace.lost_before.sum() == 2
+
+
+@pytest.mark.parametrize('sensitivity', SENSITIVITIES)
+def test_replay_igual_ao_analisador_ao_vivo(gravacao, sensitivity):
+    posicoes, caminho = gravacao
+    trace = Trace(*load_trace(caminho))
+    janela = SENSITIVITY_CONFIG[sensitivity]['min_detections']
+    r = replay_trace(trace, np.asarray(THRESHOLDS), np.asarray(TIMES), np.asarray([janela]))
+
+    for a, threshold in enumerate(THRESHOLDS):
+        for b, tempo in enumerate(TIMES):
+            ate_pronto, tempo_pronto, alarmes = analisar(posicoes, threshold, tempo, sensitivity)
+            replay = r['time_to_ready'][a, b, 0]
+            if ate_pronto is None:
+                assert math.isnan(replay)
+            else:
+                assert replay == pytest.approx(ate_pronto, abs=1e-6)
+            assert r['ready_time'][a, b, 0] == pytest.approx(tempo_pronto, abs=1e-6)
+            assert r['alarms'][a] == alarmes
+
+
+def test_sweep_agrega_trajetorias(gravacao):
+    _, caminho = gravacao
+    trace = Trace(*load_trace(caminho))
+    linhas = sweep([trace, trace], THRESHOLDS, TIMES, SENSITIVITIES)
+    assert len(linhas) == len(THRESHOLDS) * len(TIMES) * len(SENSITIVITIES)
+
+    r = replay_trace(trace, np.asarray(THRESHOLDS), np.asarray(TIMES),
+                     np.asarray([SENSITIVITY_CONFIG[s]['min_detections'] for s in SENSITIVITIES]))
+    for linha in linhas:
+        a = THRESHOLDS.index(linha['threshold'])
+        b = TIMES.index(linha['time_threshold'])
+        c = SENSITIVITIES.index(linha['sensitivity'])
+        assert linha['sessions'] == 2
+        assert linha['alarms'] == 2 * r['alarms'][a]
+        assert linha['ready_fraction'] == round(r['ready_time'][a, b, c] / trace.duration, 4)
+        assert linha['sessions_ready'] == (0 if math.isnan(r['time_to_ready'][a, b, c]) else 2)
+
+
+def test_trajetoria_vazia():
+    vazio = np.zeros(0)
+    trace = Trace(vazio, vazio, vazio.astype(bool))
+    r = replay_trace(trace, np.asarray([5.0]), np.asarray([1.0]), np.asarray([10]))
+    assert r['ready_time'].shape == (1, 1, 1)
+    assert math.isnan(r['time_to_ready'][0, 0, 0])
+    assert r['alarms'][0] == 0
+
+
+def test_parse_grid():
+    assert parse_grid('3:5:0.5') == [3.0, 3.5, 4.0, 4.5, 5.0]
+    assert parse_grid('5,8,10') == [5.0, 8.0, 10.0]
@@ -13,6 +13,10 @@ import time
 import numpy as np
 from medical_head_stability import MedicalHeadStabilityAnalyzer
 from medical_configs import get_procedure_config, list_available_procedures
+from medical_metrics import metrics
+from medical_models import models
+from medical_calibration import calibrate
+from medical_capture import source_from_env
 
 def print_header():
     """Imprime cabeçalho do sistema"""
@@ -51,10 +55,10 @@ def test_face_detection():
     test_frame = np.zeros((480, 640, 3), dtype=np.uint8)
     test_frame[100:300, 200:400] = [100, 100, 100]  # Simula região facial
     
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
-    if face_cascade.empty():
-        print("❌ Erro: Classificador facial não carregado")
+    try:
+        models.cascade('frontalface')
+    except ValueError as e:
+        print(f"❌ Erro: Classificador facial não carregado ({e})")
         return False
     
     print("✅ Classificador Haar Cascade carregado")
@@ -72,9 +76,10 @@ def test_medical_analyzer():
         )
         print("✅ Analisador médico inicializado")
         
-        # Testa análise com frame sintético
+        # Testa análise com frame sintético (com e sem timestamp explícito)
         test_frame = np.zeros((480, 640, 3), dtype=np.uint8)
         result = analyzer.analyze_stability(test_frame)
+        result = analyzer.analyze_stability(test_frame, timestamp=analyzer.clock() + 1 / 30)
         
         print(f"✅ Análise de estabilidade funcional")
         return True
@@ -157,22 +162,65 @@ def performance_test():
     try:
         analyzer = MedicalHeadStabilityAnalyzer()
         
-        # Simula 30 frames de teste
-        test_frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+        # Gravação (ESTABILIDADE_SOURCE), lida o mais rápido possível: mede sobre
+        # imagens reais com rosto, sem câmera
+        replay_frames = []
+        source = source_from_env(pace='fast', loop=False)
+        if source is not None:
+            while len(replay_frames) < 30:
+                ok, frame, timestamp = source.read_timestamped()
+                if not ok:
+                    break
+                replay_frames.append((frame, timestamp))
+            source.release()
         
+        # Sem gravação, usa um frame real da câmera (resolução real); sem câmera, frame sintético
+        test_frame = replay_frames[0][0] if replay_frames else None
+        camera_frame = False  # Só um frame lido da câmera permite salvar a calibração
+        if test_frame is None:
+            cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret and frame is not None:
+                    test_frame = frame
+                    camera_frame = True
+            cap.release()
+        if test_frame is None:
+            test_frame = np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+        
+        metrics.reset()
         start_time = time.time()
         
-        for i in range(30):
-            analyzer.analyze_stability(test_frame)
+        if replay_frames:
+            for frame, timestamp in replay_frames:
+                analyzer.analyze_stability(frame, timestamp=timestamp)
+            frames_analyzed = len(replay_frames)
+        else:
+            for i in range(30):
+                analyzer.analyze_stability(test_frame)
+            frames_analyzed = 30
         
         end_time = time.time()
-        fps = 30 / (end_time - start_time)
+        fps = frames_analyzed / (end_time - start_time)
         
         print(f"✅ Performance: {fps:.1f} FPS")
         
+        # Detalhamento por etapa
+        for stage, dados in sorted(metrics.stage_summary().items()):
+            print(f"   • {stage}: {dados['mean_ms']:.2f} ms ({dados['count']} amostras)")
+        
+        # Calibração: escolhe resolução/cadência de detecção e qualidade JPEG
+        # (só é salva quando medida sobre um frame real da câmera)
+        analyzer.reset_analysis()
+        settings = calibrate(analyzer, test_frame, target_fps=30, force=True, save=camera_frame)
+        calibrated_ok = settings['estimated_frame_ms'] <= settings['budget_ms']
+        
         if fps >= 25:
             print("✅ Performance adequada para uso clínico")
             return True
+        elif calibrated_ok:
+            print("✅ Performance adequada com a configuração calibrada")
+            return True
         else:
             print("⚠️ Performance abaixo do ideal")
             return False